@@ -0,0 +1,206 @@
+# backend/app/admission.py
+"""
+Controle de admissão por faixa de custo.
+
+Cada endpoint cai numa faixa (light / medium / heavy, ver
+settings.ADMISSION_TIERS) com limite próprio de concorrência e uma fila
+de espera limitada. Relatórios pesados enchendo a própria faixa não
+ocupam as threads nem as conexões que /health e /metadata/* usam, então
+a latência das consultas baratas fica estável sob carga mista.
+
+Na chegada:
+  - vaga livre → entra;
+  - fila cheia → 429;
+  - espera estimada (posição na fila × tempo médio de serviço da faixa)
+    acima do prazo da faixa → 503 imediato, sem ocupar a fila;
+  - esperou o prazo inteiro sem vaga → 503.
+Todas as recusas levam Retry-After.
+
+A faixa vem de settings.ADMISSION_ENDPOINT_TIERS (fixa) ou do default.
+Com ADMISSION_EXPLAIN_REFINE, os endpoints sem faixa fixa são
+reclassificados pelo custo estimado (EXPLAIN) das consultas que rodam.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from . import queries
+from .budget import endpoint_key
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Tier:
+    def __init__(self, name: str, concurrency: int, queue: int, max_wait_ms: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.max_wait_ms = max_wait_ms
+        self.active = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.service_ms = 50.0          # média móvel do tempo de serviço
+        self.stats = {"admitted": 0, "queued": 0, "shed_full": 0, "shed_deadline": 0}
+
+    def estimated_wait_ms(self) -> float:
+        return self.service_ms * (len(self.waiters) + 1) / self.concurrency
+
+    def _shed(self, status_code: int, detail: str, wait_ms: float) -> HTTPException:
+        retry_after = max(1, math.ceil(wait_ms / 1000))
+        return HTTPException(
+            status_code=status_code,
+            detail={"error": detail, "tier": self.name, "retry_after": retry_after},
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    async def acquire(self):
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return
+
+        if len(self.waiters) >= self.queue:
+            self.stats["shed_full"] += 1
+            raise self._shed(429, "Fila da faixa cheia", self.estimated_wait_ms())
+
+        estimate = self.estimated_wait_ms()
+        if estimate > self.max_wait_ms:
+            self.stats["shed_deadline"] += 1
+            raise self._shed(503, "Espera estimada acima do prazo", estimate)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            # a vaga é repassada por release() (active não muda na troca)
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait_ms / 1000)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # vaga chegou junto com o timeout: usa
+                self.stats["admitted"] += 1
+                return
+            self.waiters.remove(waiter)
+            waiter.cancel()
+            self.stats["shed_deadline"] += 1
+            raise self._shed(503, "Prazo de espera esgotado", self.estimated_wait_ms())
+        except BaseException:
+            # requisição cancelada na fila: devolve a vaga se ela já tinha chegado
+            if waiter.done() and not waiter.cancelled():
+                self.release(None)
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise
+        self.stats["admitted"] += 1
+
+    def release(self, elapsed_ms: Optional[float]):
+        if elapsed_ms is not None:
+            self.service_ms = 0.8 * self.service_ms + 0.2 * elapsed_ms
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "max_wait_ms": self.max_wait_ms,
+            "service_ms": round(self.service_ms, 1),
+        }
+
+
+TIERS: dict[str, Tier] = {
+    name: Tier(name, int(cfg["concurrency"]), int(cfg["queue"]), float(cfg["max_wait_ms"]))
+    for name, cfg in settings.ADMISSION_TIERS.items()
+}
+
+# endpoint → faixa aprendida pelo EXPLAIN (só endpoints sem faixa fixa)
+_learned: dict[str, str] = {}
+_costs: dict[str, float] = {}
+
+
+def tier_for(endpoint: str) -> str:
+    return (
+        settings.ADMISSION_ENDPOINT_TIERS.get(endpoint)
+        or _learned.get(endpoint)
+        or settings.ADMISSION_DEFAULT_TIER
+    )
+
+
+async def admission(request: Request):
+    """Dependência (nível de app): reserva uma vaga da faixa do endpoint"""
+    tier = TIERS.get(tier_for(endpoint_key(request)))
+    if not settings.ADMISSION_ENABLED or tier is None:
+        yield
+        return
+
+    await tier.acquire()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        tier.release((time.perf_counter() - t0) * 1000)
+
+
+# ------------------------------------------------------
+# Refinamento por EXPLAIN
+# ------------------------------------------------------
+def _tier_for_cost(cost: float) -> str:
+    for name, limit in sorted(settings.ADMISSION_COST_TIERS.items(), key=lambda kv: kv[1]):
+        if cost <= limit:
+            return name
+    return "heavy" if "heavy" in TIERS else settings.ADMISSION_DEFAULT_TIER
+
+
+def refine() -> dict[str, str]:
+    """Custo estimado por endpoint = maior custo (EXPLAIN) entre as consultas que ele rodou"""
+    from .db import get_conn, WORKLOAD_ANALYTICS
+
+    samples = queries.endpoint_samples()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        for endpoint, shapes in samples.items():
+            if endpoint in settings.ADMISSION_ENDPOINT_TIERS:
+                continue
+            cost = 0.0
+            for name, params in shapes.items():
+                try:
+                    plan = conn.execute(f"EXPLAIN (FORMAT JSON) {queries.SHAPES[name].sql}", params).fetchone()[0]
+                except Exception as e:
+                    conn.rollback()
+                    logger.warning(f"⚠️ EXPLAIN de {name} falhou: {e}")
+                    continue
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                cost = max(cost, float(plan[0]["Plan"]["Total Cost"]))
+            _costs[endpoint] = cost
+            _learned[endpoint] = _tier_for_cost(cost)
+    return dict(_learned)
+
+
+async def run_refiner():
+    while True:
+        await asyncio.sleep(settings.ADMISSION_REFINE_SECONDS)
+        try:
+            await asyncio.to_thread(refine)
+        except Exception as e:
+            logger.error(f"❌ Falha ao reclassificar endpoints: {e}")
+
+
+def snapshot() -> dict:
+    return {
+        "enabled": settings.ADMISSION_ENABLED,
+        "tiers": {name: t.snapshot() for name, t in TIERS.items()},
+        "learned": {e: {"tier": t, "cost": round(_costs.get(e, 0), 1)} for e, t in _learned.items()},
+    }
@@ -0,0 +1,100 @@
+# backend/app/budget.py
+"""
+Orçamento de tempo por endpoint.
+
+Cada requisição recebe um QueryBudget (dependência do router) com o
+statement_timeout configurado em settings.QUERY_BUDGETS_MS. O get_conn()
+aplica o orçamento com SET LOCAL em toda conexão usada pela requisição e,
+se o cliente desconectar, as queries em andamento são canceladas.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+from typing import Optional
+
+from fastapi import Request
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudget:
+    def __init__(self, endpoint: str, timeout_ms: int):
+        self.endpoint = endpoint
+        self.timeout_ms = timeout_ms
+        self.disconnected = False
+        self._conns: list = []
+        self._lock = threading.Lock()
+
+    def attach(self, conn):
+        """Aplica o statement_timeout (escopo da transação) e registra a conexão"""
+        conn.execute(
+            "SELECT set_config('statement_timeout', %s, true)", [str(self.timeout_ms)]
+        )
+        with self._lock:
+            self._conns.append(conn)
+
+    def detach(self, conn):
+        with self._lock:
+            if conn in self._conns:
+                self._conns.remove(conn)
+
+    def cancel_all(self):
+        """Cancela as queries em andamento (cliente foi embora)"""
+        with self._lock:
+            conns = list(self._conns)
+        for conn in conns:
+            try:
+                conn.cancel_safe()
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao cancelar query de {self.endpoint}: {e}")
+
+
+_current: contextvars.ContextVar[Optional[QueryBudget]] = contextvars.ContextVar(
+    "query_budget", default=None
+)
+
+
+def current_budget() -> Optional[QueryBudget]:
+    return _current.get()
+
+
+def set_budget(budget: Optional[QueryBudget]):
+    """Define o orçamento do contexto atual (tarefas de fundo fora de uma requisição)"""
+    _current.set(budget)
+
+
+def endpoint_key(request: Request) -> str:
+    """Caminho da rota sem o prefixo da API (ex.: /sales/products/margin)"""
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or request.url.path
+    return path.removeprefix(settings.API_PREFIX)
+
+
+def budget_ms(endpoint: str) -> int:
+    return settings.QUERY_BUDGETS_MS.get(endpoint, settings.QUERY_BUDGET_DEFAULT_MS)
+
+
+async def _watch_disconnect(request: Request, budget: QueryBudget):
+    while True:
+        await asyncio.sleep(settings.QUERY_DISCONNECT_POLL_SECONDS)
+        if await request.is_disconnected():
+            budget.disconnected = True
+            logger.info(f"🔌 Cliente desconectou — cancelando queries de {budget.endpoint}")
+            await asyncio.to_thread(budget.cancel_all)
+            return
+
+
+async def query_budget(request: Request):
+    """Dependência (nível de router): cria o orçamento e vigia a desconexão"""
+    key = endpoint_key(request)
+    budget = QueryBudget(key, budget_ms(key))
+    _current.set(budget)
+
+    watcher = asyncio.create_task(_watch_disconnect(request, budget))
+    try:
+        yield budget
+    finally:
+        watcher.cancel()
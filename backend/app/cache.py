@@ -0,0 +1,318 @@
+# backend/app/cache.py
+"""
+Cache de resultados dos endpoints (em memória, por processo).
+
+O decorator @cached guarda o retorno do endpoint pela combinação de
+filtros normalizada (listas ordenadas, defaults do FastAPI resolvidos),
+então uma chamada HTTP e uma chamada direta (ex.: warm-up) com os mesmos
+filtros caem na mesma entrada. Cabeçalhos X-* definidos pelo endpoint
+(ex.: X-Data-As-Of) são guardados junto e reaplicados nos hits.
+
+Cada entrada guarda o escopo que leu (lojas, canais, intervalo de dias);
+o change feed (services/changefeed.py) invalida só as entradas cujo
+escopo cruza as chaves (loja, canal, dia) alteradas. Endpoints que leem
+materialized views (`views=`) também são invalidados a cada refresh
+delas (services/matviews.py) — a venda nova só aparece ali depois dele.
+"""
+
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Iterable, Optional
+
+from fastapi import Response
+from pydantic.fields import FieldInfo
+
+from . import singleflight
+from .settings import settings
+
+
+@dataclass
+class Scope:
+    """Fatia de `sales` que uma resposta leu (None = sem restrição)"""
+    stores: Optional[frozenset] = None
+    channels: Optional[frozenset] = None
+    start: Optional[date] = None
+    end: Optional[date] = None       # inclusivo
+
+    def touches(self, store_id: int, channel_id: int, day: date) -> bool:
+        return (
+            (self.stores is None or store_id in self.stores)
+            and (self.channels is None or channel_id in self.channels)
+            and (self.start is None or day >= self.start)
+            and (self.end is None or day <= self.end)
+        )
+
+
+def _as_set(value: Any) -> Optional[frozenset]:
+    if value is None or value == ():
+        return None
+    return frozenset(value) if isinstance(value, tuple) else frozenset([value])
+
+
+def _as_day(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10]) if value else None
+    except ValueError:
+        return None
+
+
+def default_scope(params: dict) -> Scope:
+    """
+    Escopo a partir dos filtros padrão (store_id, channel_id, start, end).
+    É conservador: `end` conta como inclusivo, channel_name vale por todos
+    os canais e endpoints sem período valem por todo o histórico.
+    """
+    start, end = _as_day(params.get("start")), _as_day(params.get("end"))
+    if not (start and end):
+        start = end = None
+    elif params.get("previous"):
+        start -= end - start
+    return Scope(
+        stores=_as_set(params.get("store_id")),
+        channels=None if params.get("channel_name") else _as_set(params.get("channel_id")),
+        start=start,
+        end=end,
+    )
+
+
+def previous_period_scope(params: dict) -> Scope:
+    """Endpoints que sempre comparam com o período anterior (mesma duração)"""
+    scope = default_scope(params)
+    if scope.start and scope.end:
+        scope.start -= scope.end - scope.start
+    return scope
+
+
+def all_days_scope(params: dict) -> Scope:
+    """Endpoints cujo resultado depende de vendas fora do período pedido (ex.: retenção das coortes)"""
+    scope = default_scope(params)
+    scope.start = scope.end = None
+    return scope
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    headers: dict[str, str]
+    expires_at: float
+    params: dict[str, Any]       # filtros normalizados
+    scope: Optional[Scope]       # None = não depende de `sales`
+
+
+_entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+_generation = 0     # muda a cada invalidação (resultados em voo não são guardados)
+_view_endpoints: dict[str, set[str]] = {}   # materialized view → endpoints (@cached(views=...))
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted(value))
+    return value
+
+
+def _call_values(sig: inspect.Signature, args: tuple, kwargs: dict) -> dict:
+    """Argumentos efetivos da chamada; Query(None) etc. viram o valor default"""
+    bound = sig.bind_partial(*args, **kwargs)
+    values = {}
+    for name, param in sig.parameters.items():
+        if name in bound.arguments:
+            value = bound.arguments[name]
+        else:
+            value = param.default
+        if isinstance(value, FieldInfo):
+            value = value.default
+        elif value is inspect.Parameter.empty:
+            value = None
+        values[name] = value
+    return values
+
+
+def _get(key: tuple) -> Optional[CacheEntry]:
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _stats["misses"] += 1
+            return None
+        if entry.expires_at < time.monotonic():
+            del _entries[key]
+            _stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        return entry
+
+
+def _put(key: tuple, entry: CacheEntry):
+    with _lock:
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        while len(_entries) > settings.CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+
+def cached(
+    ttl: Optional[float] = None,
+    scope: Optional[Callable[[dict], Scope]] = default_scope,
+    views: tuple[str, ...] = (),
+):
+    """
+    Cacheia o retorno de um endpoint (síncrono ou async; usar abaixo do @router.get).
+    Misses concorrentes com os mesmos filtros são coalescidos (app/singleflight.py).
+    `scope` deriva dos filtros a fatia de vendas lida; None para endpoints
+    que não dependem de `sales` (não são invalidados pelo change feed).
+    `views`: materialized views lidas; o refresh de uma delas invalida o endpoint.
+    """
+
+    def decorator(fn: Callable):
+        for view in views:
+            _view_endpoints.setdefault(view, set()).add(fn.__name__)
+        sig = inspect.signature(fn)
+        response_params = [
+            name for name, p in sig.parameters.items() if p.annotation is Response
+        ]
+
+        def prepare(args, kwargs):
+            values = _call_values(sig, args, kwargs)
+            params = {
+                name: _freeze(value)
+                for name, value in values.items()
+                if name not in response_params
+            }
+            key = (fn.__name__, tuple(sorted(params.items())))
+            # chamada direta (sem FastAPI): Response descartável para capturar cabeçalhos
+            for name in response_params:
+                if values[name] is None:
+                    values[name] = Response()
+            return values, params, key
+
+        def store(key, params, values, result, generation) -> dict:
+            headers = {}
+            for name in response_params:
+                headers.update(
+                    (k, v) for k, v in values[name].headers.items() if k.lower().startswith("x-")
+                )
+            # invalidado durante a consulta: o resultado pode já estar velho
+            if settings.CACHE_ENABLED and generation == _generation:
+                _put(key, CacheEntry(
+                    value=result,
+                    headers=headers,
+                    expires_at=time.monotonic() + (ttl if ttl is not None else settings.CACHE_TTL_SECONDS),
+                    params=params,
+                    scope=scope(params) if scope is not None else None,
+                ))
+            return headers
+
+        def replay(values, headers):
+            for name in response_params:
+                values[name].headers.update(headers)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                values, params, key = prepare(args, kwargs)
+                entry = _get(key) if settings.CACHE_ENABLED else None
+                if entry is not None:
+                    replay(values, entry.headers)
+                    return entry.value
+
+                generation = _generation
+
+                async def load():
+                    result = await fn(**values)
+                    return result, store(key, params, values, result, generation)
+
+                result, headers = await singleflight.do_async(key + (generation,), load)
+                replay(values, headers)
+                return result
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            values, params, key = prepare(args, kwargs)
+            entry = _get(key) if settings.CACHE_ENABLED else None
+            if entry is not None:
+                replay(values, entry.headers)
+                return entry.value
+
+            generation = _generation
+
+            def load():
+                result = fn(**values)
+                return result, store(key, params, values, result, generation)
+
+            # misses concorrentes com os mesmos filtros: uma consulta só
+            result, headers = singleflight.do(key + (generation,), load)
+            replay(values, headers)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _bump():
+    global _generation
+    _generation += 1
+
+
+def invalidate(endpoint: Optional[str] = None) -> int:
+    """Remove as entradas de um endpoint (nome da função) ou todas"""
+    with _lock:
+        _bump()
+        keys = [k for k in _entries if endpoint is None or k[0] == endpoint]
+        for k in keys:
+            del _entries[k]
+        _stats["invalidations"] += len(keys)
+    return len(keys)
+
+
+def invalidate_keys(keys: Iterable[tuple[int, int, date]]) -> int:
+    """Remove as entradas cujo escopo cruza alguma chave (loja, canal, dia)"""
+    keys = list(keys)
+    with _lock:
+        _bump()
+        stale = [
+            k for k, entry in _entries.items()
+            if entry.scope is not None
+            and any(entry.scope.touches(*key) for key in keys)
+        ]
+        for k in stale:
+            del _entries[k]
+        _stats["invalidations"] += len(stale)
+    return len(stale)
+
+
+def on_view_refresh(view: str) -> int:
+    """Chamado depois do REFRESH de uma materialized view: entradas antigas dos endpoints que a leem"""
+    return sum(invalidate(endpoint) for endpoint in sorted(_view_endpoints.get(view, ())))
+
+
+def on_sales_change(event):
+    """Assinante do change feed: invalidação precisa por (loja, canal, dia)"""
+    if event.resync:
+        invalidate()
+    else:
+        invalidate_keys(event.keys)
+
+
+def stats() -> dict:
+    with _lock:
+        by_endpoint: dict[str, int] = {}
+        for name, _ in _entries:
+            by_endpoint[name] = by_endpoint.get(name, 0) + 1
+        total = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "hit_ratio": round(_stats["hits"] / total, 3) if total else None,
+            "by_endpoint": by_endpoint,
+        }
@@ -0,0 +1,368 @@
+# backend/app/compute.py
+"""
+Pool de processos para etapas de CPU em Python (pós-processamento).
+
+As consultas rodam no banco, mas estatística, previsão e mineração de
+cestas são Python puro e disputam o GIL com o threadpool que atende as
+requisições. Funções marcadas com @offloadable rodam num
+ProcessPoolExecutor iniciado com a API (todos os núcleos); o endpoint
+síncrono só espera o resultado na sua thread, sem segurar o event loop.
+
+  - Arrays NumPy de pelo menos COMPUTE_SHARED_MIN_BYTES vão por memória
+    compartilhada: o worker lê o buffer direto, sem pickle (o retorno
+    segue o mesmo caminho). O resto dos argumentos vai por pickle.
+  - Cada tarefa tem prazo (COMPUTE_TIMEOUT_SECONDS ou o do decorator),
+    contado a partir de quando um worker a pega (o worker marca o início
+    num segmento compartilhado de 8 bytes): o worker se interrompe com
+    SIGALRM e o chamador recebe ComputeTimeout (503). Só um worker que
+    passou do prazo e não volta nem depois da folga faz o pool ser morto e
+    recriado; tarefa que espera na fila mais que COMPUTE_QUEUE_TIMEOUT_SECONDS
+    desiste com 503 sem derrubar ninguém. Tarefas que estavam em outros
+    workers de um pool recriado são reenviadas uma vez (depois, 503).
+  - Etapas com custo estimado (`cost` do decorator; padrão = elementos dos
+    arrays / itens das listas) abaixo de min_items rodam na própria thread:
+    o envio custaria mais que o cálculo. Sem pool (COMPUTE_ENABLED=false,
+    CLI, dentro de um worker) também.
+
+As funções precisam ser de nível de módulo (o worker as importa pelo nome).
+"""
+
+import concurrent.futures
+import functools
+import importlib
+import logging
+import multiprocessing
+import signal
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ComputeTimeout(Exception):
+    """Tarefa do pool passou do prazo"""
+
+
+class ComputeUnavailable(Exception):
+    """Pool de processos caiu (e não voltou) durante a tarefa"""
+
+
+_executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+_lock = threading.Lock()
+_in_worker = False
+_modules: set[str] = set()          # módulos com @offloadable (pré-carregados nos workers)
+_stats = {
+    "submitted": 0,
+    "inline": 0,
+    "completed": 0,
+    "errors": 0,
+    "timeouts": 0,
+    "queue_timeouts": 0,
+    "retries": 0,
+    "restarts": 0,
+    "shared_bytes": 0,
+    "busy_ms": 0.0,
+}
+
+
+# ------------------------------------------------------
+# Memória compartilhada
+# ------------------------------------------------------
+@dataclass(frozen=True)
+class _Shared:
+    name: str
+    shape: tuple
+    dtype: str
+
+
+# arrays são procurados só no topo e um nível abaixo (argumento dict/tupla/lista
+# de arrays); listas grandes de linhas não são percorridas item a item
+_DEPTH = 2
+
+
+def _walk(value: Any, leaf: Callable, depth: int = _DEPTH) -> Any:
+    if depth > 0:
+        if isinstance(value, tuple):
+            return tuple(_walk(v, leaf, depth - 1) for v in value)
+        if isinstance(value, list):
+            return [_walk(v, leaf, depth - 1) for v in value]
+        if isinstance(value, dict):
+            return {k: _walk(v, leaf, depth - 1) for k, v in value.items()}
+    return leaf(value)
+
+
+def _share(value: Any, segments: list) -> Any:
+    """Troca arrays grandes por referências a segmentos de memória compartilhada"""
+
+    def leaf(v):
+        if isinstance(v, np.ndarray) and v.nbytes >= settings.COMPUTE_SHARED_MIN_BYTES and v.dtype != object:
+            shm = shared_memory.SharedMemory(create=True, size=max(v.nbytes, 1))
+            segments.append(shm)
+            np.ndarray(v.shape, v.dtype, buffer=shm.buf)[...] = v
+            _stats["shared_bytes"] += v.nbytes
+            return _Shared(shm.name, v.shape, v.dtype.str)
+        return v
+
+    return _walk(value, leaf)
+
+
+def _attach(value: Any, segments: list) -> Any:
+    """Referências → arrays sobre o segmento (sem cópia)"""
+
+    def leaf(v):
+        if isinstance(v, _Shared):
+            shm = shared_memory.SharedMemory(name=v.name)
+            segments.append(shm)
+            return np.ndarray(v.shape, np.dtype(v.dtype), buffer=shm.buf)
+        return v
+
+    return _walk(value, leaf)
+
+
+def _copy_out(value: Any) -> Any:
+    """Arrays apoiados em segmentos viram cópias próprias (antes de fechar o segmento)"""
+    return _walk(value, lambda v: np.array(v, copy=True) if isinstance(v, np.ndarray) else v)
+
+
+def _release(segments: list, unlink: bool):
+    for shm in segments:
+        try:
+            shm.close()
+            if unlink:
+                shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+
+
+# ------------------------------------------------------
+# Lado do worker
+# ------------------------------------------------------
+def _on_alarm(signum, frame):
+    raise ComputeTimeout("Prazo da tarefa esgotado no worker")
+
+
+def _init_worker(modules: list[str]):
+    global _in_worker
+    _in_worker = True
+    signal.signal(signal.SIGINT, signal.SIG_IGN)     # Ctrl+C é tratado pelo processo da API
+    signal.signal(signal.SIGALRM, _on_alarm)
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _invoke(module: str, qualname: str, args: tuple, kwargs: dict, timeout: float, stamp: str):
+    fn = getattr(importlib.import_module(module), qualname).__wrapped__
+    inputs: list = []
+    outputs: list = []
+    started = shared_memory.SharedMemory(name=stamp)
+    struct.pack_into("d", started.buf, 0, time.time())       # o prazo do chamador começa aqui
+    started.close()
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = fn(*_attach(args, inputs), **_attach(kwargs, inputs))
+        result = _copy_out(result)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        _release(inputs, unlink=False)
+    shared = _share(result, outputs)
+    _release(outputs, unlink=False)          # o processo da API lê e apaga
+    return shared
+
+
+# ------------------------------------------------------
+# Lado da API
+# ------------------------------------------------------
+def start():
+    """Cria o pool e já sobe os workers (chamado no startup da API)"""
+    global _executor
+    if not settings.COMPUTE_ENABLED:
+        return
+    with _lock:
+        if _executor is not None:
+            return
+        workers = settings.COMPUTE_WORKERS or multiprocessing.cpu_count()
+        _executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(settings.COMPUTE_START_METHOD),
+            initializer=_init_worker,
+            initargs=(sorted(_modules),),
+        )
+        executor = _executor
+    # primeira tarefa de cada worker não paga o import
+    try:
+        for f in [executor.submit(time.sleep, 0) for _ in range(workers)]:
+            f.result()
+    except Exception:
+        # workers não sobem (ex.: script sem `if __name__ == "__main__"`): tudo roda inline
+        with _lock:
+            if _executor is executor:
+                _executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    logger.info(f"🧵 Pool de processos com {workers} workers")
+
+
+def stop():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _restart(executor: concurrent.futures.ProcessPoolExecutor):
+    """Mata os workers de um pool travado e sobe outro"""
+    global _executor
+    with _lock:
+        if _executor is not executor:
+            return
+        _executor = None
+        _stats["restarts"] += 1
+    for process in list(getattr(executor, "_processes", {}).values()):
+        process.kill()
+    executor.shutdown(wait=False, cancel_futures=True)
+    logger.warning("⚠️ Worker travado: pool de processos recriado")
+    try:
+        start()
+    except Exception as e:
+        logger.error(f"❌ Pool de processos não voltou (etapas rodam inline): {e}")
+
+
+def _size(args: tuple, kwargs: dict) -> int:
+    """Custo padrão: elementos dos arrays (todas as dimensões) e itens das listas"""
+    return sum(
+        v.size if isinstance(v, np.ndarray) else len(v)
+        for v in (*args, *kwargs.values())
+        if hasattr(v, "__len__") and not isinstance(v, (str, bytes, dict))
+    )
+
+
+# intervalo de checagem enquanto a tarefa espera na fila
+_POLL_SECONDS = 0.05
+
+
+def _wait(executor: concurrent.futures.ProcessPoolExecutor, fn: Callable, args: tuple, kwargs: dict,
+          timeout: float):
+    """Envia a tarefa e espera; o prazo só corre depois que um worker a pega"""
+    segments: list = []
+    stamp = shared_memory.SharedMemory(create=True, size=8)
+    struct.pack_into("d", stamp.buf, 0, 0.0)
+    try:
+        future = executor.submit(
+            _invoke, fn.__module__, fn.__qualname__,
+            _share(args, segments), _share(kwargs, segments), timeout, stamp.name,
+        )
+        _stats["submitted"] += 1
+        queued = time.monotonic()
+        while True:
+            started = struct.unpack_from("d", stamp.buf, 0)[0]
+            if started:
+                wait = started + timeout + settings.COMPUTE_KILL_GRACE_SECONDS - time.time()
+                if wait <= 0:
+                    _stats["timeouts"] += 1
+                    _restart(executor)
+                    raise ComputeTimeout(f"{fn.__qualname__}: worker não respondeu em {timeout}s")
+            elif time.monotonic() - queued > settings.COMPUTE_QUEUE_TIMEOUT_SECONDS:
+                future.cancel()
+                _stats["queue_timeouts"] += 1
+                raise ComputeTimeout(f"{fn.__qualname__}: nenhum worker livre em {settings.COMPUTE_QUEUE_TIMEOUT_SECONDS}s")
+            else:
+                wait = _POLL_SECONDS
+            try:
+                return future.result(timeout=wait)
+            except concurrent.futures.TimeoutError:
+                continue
+            except ComputeTimeout:                          # SIGALRM no worker
+                _stats["timeouts"] += 1
+                raise
+    finally:
+        _release([*segments, stamp], unlink=True)
+
+
+def run(fn: Callable, *args, timeout: Optional[float] = None, min_items: int = 0,
+        cost: Optional[Callable] = None, **kwargs):
+    """Executa fn (decorada com @offloadable) no pool, ou inline quando não compensa"""
+    executor = _executor
+    inline = getattr(fn, "__wrapped__", fn)
+    size = cost(*args, **kwargs) if cost is not None else _size(args, kwargs)
+    if executor is None or _in_worker or size < min_items:
+        _stats["inline"] += 1
+        return inline(*args, **kwargs)
+
+    timeout = timeout if timeout is not None else settings.COMPUTE_TIMEOUT_SECONDS
+    t0 = time.perf_counter()
+    try:
+        for attempt in range(2):
+            try:
+                shared = _wait(executor, fn, args, kwargs, timeout)
+                break
+            except ComputeTimeout:
+                raise
+            except concurrent.futures.process.BrokenProcessPool:
+                # outro worker travou (ou morreu) e levou o pool junto: reenvia uma vez
+                _stats["errors"] += 1
+                _restart(executor)
+                executor = _executor
+                if attempt or executor is None:
+                    raise ComputeUnavailable(f"{fn.__qualname__}: pool de processos indisponível")
+                _stats["retries"] += 1
+            except Exception:
+                _stats["errors"] += 1
+                raise
+    finally:
+        _stats["busy_ms"] += (time.perf_counter() - t0) * 1000
+
+    outputs: list = []
+    try:
+        result = _copy_out(_attach(shared, outputs))
+    finally:
+        _release(outputs, unlink=True)
+    _stats["completed"] += 1
+    return result
+
+
+def offloadable(timeout: Optional[float] = None, min_items: Optional[int] = None,
+                cost: Optional[Callable] = None):
+    """
+    Marca uma etapa de CPU para rodar no pool. `cost(*args, **kwargs)`
+    estima o trabalho (default: elementos dos arrays / itens das listas);
+    abaixo de `min_items` (default COMPUTE_MIN_ITEMS) a etapa roda inline.
+    """
+
+    def decorator(fn: Callable):
+        _modules.add(fn.__module__)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return run(
+                wrapper, *args,
+                timeout=timeout,
+                min_items=settings.COMPUTE_MIN_ITEMS if min_items is None else min_items,
+                cost=cost,
+                **kwargs,
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot() -> dict:
+    executor = _executor
+    return {
+        "enabled": settings.COMPUTE_ENABLED,
+        "running": executor is not None,
+        "workers": len(getattr(executor, "_processes", None) or {}) if executor else 0,
+        "pending": len(getattr(executor, "_pending_work_items", None) or {}) if executor else 0,
+        **_stats,
+        "busy_ms": round(_stats["busy_ms"], 1),
+        "modules": sorted(_modules),
+    }
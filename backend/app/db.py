@@ -1,49 +1,262 @@
 # backend/app/db.py
 
-from psycopg_pool import ConnectionPool
-from .settings import settings
+import itertools
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import psycopg
+from psycopg_pool import ConnectionPool, PoolTimeout
+from .settings import settings
+from .budget import current_budget
+from . import queries
 
 logger = logging.getLogger(__name__)
 
+# ------------------------------------------------------
+# Classes de carga (cada endpoint declara a sua)
+#   primary   → escritas e leituras que precisam do dado mais recente
+#   read      → consultas leves (metadata, health) → réplicas, com fallback
+#   analytics → varreduras pesadas (/sales/*) → pool separado e pequeno
+# ------------------------------------------------------
+WORKLOAD_PRIMARY = "primary"
+WORKLOAD_READ = "read"
+WORKLOAD_ANALYTICS = "analytics"
+
+# pool principal (mantido para compatibilidade com código antigo)
 pool: ConnectionPool | None = None
 
+# pools nomeados: "primary", "replica-0", "replica-1", ..., "analytics"
+pools: dict[str, ConnectionPool] = {}
+pool_hosts: dict[str, str] = {}
+
+_replicas: list[str] = []
+_round_robin = itertools.count()
+_lag_cache: dict[str, tuple[float, float]] = {}  # nome → (verificado_em, lag_segundos)
+_init_lock = threading.Lock()
 
-def init_pool():
-    """Inicializa o pool de conexões do PostgreSQL"""
-    global pool
-    if pool is not None:
-        return
 
-    conninfo = (
+def _split_host(hostport: str) -> tuple[str, int]:
+    host, _, port = hostport.strip().partition(":")
+    return host, int(port or settings.DB_PORT)
+
+
+def _conninfo(host: str, port: int) -> str:
+    return (
         f"postgresql://{settings.DB_USER}:{settings.DB_PASSWORD}"
-        f"@{settings.DB_HOST.strip()}:{settings.DB_PORT}/{settings.DB_NAME}"
+        f"@{host.strip()}:{port}/{settings.DB_NAME}"
     )
 
-    logger.info(f"🔌 Iniciando conexão com o banco: {conninfo}")
 
+def connect_primary(**kwargs) -> psycopg.Connection:
+    """Conexão avulsa no primário, fora dos pools (ex.: LISTEN do change feed)"""
+    return psycopg.connect(_conninfo(settings.DB_HOST, settings.DB_PORT), **kwargs)
+
+
+def _configure(conn: psycopg.Connection):
+    # cada conexão nova comporta o registro de shapes inteiro preparado
+    queries.configure(conn)
+
+
+def _create_pool(name: str, host: str, port: int, max_size: int) -> ConnectionPool:
+    logger.info(f"🔌 Iniciando pool '{name}' em {host}:{port} (max={max_size})")
     try:
-        pool = ConnectionPool(
-            conninfo=conninfo,
+        p = ConnectionPool(
+            conninfo=_conninfo(host, port),
+            name=name,
             min_size=1,
-            max_size=10,
-            timeout=10,
+            max_size=max_size,
+            timeout=settings.DB_POOL_TIMEOUT,
+            configure=_configure,
         )
-        logger.info("✅ Pool de conexão inicializado com sucesso")
     except Exception as e:
-        logger.error("❌ Erro ao criar pool de conexão com PostgreSQL")
+        logger.error(f"❌ Erro ao criar pool '{name}' com PostgreSQL")
         logger.error(str(e))
         raise
 
+    pools[name] = p
+    pool_hosts[name] = f"{host}:{port}"
+    return p
+
+
+def init_pool():
+    """Inicializa os pools de conexão (primário, réplicas e analytics)"""
+    global pool
+    with _init_lock:
+        if pool is not None:
+            return
+
+        pool = _create_pool(
+            "primary", settings.DB_HOST, settings.DB_PORT, settings.DB_POOL_MAX_SIZE
+        )
+
+        for i, hostport in enumerate(settings.DB_REPLICA_HOSTS):
+            host, port = _split_host(hostport)
+            name = f"replica-{i}"
+            _create_pool(name, host, port, settings.DB_REPLICA_POOL_MAX_SIZE)
+            _replicas.append(name)
+
+        # analytics: host dedicado > primeira réplica > primário
+        if settings.DB_ANALYTICS_HOST:
+            host, port = _split_host(settings.DB_ANALYTICS_HOST)
+        elif settings.DB_REPLICA_HOSTS:
+            host, port = _split_host(settings.DB_REPLICA_HOSTS[0])
+        else:
+            host, port = settings.DB_HOST, settings.DB_PORT
+        _create_pool(WORKLOAD_ANALYTICS, host, port, settings.DB_ANALYTICS_POOL_MAX_SIZE)
+
+        logger.info(f"✅ Pools de conexão inicializados: {', '.join(pools)}")
+
+
+def close_pools():
+    """Fecha todos os pools (shutdown)"""
+    global pool
+    with _init_lock:
+        for p in pools.values():
+            p.close()
+        pools.clear()
+        pool_hosts.clear()
+        _replicas.clear()
+        _lag_cache.clear()
+        pool = None
 
-def get_conn():
-    """Retorna uma conexão ativa do pool"""
+
+# ------------------------------------------------------
+# Lag de réplica
+# ------------------------------------------------------
+_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_lag(name: str) -> Optional[float]:
+    """
+    Lag de replicação em segundos (cacheado por DB_REPLICA_LAG_CHECK_SECONDS).
+    Retorna None se o host não respondeu ou se o pool está saturado e ainda
+    não há medição (réplica tratada como não saudável).
+    """
+    now = time.monotonic()
+    cached = _lag_cache.get(name)
+    if cached and now - cached[0] < settings.DB_REPLICA_LAG_CHECK_SECONDS:
+        return cached[1]
+
+    lag: Optional[float]
+    try:
+        with pools[name].connection(timeout=1) as conn:
+            lag = float(conn.execute(_LAG_SQL).fetchone()[0])
+    except PoolTimeout:
+        # pool saturado não é lag: mantém a última medição; sem ela, não arrisca
+        return cached[1] if cached else None
+    except Exception as e:
+        logger.warning(f"⚠️ Falha ao medir lag de '{name}': {e}")
+        lag = None
+
+    _lag_cache[name] = (now, lag if lag is not None else float("inf"))
+    return lag
+
+
+def _is_healthy(name: str) -> bool:
+    if name == "primary" or pool_hosts.get(name) == pool_hosts.get("primary"):
+        return True
+    lag = replica_lag(name)
+    return lag is not None and lag <= settings.DB_REPLICA_MAX_LAG_SECONDS
+
+
+def _pick_replica() -> str:
+    """Round-robin entre réplicas saudáveis, preferindo as menos ocupadas"""
+    if not _replicas:
+        return "primary"
+
+    start = next(_round_robin)
+    ordered = [_replicas[(start + i) % len(_replicas)] for i in range(len(_replicas))]
+    healthy = [name for name in ordered if _is_healthy(name)]
+    if not healthy:
+        logger.warning("⚠️ Nenhuma réplica saudável — usando o primário")
+        return "primary"
+
+    # desempate por fila de espera (requests_waiting) mantendo a ordem do round-robin
+    return min(healthy, key=lambda n: pools[n].get_stats().get("requests_waiting", 0))
+
+
+def _pool_for(workload: str) -> ConnectionPool:
+    if workload == WORKLOAD_READ:
+        return pools[_pick_replica()]
+
+    if workload == WORKLOAD_ANALYTICS:
+        if _is_healthy(WORKLOAD_ANALYTICS):
+            return pools[WORKLOAD_ANALYTICS]
+        # réplica de analytics atrasada: usa um pool pequeno no primário,
+        # com o mesmo limite, para não competir com as consultas leves
+        if "analytics-primary" not in pools:
+            with _init_lock:
+                if "analytics-primary" not in pools:
+                    _create_pool(
+                        "analytics-primary",
+                        settings.DB_HOST,
+                        settings.DB_PORT,
+                        settings.DB_ANALYTICS_POOL_MAX_SIZE,
+                    )
+        return pools["analytics-primary"]
+
+    return pools["primary"]
+
+
+@contextmanager
+def get_conn(workload: str = WORKLOAD_PRIMARY):
+    """
+    Retorna uma conexão ativa do pool adequado à classe de carga.
+    Se a requisição tiver orçamento (app/budget.py), aplica o statement_timeout.
+    """
     if pool is None:
         init_pool()
 
     try:
-        return pool.connection()
+        target = _pool_for(workload)
     except Exception as e:
-        logger.error("❌ Erro ao obter conexão do pool")
+        logger.error(f"❌ Erro ao obter conexão do pool ({workload})")
         logger.error(str(e))
         raise
+
+    budget = current_budget()
+    with target.connection() as conn:
+        if budget is not None:
+            budget.attach(conn)
+        try:
+            yield conn
+        finally:
+            if budget is not None:
+                budget.detach(conn)
+
+
+def _lag_for_report(name: str) -> Optional[float]:
+    lag = _lag_cache.get(name, (0, None))[1]
+    if lag is None or lag == float("inf"):
+        return None
+    return round(lag, 2)
+
+
+def pool_stats() -> dict[str, dict]:
+    """Saturação por pool (para /health/pools)"""
+    out = {}
+    for name, p in list(pools.items()):
+        stats = p.get_stats()
+        size = stats.get("pool_size", 0)
+        available = stats.get("pool_available", 0)
+        in_use = size - available
+        out[name] = {
+            "host": pool_hosts.get(name),
+            "max_size": p.max_size,
+            "size": size,
+            "in_use": in_use,
+            "available": available,
+            "waiting": stats.get("requests_waiting", 0),
+            "saturation": round(in_use / p.max_size, 2) if p.max_size else 0,
+            "lag_seconds": _lag_for_report(name),
+        }
+    return out
@@ -647,7 +647,7 @@ def insert_sales_batch(cursor, sales_batch, items, option_groups):
 
 
 def create_indexes(conn):
-    """Create performance indexes"""
+    """Create performance indexes (evaluate others with `python -m app.services.index_advisor`)"""
     print("Creating indexes...")
     cursor = conn.cursor()
     
@@ -657,15 +657,18 @@ def create_indexes(conn):
         "CREATE INDEX IF NOT EXISTS idx_product_sales_product_sale ON product_sales(product_id, sale_id)",
     ]
     
+    failed = 0
     for idx in indexes:
+        # one transaction per index: a failure must not abort the others
         try:
             cursor.execute(idx)
-        except:
-            pass
-    
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            failed += 1
+            print(f"⚠️ Index failed: {idx}\n   {e}")
     
-    conn.commit()
-    print("✓ Indexes created")
+    print(f"✓ Indexes created ({len(indexes) - failed}/{len(indexes)})")
 
 
 def main():
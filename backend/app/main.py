@@ -1,9 +1,17 @@
 # backend/app/main.py
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from .settings import settings
-from .db import init_pool
-from .routers import sales, metadata, insights 
+from .db import init_pool, close_pools, pool_stats, get_conn, WORKLOAD_PRIMARY
+from .budget import query_budget, endpoint_key, budget_ms
+from .admission import admission, run_refiner
+from .responses import DefaultJSONResponse, response_format
+from . import compute
+from psycopg.errors import QueryCanceled
+from psycopg_pool import PoolTimeout
+from .routers import sales, metadata, insights, debug, ingest, query
+from .services import matviews, warmup, rollups, changefeed, exporter, forecast
 from fastapi.responses import JSONResponse
 from fastapi.requests import Request
 
@@ -13,6 +21,10 @@ def create_app() -> FastAPI:
         title=settings.APP_NAME,
         version="0.1.0",
         description="🚀 Analytics Foodservice Backend API",
+        # JSON via orjson; formato colunar/arrow negociado por rota (app/responses.py)
+        default_response_class=DefaultJSONResponse,
+        # toda rota passa pelo controle de admissão da sua faixa (app/admission.py)
+        dependencies=[Depends(admission), Depends(response_format)],
     )
 
     # CORS (permite o frontend acessar a API)
@@ -22,6 +34,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Data-As-Of", "X-Approximate", "X-Watermark", "X-Forecast-Through"],
     )
 
     # Conexão com banco no startup
@@ -30,16 +43,120 @@ def create_app() -> FastAPI:
         init_pool()
         print("✅ PostgreSQL connection pool initialized")
 
+        try:
+            rollups.ensure_rollups()
+        except Exception as e:
+            print("⚠️ Rollups indisponíveis:", e)
+
+        # marca sales_bucket_versions (delta sync) mesmo sem o change feed
+        try:
+            changefeed.ensure_trigger()
+        except Exception as e:
+            print("⚠️ Trigger de vendas indisponível:", e)
+
+        if settings.MATVIEWS_ENABLED:
+            try:
+                matviews.ensure_views()
+            except Exception as e:
+                print("⚠️ Materialized views indisponíveis:", e)
+
+        if settings.CHANGEFEED_ENABLED:
+            try:
+                changefeed.install_default_subscribers()
+                changefeed.start()
+            except Exception as e:
+                print("⚠️ Change feed indisponível:", e)
+
+        try:
+            compute.start()
+        except Exception as e:
+            print("⚠️ Pool de processos indisponível (etapas de CPU rodam inline):", e)
+
+    # Tarefas de fundo (asyncio) que vivem junto com a API
+    @app.on_event("startup")
+    async def start_background_tasks():
+        app.state.background_tasks = []
+        if settings.MATVIEWS_ENABLED:
+            app.state.background_tasks.append(asyncio.create_task(matviews.run_scheduler()))
+        # warm-up roda depois do startup, sem segurar a API (ver /health/warmup)
+        app.state.background_tasks.append(asyncio.create_task(warmup.run_warmup(app.routes)))
+        if settings.ADMISSION_ENABLED and settings.ADMISSION_EXPLAIN_REFINE:
+            app.state.background_tasks.append(asyncio.create_task(run_refiner()))
+        if settings.EXPORT_ENABLED:
+            app.state.background_tasks.append(asyncio.create_task(exporter.run_exporter()))
+        # modelo de previsão ajustado fora das requisições (services/forecast.py)
+        app.state.background_tasks.append(asyncio.create_task(forecast.run_refresher()))
+
+    @app.on_event("shutdown")
+    async def stop_background_tasks():
+        for task in getattr(app.state, "background_tasks", []):
+            task.cancel()
+
+    @app.on_event("shutdown")
+    def on_shutdown():
+        changefeed.stop()
+        compute.stop()
+        close_pools()
+
     # Endpoint básico para teste
     @app.get("/health")
     def health():
         return {"status": "ok", "message": "API running"}
 
+    # Saturação e lag por pool (primário, réplicas, analytics)
+    @app.get("/health/pools")
+    def health_pools():
+        return pool_stats()
+
+    # Readiness (para o load balancer): banco respondendo e, se exigido, warm-up concluído
+    @app.get("/health/ready")
+    def health_ready():
+        try:
+            with get_conn(WORKLOAD_PRIMARY) as conn:
+                conn.execute("SELECT 1")
+        except Exception as e:
+            return JSONResponse(status_code=503, content={"ready": False, "reason": str(e)})
+
+        if settings.WARMUP_REQUIRED_FOR_READY and not warmup.is_warm():
+            return JSONResponse(
+                status_code=503,
+                content={"ready": False, "reason": "warm-up em andamento", "warmup": warmup.progress["status"]},
+            )
+        return {"ready": True, "warm": warmup.is_warm()}
+
+    # Progresso do warm-up (separado da readiness)
+    @app.get("/health/warmup")
+    def health_warmup():
+        return warmup.progress
+
     # Registro das rotas
-    app.include_router(sales.router, prefix=settings.API_PREFIX)
-    app.include_router(metadata.router, prefix=settings.API_PREFIX)
+    # cada requisição de dados recebe um orçamento de tempo (app/budget.py)
+    budgeted = [Depends(query_budget)]
+    app.include_router(sales.router, prefix=settings.API_PREFIX, dependencies=budgeted)
+    app.include_router(metadata.router, prefix=settings.API_PREFIX, dependencies=budgeted)
+    app.include_router(ingest.router, prefix=settings.API_PREFIX, dependencies=budgeted)
+    app.include_router(query.router, prefix=settings.API_PREFIX, dependencies=budgeted)
     app.include_router(insights.router, prefix=settings.API_PREFIX)
+    app.include_router(debug.router, prefix=settings.API_PREFIX)
 
+    # Orçamento estourado (statement_timeout), pool sem conexão livre ou etapa de CPU fora do prazo / sem pool → 503
+    @app.exception_handler(QueryCanceled)
+    @app.exception_handler(PoolTimeout)
+    @app.exception_handler(compute.ComputeTimeout)
+    @app.exception_handler(compute.ComputeUnavailable)
+    async def budget_exceeded_handler(request: Request, exc: Exception):
+        endpoint = endpoint_key(request)
+        retry_after = settings.QUERY_RETRY_AFTER_SECONDS
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(retry_after)},
+            content={
+                "error": "Consulta excedeu o orçamento de tempo ou o pool está saturado. Tente novamente.",
+                "endpoint": endpoint,
+                "budget_ms": budget_ms(endpoint),
+                "retry_after": retry_after,
+            },
+        )
 
     @app.exception_handler(Exception)
     async def generic_exception_handler(request: Request, exc: Exception):
@@ -0,0 +1,242 @@
+# backend/app/queries.py
+"""
+Registro de consultas.
+
+Cada endpoint registra suas consultas como "shapes" fixos e parametrizados
+(filtros opcionais viram sentinelas: NULL para datas e array vazio para
+listas), então o texto do SQL nunca varia por requisição. Isso permite
+preparar cada shape no servidor uma vez por conexão do pool (prepare=True
+do psycopg) e tirar o planejamento do caminho quente.
+"""
+
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Iterable, Optional
+
+from . import slowlog
+from .budget import current_budget
+from .deps import parse_date
+from .settings import settings
+
+
+@dataclass
+class QueryShape:
+    name: str
+    sql: str
+    calls: int = 0
+    prepares: int = 0        # 1ª execução do shape numa conexão (parse + plano)
+    prepare_ms: float = 0.0
+    exec_ms: float = 0.0     # execuções já preparadas
+    max_ms: float = 0.0
+    rows: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> dict:
+        warm_calls = self.calls - self.prepares
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "prepares": self.prepares,
+            "avg_prepare_ms": round(self.prepare_ms / self.prepares, 2) if self.prepares else None,
+            "avg_exec_ms": round(self.exec_ms / warm_calls, 2) if warm_calls else None,
+            "max_ms": round(self.max_ms, 2),
+            "rows": self.rows,
+            "errors": self.errors,
+        }
+
+
+SHAPES: dict[str, QueryShape] = {}
+
+# conexão → shapes já preparados; a entrada some junto com a conexão que o pool descarta
+_prepared: "weakref.WeakKeyDictionary[Any, set[str]]" = weakref.WeakKeyDictionary()
+_samples: dict[str, dict[str, dict]] = {}   # endpoint → shape → parâmetros de uma execução
+_runtime: "OrderedDict[str, None]" = OrderedDict()   # shapes de ensure(), do uso mais antigo ao mais recente
+_lock = threading.Lock()
+
+
+def register(name: str, sql: str) -> str:
+    """Registra um shape; o nome vai como comentário no SQL (aparece em pg_stat_*)"""
+    if name in SHAPES:
+        raise ValueError(f"Shape duplicado: {name}")
+    SHAPES[name] = QueryShape(name=name, sql=f"/* shape:{name} */ {sql.strip()}")
+    return name
+
+
+def ensure(name: str, sql: str) -> str:
+    """
+    Registra um shape gerado em tempo de execução (idempotente pelo nome).
+    Só os QUERY_RUNTIME_SHAPES_MAX usados mais recentemente ficam registrados:
+    o /query aceita combinações abertas e o registro não pode crescer sem fim.
+    """
+    with _lock:
+        if name in _runtime:
+            _runtime.move_to_end(name)
+        elif name not in SHAPES:
+            SHAPES[name] = QueryShape(name=name, sql=f"/* shape:{name} */ {sql.strip()}")
+            _runtime[name] = None
+            while len(_runtime) > settings.QUERY_RUNTIME_SHAPES_MAX:
+                _forget(_runtime.popitem(last=False)[0])
+    return name
+
+
+def _forget(name: str):
+    """Tira um shape de runtime do registro, das conexões e das amostras (com _lock)"""
+    SHAPES.pop(name, None)
+    for seen in _prepared.values():
+        seen.discard(name)
+    for shapes in _samples.values():
+        shapes.pop(name, None)
+
+
+def prepared_cap() -> int:
+    """Teto do registro: shapes estáticos + o LRU de runtime cheio"""
+    with _lock:
+        return len(SHAPES) - len(_runtime) + settings.QUERY_RUNTIME_SHAPES_MAX
+
+
+def configure(conn):
+    """
+    Hook `configure` dos pools (db.py). O psycopg guarda no máximo
+    `prepared_max` statements por conexão (100 por padrão) e descarta os
+    mais antigos em silêncio; abaixo do teto do registro, _prepared
+    contaria como preparado um shape que o servidor já esqueceu.
+    """
+    cap = prepared_cap()
+    if conn.prepared_max is not None and conn.prepared_max < cap:
+        conn.prepared_max = cap
+
+
+def _mark_prepared(conn, name: str) -> bool:
+    with _lock:
+        seen = _prepared.setdefault(conn, set())
+        first = name not in seen
+        seen.add(name)
+    return first
+
+
+def _record(shape: QueryShape, ms: float, first: bool, nrows: int):
+    with _lock:
+        shape.calls += 1
+        shape.rows += nrows
+        shape.max_ms = max(shape.max_ms, ms)
+        if first:
+            shape.prepares += 1
+            shape.prepare_ms += ms
+        else:
+            shape.exec_ms += ms
+
+
+def run(conn, name: str, params: Optional[dict] = None, *, one: bool = False):
+    """Executa um shape registrado (preparado no servidor) e retorna as linhas"""
+    shape = SHAPES[name]
+    first = _mark_prepared(conn, name)
+
+    t0 = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(shape.sql, params or {}, prepare=True)
+            result = cur.fetchone() if one else cur.fetchall()
+    except Exception as e:
+        with _lock:
+            shape.errors += 1
+        slowlog.capture(name, shape.sql, params, (time.perf_counter() - t0) * 1000, None, e)
+        raise
+
+    ms = (time.perf_counter() - t0) * 1000
+    nrows = (1 if result else 0) if one else len(result)
+    _record(shape, ms, first, nrows)
+    slowlog.capture(name, shape.sql, params, ms, nrows)
+
+    budget = current_budget()
+    if budget is not None and name not in _samples.get(budget.endpoint, {}):
+        with _lock:
+            _samples.setdefault(budget.endpoint, {})[name] = dict(params or {})
+    return result
+
+
+def endpoint_samples() -> dict[str, dict[str, dict]]:
+    """Shapes executados por endpoint (com parâmetros reais), para o EXPLAIN da admissão"""
+    with _lock:
+        return {e: dict(shapes) for e, shapes in _samples.items()}
+
+
+def reset_samples():
+    with _lock:
+        _samples.clear()
+
+
+def stats() -> list[dict]:
+    return sorted(
+        (s.as_dict() for s in SHAPES.values()),
+        key=lambda d: d["calls"],
+        reverse=True,
+    )
+
+
+# ======================================================
+# Filtros canônicos de vendas
+# ======================================================
+# Todo shape que filtra `sales s` usa exatamente este fragmento.
+SALES_WHERE = """
+        (%(start)s::date IS NULL OR DATE(s.created_at) >= %(start)s::date)
+    AND (%(end)s::date IS NULL OR DATE(s.created_at) < %(end)s::date)
+    AND (cardinality(%(store_ids)s::int[]) = 0 OR s.store_id = ANY(%(store_ids)s::int[]))
+    AND (cardinality(%(channel_ids)s::int[]) = 0 OR s.channel_id = ANY(%(channel_ids)s::int[]))
+    AND (%(channel_name)s::text IS NULL
+         OR s.channel_id IN (SELECT id FROM channels WHERE name ILIKE %(channel_name)s::text))
+    AND (cardinality(%(statuses)s::text[]) = 0 OR s.sale_status_desc = ANY(%(statuses)s::text[]))
+"""
+
+# Mesmo contrato de filtros para tabelas/views pré-agregadas (alias `r`,
+# coluna `day`). Só contêm vendas já filtradas por status quando aplicável.
+ROLLUP_WHERE = """
+        (%(start)s::date IS NULL OR r.day >= %(start)s::date)
+    AND (%(end)s::date IS NULL OR r.day < %(end)s::date)
+    AND (cardinality(%(store_ids)s::int[]) = 0 OR r.store_id = ANY(%(store_ids)s::int[]))
+    AND (cardinality(%(channel_ids)s::int[]) = 0 OR r.channel_id = ANY(%(channel_ids)s::int[]))
+    AND (%(channel_name)s::text IS NULL
+         OR r.channel_id IN (SELECT id FROM channels WHERE name ILIKE %(channel_name)s::text))
+"""
+
+
+def _as_date(value: Optional[str]) -> Optional[date]:
+    return parse_date(value).date() if value else None
+
+
+def _as_list(value: Any) -> list:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return sorted(value)
+    return [value]
+
+
+def sales_filters(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    store_ids: Any = None,
+    channel_ids: Any = None,
+    channel_name: Optional[str] = None,
+    statuses: Optional[Iterable[str]] = ("COMPLETED",),
+    end_inclusive: bool = False,
+) -> dict:
+    """
+    Normaliza os filtros para os parâmetros de SALES_WHERE.
+    `end` é sempre enviado como limite exclusivo.
+    """
+    end_date = _as_date(end)
+    if end_date and end_inclusive:
+        end_date += timedelta(days=1)
+
+    return {
+        "start": _as_date(start),
+        "end": end_date,
+        "store_ids": _as_list(store_ids),
+        "channel_ids": _as_list(channel_ids),
+        "channel_name": channel_name or None,
+        "statuses": sorted({s.upper() for s in statuses or []}),
+    }
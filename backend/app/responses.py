@@ -0,0 +1,170 @@
+# backend/app/responses.py
+"""
+Formatos de resposta.
+
+JSON (padrão) é serializado com orjson quando o pacote existe. Nos
+endpoints @tabular a resposta JSON é montada direto a partir das linhas,
+sem passar pelo jsonable_encoder do FastAPI.
+
+Endpoints que devolvem uma lista de linhas planas (@tabular) também
+respondem em formato colunar, pedido por `?format=` ou pelo Accept:
+
+  - columnar → application/vnd.columnar+json
+        {"format": "columnar", "rows": N,
+         "columns": {"day": [...], "channel": [0, 1, 0, ...], ...},
+         "dictionaries": {"channel": ["iFood", "Rappi"], ...}}
+    colunas de texto (loja, canal, produto, ...) vão como índices numa
+    tabela de valores enviada uma vez só;
+  - arrow → application/vnd.apache.arrow.stream (IPC stream, textos
+    com dictionary encoding), para resultados grandes. Requer pyarrow.
+
+O cache (app/cache.py) fica abaixo do @tabular e guarda as linhas, então
+os três formatos compartilham a mesma entrada.
+"""
+
+import contextvars
+import functools
+import inspect
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson é opcional
+    orjson = None
+
+FORMAT_JSON = "json"
+FORMAT_COLUMNAR = "columnar"
+FORMAT_ARROW = "arrow"
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+_MEDIA_TYPES = {COLUMNAR_MEDIA_TYPE: FORMAT_COLUMNAR, ARROW_MEDIA_TYPE: FORMAT_ARROW}
+
+_format: contextvars.ContextVar[str] = contextvars.ContextVar("response_format", default=FORMAT_JSON)
+
+
+async def response_format(request: Request):
+    """Dependência (nível de app): formato pedido em ?format= ou no Accept"""
+    fmt = request.query_params.get("format")
+    if fmt is None:
+        for part in request.headers.get("accept", "").split(","):
+            media = part.split(";")[0].strip().lower()
+            if media in _MEDIA_TYPES:
+                fmt = _MEDIA_TYPES[media]
+                break
+    fmt = (fmt or FORMAT_JSON).lower()
+    if fmt not in (FORMAT_JSON, FORMAT_COLUMNAR, FORMAT_ARROW):
+        raise HTTPException(status_code=406, detail=f"Formato desconhecido: {fmt}")
+    _format.set(fmt)
+
+
+def _default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} não serializável")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_default, ensure_ascii=False).encode("utf-8")
+
+
+class DefaultJSONResponse(JSONResponse):
+    """Classe padrão de resposta da API (main.py): orjson, Decimal como float, datas ISO"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _is_table(rows: Any) -> bool:
+    return isinstance(rows, list) and all(
+        isinstance(r, dict) and not any(isinstance(v, (dict, list)) for v in r.values())
+        for r in rows
+    )
+
+
+def to_columnar(rows: list[dict]) -> dict:
+    """Linhas → colunas; colunas de texto viram índices + tabela de valores"""
+    names = list(rows[0]) if rows else []
+    columns: dict[str, list] = {}
+    dictionaries: dict[str, list[str]] = {}
+    for name in names:
+        values = [r.get(name) for r in rows]
+        if all(v is None or isinstance(v, str) for v in values) and any(v is not None for v in values):
+            lookup: dict[str, int] = {}
+            columns[name] = [None if v is None else lookup.setdefault(v, len(lookup)) for v in values]
+            dictionaries[name] = list(lookup)
+        else:
+            columns[name] = values
+    return {"format": FORMAT_COLUMNAR, "rows": len(rows), "columns": columns, "dictionaries": dictionaries}
+
+
+def to_arrow(rows: list[dict]) -> bytes:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=406, detail="Formato arrow indisponível (pyarrow não instalado)")
+
+    table = pa.Table.from_pylist(rows)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_string(field.type):
+            table = table.set_column(i, field.name, table.column(i).dictionary_encode())
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _render(rows: Any, headers: dict[str, str]) -> Any:
+    if isinstance(rows, Response):
+        return rows
+    fmt = _format.get()
+    headers = {**headers, "Vary": "Accept"}
+    if fmt == FORMAT_JSON or not _is_table(rows):
+        return DefaultJSONResponse(rows, headers=headers)
+    if fmt == FORMAT_ARROW:
+        return Response(to_arrow(rows), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    return Response(dumps(to_columnar(rows)), media_type=COLUMNAR_MEDIA_TYPE, headers=headers)
+
+
+def tabular(fn: Callable):
+    """
+    Habilita os formatos colunar/arrow num endpoint que devolve list[dict]
+    (usar entre o @router.get e o @cached). Cabeçalhos X-* definidos no
+    Response injetado (ex.: X-Data-As-Of) são copiados para a resposta.
+    """
+    response_params = [
+        name for name, p in inspect.signature(fn).parameters.items() if p.annotation is Response
+    ]
+
+    def headers_of(kwargs: dict) -> dict[str, str]:
+        out = {}
+        for name in response_params:
+            if kwargs.get(name) is not None:
+                out.update((k, v) for k, v in kwargs[name].headers.items() if k.lower().startswith("x-"))
+        return out
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            rows = await fn(*args, **kwargs)
+            return _render(rows, headers_of(kwargs))
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        rows = fn(*args, **kwargs)
+        return _render(rows, headers_of(kwargs))
+
+    return wrapper
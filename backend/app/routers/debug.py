@@ -0,0 +1,108 @@
+# backend/app/routers/debug.py
+from typing import Optional
+from fastapi import APIRouter, Query
+from .. import admission, compute, queries, cache, singleflight, slowlog
+from ..services import changefeed, duckdb_engine, exporter, fanout, forecast, live
+
+router = APIRouter(prefix="/debug", tags=["Debug"])
+
+
+@router.get("/queries")
+def query_stats():
+    """
+    Estatísticas por shape registrado: execuções, preparos
+    (1ª execução em cada conexão) e tempos médios.
+    """
+    return queries.stats()
+
+
+@router.get("/slow-queries")
+def slow_queries(
+    shape: Optional[str] = Query(None, description="Só um shape"),
+    plans: bool = Query(True, description="Incluir o plano (JSON) da pior execução"),
+):
+    """
+    Consultas acima de SLOW_QUERY_MS agrupadas por shape: ocorrências, tempo total,
+    pior plano (EXPLAIN ANALYZE amostrado) e seq scans em tabelas grandes.
+    """
+    return slowlog.report(shape, plans)
+
+
+@router.get("/cache")
+def cache_stats():
+    """
+    Hits/misses do cache de resultados e entradas por endpoint.
+    """
+    return cache.stats()
+
+
+@router.get("/singleflight")
+def singleflight_stats():
+    """
+    Chamadas líderes x duplicadas coalescidas (esperaram o resultado em voo).
+    """
+    return singleflight.stats()
+
+
+@router.get("/changefeed")
+def changefeed_stats():
+    """
+    Estado do listener (LISTEN/NOTIFY), notificações/chaves recebidas e assinantes.
+    """
+    return changefeed.snapshot()
+
+
+@router.get("/live")
+def live_stats():
+    """
+    Grupos de filtros e clientes conectados em /sales/live.
+    """
+    return live.hub.snapshot()
+
+
+@router.get("/fanout")
+def fanout_stats():
+    """
+    Execuções em fan-out mensal: fatias, tempo médio e endpoints que aceitam o modo.
+    """
+    return fanout.snapshot()
+
+
+@router.get("/duckdb")
+def duckdb_stats():
+    """
+    Motor DuckDB: snapshot em uso (dias fechados), execuções e shapes que aceitam o modo.
+    """
+    return duckdb_engine.snapshot()
+
+
+@router.get("/export")
+def export_stats():
+    """
+    Última exportação Parquet (linhas por tabela, watermark, compactação).
+    """
+    return exporter.progress
+
+
+@router.get("/admission")
+def admission_stats():
+    """
+    Faixas de custo: vagas em uso, fila, recusas (429 fila cheia / 503 prazo) e classificação via EXPLAIN.
+    """
+    return admission.snapshot()
+
+
+@router.get("/compute")
+def compute_stats():
+    """
+    Pool de processos: workers, tarefas enviadas x inline, prazos estourados e bytes por memória compartilhada.
+    """
+    return compute.snapshot()
+
+
+@router.get("/forecast")
+def forecast_stats():
+    """
+    Modelo de previsão: séries, último dia ajustado, ajustes completos x incrementais e erro médio (RMSE).
+    """
+    return forecast.snapshot()
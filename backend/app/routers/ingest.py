@@ -0,0 +1,35 @@
+# backend/app/routers/ingest.py
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from psycopg import errors as pg_errors
+
+from ..schemas.ingest import IngestResult
+from ..services import ingest
+
+router = APIRouter(prefix="/ingest", tags=["Ingest"])
+
+
+def _ingest(body: bytes, content_type: str) -> IngestResult:
+    sales = ingest.parse_body(body, content_type)
+    try:
+        return ingest.write_batch(sales)
+    except (pg_errors.ForeignKeyViolation, pg_errors.CheckViolation, pg_errors.NotNullViolation) as e:
+        # o lote inteiro é rejeitado (uma transação por lote)
+        raise HTTPException(status_code=422, detail={"error": "Referência inválida no lote", "db": str(e)})
+
+
+@router.post("/sales", response_model=IngestResult)
+async def ingest_sales(request: Request):
+    """
+    Recebe um lote de vendas (com produtos, itens, pagamentos e entrega).
+
+    - `Content-Type: application/x-ndjson` → uma venda por linha
+    - `Content-Type: application/json` → `{"columns": {campo: [valores...]}}`
+      ou uma lista de vendas
+
+    Responde 429/503 com Retry-After quando o primário está saturado.
+    """
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    # parsing/validação e COPY são CPU/IO bloqueantes → threadpool
+    return await run_in_threadpool(_ingest, body, content_type)
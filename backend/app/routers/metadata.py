@@ -1,24 +1,45 @@
 from fastapi import APIRouter
-from ..db import get_conn
+from ..db import get_conn, WORKLOAD_READ
+from .. import queries
+from ..cache import cached
 
 router = APIRouter(prefix="/metadata", tags=["Metadata"])
 
+Q_STORES = queries.register("metadata_stores", """
+    SELECT id, name, city, state, is_active, is_own
+    FROM stores
+    ORDER BY name
+""")
+
+Q_CHANNELS = queries.register("metadata_channels", """
+    SELECT id, name, type
+    FROM channels
+    ORDER BY name
+""")
+
+Q_CUSTOMERS = queries.register("metadata_customers", """
+    SELECT
+        c.id,
+        c.customer_name,
+        c.email,
+        c.phone_number,
+        MAX(s.created_at)::date AS last_purchase
+    FROM customers c
+    LEFT JOIN sales s ON s.customer_id = c.id
+    GROUP BY c.id, c.customer_name, c.email, c.phone_number
+    ORDER BY last_purchase DESC NULLS LAST
+    LIMIT %(limit)s
+""")
+
 
 @router.get("/stores")
+@cached(scope=None)
 def get_stores():
     """
     Retorna lista de lojas disponíveis para filtro
     """
-    sql = """
-        SELECT id, name, city, state, is_active, is_own
-        FROM stores
-        ORDER BY name;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql)
-            rows = cur.fetchall()
+    with get_conn(WORKLOAD_READ) as conn:
+        rows = queries.run(conn, Q_STORES)
 
     return [
         {
@@ -34,20 +55,13 @@ def get_stores():
 
 
 @router.get("/channels")
+@cached(scope=None)
 def get_channels():
     """
     Retorna canais de venda (iFood, Rappi, Presencial etc)
     """
-    sql = """
-        SELECT id, name, type
-        FROM channels
-        ORDER BY name;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql)
-            rows = cur.fetchall()
+    with get_conn(WORKLOAD_READ) as conn:
+        rows = queries.run(conn, Q_CHANNELS)
 
     return [
         {
@@ -64,24 +78,8 @@ def get_customers(limit: int = 100):
     Retorna clientes (para autocomplete, CRM, churn etc)
     """
 
-    sql = """
-        SELECT
-            c.id,
-            c.customer_name,
-            c.email,
-            c.phone_number,
-            MAX(s.created_at)::date AS last_purchase
-        FROM customers c
-        LEFT JOIN sales s ON s.customer_id = c.id
-        GROUP BY c.id, c.customer_name, c.email, c.phone_number
-        ORDER BY last_purchase DESC NULLS LAST
-        LIMIT %s;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, [limit])
-            rows = cur.fetchall()
+    with get_conn(WORKLOAD_READ) as conn:
+        rows = queries.run(conn, Q_CUSTOMERS, {"limit": limit})
 
     return [
         {
@@ -0,0 +1,17 @@
+# backend/app/routers/query.py
+from fastapi import APIRouter
+from ..schemas.query import MetricsQuery, MetricsResult
+from ..services import semantic
+
+router = APIRouter(tags=["Query"])
+
+
+@router.post("/query", response_model=MetricsResult)
+def metrics_query(body: MetricsQuery):
+    """
+    Consulta declarativa: medidas (revenue, orders, qty, avg_ticket, p90_delivery)
+    por dimensões (day, week, hour, dow, store, channel, product, city).
+    O planner responde pela menor tabela pré-agregada capaz de atender o pedido
+    e cai para as tabelas brutas quando nenhuma atende; `source` informa qual foi usada.
+    """
+    return semantic.run(body)
@@ -1,105 +1,559 @@
 # backend/app/routers/sales.py
-from fastapi import APIRouter, Query
-from typing import Optional, Any
-from ..db import get_conn
-from typing import Optional, Any, List
-from datetime import timedelta
-from fastapi import HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional, List
+from datetime import date, timedelta
+import numpy as np
+from ..db import get_conn, WORKLOAD_ANALYTICS
+from .. import queries
+from ..cache import all_days_scope, cached, previous_period_scope
+from ..settings import settings
+from ..responses import tabular
+from ..queries import SALES_WHERE, ROLLUP_WHERE, sales_filters
+from ..services import affinity, analysis, cohorts, delivery_cube, duckdb_engine, fanout, forecast, live, matviews, sampling, watermarks
+from ..services.duckdb_engine import DUCK_SALES_WHERE, partition_where
+from ..services.fanout import Merge
+from ..services.matviews import MV_TICKET
+from ..services.sampling import PI, PRODUCT_SALES_SAMPLE, SALES_SAMPLE, STRATUM_JOIN
+from ..services.rollups import (
+    CUSTOMER_SUMMARY,
+    PRODUCT_LAST_SALE,
+    PAYMENT_MIX_DAILY,
+    CUSTOMIZATIONS_DAILY,
+    DELIVERY_REGIONS_DAILY,
+)
 
 
 
 router = APIRouter(prefix="/sales", tags=["Sales"])
-# ------------- Helpers -------------
 
-def _date_filters(start: Optional[str], end: Optional[str]) -> tuple[str, list[Any]]:
-    where = []
-    params: list[Any] = []
+# ------------- Shapes (SQL canônico, preparado por conexão) -------------
+# Os filtros opcionais ficam no SALES_WHERE como sentinelas (NULL / array
+# vazio), então cada endpoint tem um texto de SQL fixo. Ver app/queries.py.
+
+Q_OVERVIEW = queries.register("sales_overview", f"""
+    SELECT
+        COALESCE(SUM(s.total_amount), 0) AS faturamento,
+        COUNT(*) AS pedidos,
+        COALESCE(AVG(s.total_amount), 0) AS ticket_medio,
+        AVG(s.production_seconds) AS p90_prep_seconds,
+        AVG(s.delivery_seconds) AS p90_delivery_seconds
+    FROM sales s
+    WHERE {SALES_WHERE}
+""")
+
+Q_PRODUCTS_TOP = queries.register("products_top", f"""
+    SELECT
+        p.name AS product,
+        SUM(ps.quantity) AS qty,
+        SUM(ps.total_price) AS revenue
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {SALES_WHERE}
+    GROUP BY p.name
+    ORDER BY revenue DESC
+    LIMIT %(limit)s
+""")
+
+Q_CUSTOMIZATIONS_TOP = queries.register("customizations_top", f"""
+    SELECT
+        i.name AS item,
+        SUM(r.times_added) AS times_added,
+        SUM(r.revenue_generated) AS revenue_generated
+    FROM {CUSTOMIZATIONS_DAILY} r
+    JOIN items i ON i.id = r.item_id
+    WHERE {ROLLUP_WHERE}
+    GROUP BY i.name
+    ORDER BY times_added DESC
+    LIMIT %(limit)s
+""")
+
+Q_DELIVERY_REGIONS = queries.register("delivery_regions", f"""
+    SELECT
+        r.city,
+        r.neighborhood,
+        SUM(r.deliveries) AS deliveries,
+        SUM(r.delivery_seconds) / NULLIF(SUM(r.timed_deliveries), 0) / 60.0 AS avg_delivery_minutes
+    FROM {DELIVERY_REGIONS_DAILY} r
+    WHERE {ROLLUP_WHERE}
+    GROUP BY 1, 2
+    HAVING SUM(r.deliveries) >= %(min_orders)s
+    ORDER BY avg_delivery_minutes DESC
+    LIMIT %(limit)s
+""")
+
+Q_PAYMENT_MIX = queries.register("payment_mix", f"""
+    SELECT
+        COALESCE(pt.description, 'N/A') AS payment_type,
+        SUM(r.payments) AS qtd,
+        SUM(r.total) AS total
+    FROM {PAYMENT_MIX_DAILY} r
+    LEFT JOIN payment_types pt ON pt.id = r.payment_type_id
+    WHERE {ROLLUP_WHERE}
+    GROUP BY 1
+    ORDER BY total DESC
+""")
+
+_TIMESERIES_DAILY_SQL = f"""
+    SELECT
+        DATE(s.created_at) AS day,
+        ch.name AS channel,
+        st.name AS store_name,
+        SUM(s.total_amount) AS revenue,
+        COUNT(*) AS orders
+    FROM sales s
+    JOIN channels ch ON ch.id = s.channel_id
+    JOIN stores st ON st.id = s.store_id
+    WHERE {SALES_WHERE} {{delta}}
+    GROUP BY day, channel, store_name
+    ORDER BY day, channel, store_name
+"""
+
+Q_TIMESERIES_DAILY = queries.register("timeseries_daily", _TIMESERIES_DAILY_SQL.format(delta=""))
+
+# ?since=: só os buckets alterados (services/watermarks.py)
+Q_TIMESERIES_DAILY_DELTA = queries.register(
+    "timeseries_daily_delta", _TIMESERIES_DAILY_SQL.format(delta=watermarks.DELTA_WHERE_DAY)
+)
+
+Q_PRODUCTS_MARGIN = queries.register("products_margin", f"""
+    SELECT
+        p.name AS product_name,
+        SUM(ps.quantity) AS total_sold,
+        SUM(ps.total_price) AS revenue,
+        SUM(ps.quantity * ps.base_price) AS total_cost,   -- usa base_price como custo
+        (SUM(ps.total_price) - SUM(ps.quantity * ps.base_price)) AS margin
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {SALES_WHERE}
+    GROUP BY p.id, p.name
+    ORDER BY margin DESC
+    LIMIT %(limit)s
+""")
+
+# ------------- Versões parciais (fan-out mensal, ver services/fanout.py) -------------
+# Sem ORDER BY/LIMIT: cada fatia devolve todos os grupos e o top-K é feito na combinação.
+
+F_PRODUCTS_MARGIN = fanout.register("products_margin", f"""
+    SELECT
+        p.id,
+        p.name AS product_name,
+        SUM(ps.quantity) AS total_sold,
+        SUM(ps.total_price) AS revenue,
+        SUM(ps.quantity * ps.base_price) AS total_cost
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {SALES_WHERE}
+    GROUP BY p.id, p.name
+""", Merge(
+    keys=2,
+    aggs=("sum", "sum", "sum"),
+    finalize=lambda r: (r[1], r[2], r[3], r[4], r[3] - r[4]),
+    sort_key=lambda r: r[4],
+))
+
+F_PRODUCTS_TOP = fanout.register("products_top", f"""
+    SELECT
+        p.name AS product,
+        SUM(ps.quantity) AS qty,
+        SUM(ps.total_price) AS revenue
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {SALES_WHERE}
+    GROUP BY p.name
+""", Merge(keys=1, aggs=("sum", "sum"), sort_key=lambda r: r[2]))
+
+F_CUSTOMIZATIONS_TOP = fanout.register("customizations_top", f"""
+    SELECT
+        i.name AS item,
+        SUM(r.times_added) AS times_added,
+        SUM(r.revenue_generated) AS revenue_generated
+    FROM {CUSTOMIZATIONS_DAILY} r
+    JOIN items i ON i.id = r.item_id
+    WHERE {ROLLUP_WHERE}
+    GROUP BY i.name
+""", Merge(keys=1, aggs=("sum", "sum"), sort_key=lambda r: r[1]))
+
+# ------------- Mesmos parciais no DuckDB (dias fechados, ver services/duckdb_engine.py) -------------
+
+duckdb_engine.register(F_PRODUCTS_MARGIN, f"""
+    SELECT
+        p.id,
+        p.name AS product_name,
+        SUM(ps.quantity) AS total_sold,
+        SUM(ps.total_price) AS revenue,
+        SUM(ps.quantity * ps.base_price) AS total_cost
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {DUCK_SALES_WHERE} {partition_where("ps")}
+    GROUP BY p.id, p.name
+""")
+
+duckdb_engine.register(F_PRODUCTS_TOP, f"""
+    SELECT
+        p.name AS product,
+        SUM(ps.quantity) AS qty,
+        SUM(ps.total_price) AS revenue
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {DUCK_SALES_WHERE} {partition_where("ps")}
+    GROUP BY p.name
+""")
+
+# ------------- Modo aproximado (amostra estratificada, ver services/sampling.py) -------------
+# Cada medida vira duas colunas: total estimado e variância (sampling.ht).
+
+Q_OVERVIEW_APPROX = queries.register("sales_overview_approx", f"""
+    SELECT
+        {sampling.ht("s.total_amount")},
+        {sampling.ht("1")},
+        SUM(s.total_amount::float8 * (1 - {PI}) / ({PI} * {PI})) AS cov_revenue_orders,
+        SUM(s.production_seconds / {PI})
+            / NULLIF(SUM(CASE WHEN s.production_seconds IS NOT NULL THEN 1 / {PI} END), 0),
+        SUM(s.delivery_seconds / {PI})
+            / NULLIF(SUM(CASE WHEN s.delivery_seconds IS NOT NULL THEN 1 / {PI} END), 0)
+    FROM {SALES_SAMPLE} s
+    {STRATUM_JOIN}
+    WHERE {SALES_WHERE}
+""")
+
+# unidade amostral = venda: os itens do mesmo produto na venda são somados antes
+Q_PRODUCTS_TOP_APPROX = queries.register("products_top_approx", f"""
+    WITH u AS (
+        SELECT p.name AS product, {PI} AS pi,
+               SUM(ps.quantity) AS qty, SUM(ps.total_price) AS revenue
+        FROM {PRODUCT_SALES_SAMPLE} ps
+        JOIN products p ON p.id = ps.product_id
+        JOIN {SALES_SAMPLE} s ON s.id = ps.sale_id
+        {STRATUM_JOIN}
+        WHERE {SALES_WHERE}
+        GROUP BY p.name, s.id, pi
+    )
+    SELECT product, {sampling.ht("u.qty", "u.pi")}, {sampling.ht("u.revenue", "u.pi")}
+    FROM u
+    GROUP BY product
+    ORDER BY 4 DESC
+    LIMIT %(limit)s
+""")
+
+Q_PRODUCTS_MARGIN_APPROX = queries.register("products_margin_approx", f"""
+    WITH u AS (
+        SELECT p.id, p.name AS product_name, {PI} AS pi,
+               SUM(ps.quantity) AS qty,
+               SUM(ps.total_price) AS revenue,
+               SUM(ps.quantity * ps.base_price) AS cost
+        FROM {PRODUCT_SALES_SAMPLE} ps
+        JOIN products p ON p.id = ps.product_id
+        JOIN {SALES_SAMPLE} s ON s.id = ps.sale_id
+        {STRATUM_JOIN}
+        WHERE {SALES_WHERE}
+        GROUP BY p.id, p.name, s.id, pi
+    )
+    SELECT product_name,
+           {sampling.ht("u.qty", "u.pi")},
+           {sampling.ht("u.revenue", "u.pi")},
+           {sampling.ht("u.cost", "u.pi")},
+           {sampling.ht("u.revenue - u.cost", "u.pi")}
+    FROM u
+    GROUP BY id, product_name
+    ORDER BY 8 DESC
+    LIMIT %(limit)s
+""")
+
+Q_TIMESERIES_DAILY_APPROX = queries.register("timeseries_daily_approx", f"""
+    SELECT
+        DATE(s.created_at) AS day,
+        ch.name AS channel,
+        st.name AS store_name,
+        {sampling.ht("s.total_amount")},
+        {sampling.ht("1")}
+    FROM {SALES_SAMPLE} s
+    {STRATUM_JOIN}
+    JOIN channels ch ON ch.id = s.channel_id
+    JOIN stores st ON st.id = s.store_id
+    WHERE {SALES_WHERE}
+    GROUP BY 1, 2, 3              -- `day` também é coluna do estrato
+    ORDER BY day, channel, store_name
+""")
+
+Q_TIMESERIES_MONTHLY_APPROX = queries.register("timeseries_monthly_approx", f"""
+    SELECT
+        TO_CHAR(s.created_at, 'YYYY-MM') AS year_month,
+        ch.name AS channel,
+        st.name AS store_name,
+        {sampling.ht("s.total_amount")},
+        {sampling.ht("1")}
+    FROM {SALES_SAMPLE} s
+    {STRATUM_JOIN}
+    JOIN channels ch ON ch.id = s.channel_id
+    JOIN stores st ON st.id = s.store_id
+    WHERE {SALES_WHERE}
+    GROUP BY year_month, channel, store_name
+    ORDER BY year_month, channel, store_name
+""")
+
+_TIMESERIES_MONTHLY_SQL = f"""
+    SELECT
+        TO_CHAR(s.created_at, 'YYYY-MM') AS year_month,
+        ch.name AS channel,
+        st.name AS store_name,
+        SUM(s.total_amount) AS revenue,
+        COUNT(*) AS orders
+    FROM sales s
+    JOIN channels ch ON ch.id = s.channel_id
+    JOIN stores st ON st.id = s.store_id
+    WHERE {SALES_WHERE} {{delta}}
+    GROUP BY year_month, channel, store_name
+    ORDER BY year_month, channel, store_name
+"""
+
+Q_TIMESERIES_MONTHLY = queries.register("timeseries_monthly", _TIMESERIES_MONTHLY_SQL.format(delta=""))
+
+Q_TIMESERIES_MONTHLY_DELTA = queries.register(
+    "timeseries_monthly_delta", _TIMESERIES_MONTHLY_SQL.format(delta=watermarks.DELTA_WHERE_MONTH)
+)
+
+Q_WEEKLY_REVENUE = queries.register("weekly_revenue", """
+    SELECT
+        DATE_TRUNC('week', created_at)::date AS week,
+        SUM(total_amount) AS revenue,
+        COUNT(*) AS orders
+    FROM sales
+    WHERE sale_status_desc = 'COMPLETED'
+    GROUP BY week
+    ORDER BY week
+""")
+
+Q_REVENUE_TOTAL = queries.register("revenue_total", f"""
+    SELECT COALESCE(SUM(s.total_amount), 0)
+    FROM sales s
+    WHERE {SALES_WHERE}
+""")
+
+Q_REVENUE_LAST_DAYS = queries.register("revenue_last_days", """
+    SELECT COALESCE(SUM(total_amount), 0)
+    FROM sales
+    WHERE created_at >= NOW() - make_interval(days => %(from_days)s)
+      AND created_at < NOW() - make_interval(days => %(to_days)s)
+""")
+
+Q_RECENT_SALES = queries.register("recent_sales", f"""
+    SELECT
+        s.id              AS sale_id,
+        s.created_at      AS created_at,
+        s.total_amount    AS total_amount,
+        c.customer_name   AS customer_name,
+        ch.name           AS channel,
+        st.name           AS store_name,
+        s.sale_status_desc AS status
+    FROM sales s
+    LEFT JOIN customers c ON c.id = s.customer_id
+    JOIN channels ch ON ch.id = s.channel_id
+    JOIN stores   st ON st.id = s.store_id
+    WHERE {SALES_WHERE}
+    ORDER BY s.created_at DESC
+    LIMIT %(limit)s OFFSET %(offset)s
+""")
+
+Q_RECENT_PRODUCTS = queries.register("recent_products", """
+    SELECT
+        ps.sale_id,
+        p.name,
+        ps.quantity,
+        ps.total_price
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    WHERE ps.sale_id = ANY(%(sale_ids)s::int[])
+    ORDER BY ps.sale_id
+""")
+
+Q_LOST_CUSTOMERS = queries.register("lost_customers", f"""
+    SELECT
+        c.customer_name,
+        SUM(r.orders) AS total_orders,
+        MAX(r.last_order)::date AS last_order
+    FROM {CUSTOMER_SUMMARY} r
+    JOIN customers c ON c.id = r.customer_id
+    GROUP BY c.customer_name
+    HAVING SUM(r.orders) >= %(min_orders)s
+    AND MAX(r.last_order) <= NOW() - make_interval(days => %(inactive_days)s)
+    ORDER BY last_order ASC
+""")
+
+_TICKET_SQL = f"""
+    SELECT
+        st.name AS store_name,
+        ch.name AS channel_name,
+        ROUND(SUM(r.total_amount) / NULLIF(SUM(r.orders), 0), 2) AS avg_ticket
+    FROM {MV_TICKET} r
+    JOIN stores st ON st.id = r.store_id
+    JOIN channels ch ON ch.id = r.channel_id
+    WHERE (cardinality(%(store_ids)s::int[]) = 0 OR r.store_id = ANY(%(store_ids)s::int[]))
+      AND (cardinality(%(channel_ids)s::int[]) = 0 OR r.channel_id = ANY(%(channel_ids)s::int[]))
+      {{delta}}
+    GROUP BY st.name, ch.name
+    ORDER BY avg_ticket DESC
+"""
+
+Q_TICKET = queries.register("ticket_store_channel", _TICKET_SQL.format(delta=""))
+
+Q_TICKET_DELTA = queries.register("ticket_store_channel_delta", _TICKET_SQL.format(delta="""
+      AND (r.store_id, r.channel_id) IN (
+          SELECT * FROM unnest(%(bucket_store_ids)s::int[], %(bucket_channel_ids)s::int[])
+      )"""))
+
+# Filtros extras dos endpoints de trending (dia da semana / faixa de horário)
+_TRENDING_WHERE = f"""
+    {SALES_WHERE}
+    AND (%(weekday)s::int IS NULL OR EXTRACT(DOW FROM s.created_at) = %(weekday)s::int)
+    AND (%(start_hour)s::int IS NULL
+         OR EXTRACT(HOUR FROM s.created_at) BETWEEN %(start_hour)s::int AND %(end_hour)s::int)
+"""
+
+Q_TRENDING = queries.register("products_trending", f"""
+    SELECT
+        p.name,
+        SUM(ps.quantity) AS qty,
+        SUM(ps.total_price) AS revenue
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {_TRENDING_WHERE}
+    GROUP BY p.name
+    ORDER BY qty DESC
+    LIMIT %(limit)s
+""")
+
+Q_TRENDING_BEST = queries.register("products_trending_best", f"""
+    SELECT p.name, SUM(ps.quantity) AS qty
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {_TRENDING_WHERE}
+    GROUP BY p.name
+    ORDER BY qty DESC LIMIT 1
+""")
+
+Q_TRENDING_WORST = queries.register("products_trending_worst", f"""
+    SELECT p.name, SUM(ps.quantity) AS qty
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {_TRENDING_WHERE}
+    GROUP BY p.name
+    ORDER BY qty ASC LIMIT 1
+""")
+
+Q_NOT_SELLING = queries.register("products_not_selling", f"""
+    WITH last_sales AS (
+        SELECT
+            p.id,
+            p.name,
+            MAX(r.last_sale) AS last_sale
+        FROM products p
+        LEFT JOIN {PRODUCT_LAST_SALE} r ON r.product_id = p.id
+            AND (cardinality(%(store_ids)s::int[]) = 0 OR r.store_id = ANY(%(store_ids)s::int[]))
+            AND (cardinality(%(channel_ids)s::int[]) = 0 OR r.channel_id = ANY(%(channel_ids)s::int[]))
+        GROUP BY p.id, p.name
+    )
+    SELECT
+        id,
+        name,
+        last_sale,
+        COALESCE(
+            DATE_PART('day', NOW() - last_sale),
+            DATE_PART('day', NOW() - NOW())
+        ) AS days_without_sale
+    FROM last_sales
+    WHERE last_sale IS NULL OR last_sale < NOW() - INTERVAL '30 days'
+    ORDER BY days_without_sale DESC
+""")
 
-    if start:
-        where.append("DATE(s.created_at) >= %s")
-        params.append(start)
+Q_PRODUCT_NAMES = queries.register("product_names", """
+    SELECT id, name FROM products WHERE id = ANY(%(product_ids)s::int[])
+""")
 
-    if end:
-        where.append("DATE(s.created_at) < %s")
-        params.append(end)   # ✅ antes estava faltando!
 
-    return (" AND ".join(where), params)
+def _set_as_of(response: Response, *views: str):
+    """Expõe o horário do último refresh das views usadas (X-Data-As-Of)"""
+    ts = matviews.as_of(*views)
+    if ts is not None:
+        response.headers["X-Data-As-Of"] = ts.isoformat()
 
 
-def _opt_filter_store(store_id: Optional[int]) -> tuple[str, list[Any]]:
-    if store_id is None:
-        return ("", [])
-    return (" AND s.store_id = %s", [store_id])
+def _run_decomposable(shape, single: str, params: dict, limit: int):
+    """Agregado decomponível: DuckDB + cauda no Postgres, fan-out mensal ou uma consulta"""
+    parts = duckdb_engine.plan(shape, params)
+    if parts is not None:
+        return duckdb_engine.run(shape, parts, limit=limit)
+    chunks = fanout.plan(params)
+    if chunks is not None:
+        return fanout.run(shape, params, chunks, limit=limit)
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        return queries.run(conn, single, params)
 
-def _opt_filter_channel(channel_name: Optional[str]) -> tuple[str, list[Any]]:
-    if not channel_name:
-        return ("", [])
-    return (" AND ch.name ILIKE %s", [channel_name])
 
+# ?mode=approx: responde pela amostra estratificada, com intervalo de confiança
+APPROX_MODE = Query("exact", pattern="^(exact|approx)$", description="exact | approx (amostra)")
 
-# ======================================================
-# Helpers de filtro dinâmico (sem “AND AND” no SQL)
-# ======================================================
-def build_filters(
-    start: Optional[str],
-    end: Optional[str],
-    store_id: Optional[List[int]],      # ✅ agora aceita múltiplos valores
-    channel_name: Optional[List[int]]
 
-):
-    filters = ["s.sale_status_desc = 'COMPLETED'"]
-    params: list[Any] = []
+def _mark_approx(response: Response):
+    response.headers["X-Approximate"] = sampling.header()
 
-    if start:
-        filters.append("DATE(s.created_at) >= %s")
-        params.append(start)
 
-    if end:
-        filters.append("DATE(s.created_at) < %s")
-        params.append(end)
+# ?since=<watermark>: só os buckets alterados; o watermark novo vai em X-Watermark
+SINCE = Query(None, pattern=watermarks.WATERMARK_PATTERN, description="watermark (X-Watermark) da resposta anterior")
 
-    if store_id:                        # ✅ aceitando [1,2,3]
-        filters.append("s.store_id = ANY(%s)")
-        params.append(store_id)
 
-    if channel_name:
-        filters.append("ch.id = ANY(%s)")
-        params.append(channel_name)
+# `end` exclusivo (sales_filters sem end_inclusive); o warm-up lê a marca da assinatura
+END_EXCLUSIVE = Query(None, description="YYYY-MM-DD (exclusivo)", json_schema_extra={"end_exclusive": True})
 
 
-    where_clause = "WHERE " + " AND ".join(filters)
-    return where_clause, params
+def _trending_params(weekday=None, start_hour=None, end_hour=None) -> dict:
+    has_hours = start_hour is not None and end_hour is not None
+    return {
+        "weekday": weekday,
+        "start_hour": start_hour if has_hours else None,
+        "end_hour": end_hour if has_hours else None,
+    }
 
 
 # ======================================================
 #  Overview
 # ======================================================
 @router.get("/overview")
+@cached()
 def sales_overview(
+    response: Response,
     start: Optional[str] = Query(None, description="YYYY-MM-DD"),
-    end: Optional[str] = Query(None, description="YYYY-MM-DD (exclusivo)"),
+    end: Optional[str] = END_EXCLUSIVE,
     store_id: Optional[List[int]] = Query(None),
     channel_name: Optional[str] = None,
+    mode: str = APPROX_MODE,
 ):
 
-    where, params = build_filters(start, end, store_id, channel_name)
-
-    sql = f"""
-        SELECT
-            COALESCE(SUM(s.total_amount), 0) AS faturamento,
-            COUNT(*) AS pedidos,
-            COALESCE(AVG(s.total_amount), 0) AS ticket_medio,
-            AVG(s.production_seconds) AS p90_prep_seconds,
-            AVG(s.delivery_seconds) AS p90_delivery_seconds
-        FROM sales s
-        JOIN channels ch ON ch.id = s.channel_id
-        {where};
-    """
+    params = sales_filters(start, end, store_id, channel_name=channel_name)
+
+    if mode == "approx":
+        with get_conn(WORKLOAD_ANALYTICS) as conn:
+            r = queries.run(conn, Q_OVERVIEW_APPROX, params, one=True)
+        _mark_approx(response)
+        return {
+            **sampling.fields("faturamento", r[0], r[1]),
+            **sampling.fields("pedidos", r[2], r[3], integer=True),
+            **sampling.ratio_fields("ticket_medio", r[0], r[2], r[1], r[3], r[4]),
+            "p90_prep_seconds": float(r[5] or 0),
+            "p90_delivery_seconds": float(r[6] or 0),
+        }
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            r = cur.fetchone()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        r = queries.run(conn, Q_OVERVIEW, params, one=True)
 
     return {
         "faturamento": float(r[0]),
@@ -114,35 +568,34 @@ def sales_overview(
 # 1) Top produtos mais vendidos
 # ======================================================
 @router.get("/products/top")
+@tabular
+@cached()
 def top_products(
+    response: Response,
     start: Optional[str] = None,
-    end: Optional[str] = None,
+    end: Optional[str] = END_EXCLUSIVE,
     store_id: Optional[int] = None,
     channel_name: Optional[str] = None,
     limit: int = 10,
+    mode: str = APPROX_MODE,
 ):
-    where, params = build_filters(start, end, store_id, channel_name)
-
-    sql = f"""
-        SELECT
-            p.name AS product,
-            SUM(ps.quantity) AS qty,
-            SUM(ps.total_price) AS revenue
-        FROM product_sales ps
-        JOIN products p ON p.id = ps.product_id
-        JOIN sales s ON s.id = ps.sale_id
-        JOIN channels ch ON ch.id = s.channel_id
-        {where}
-        GROUP BY p.name
-        ORDER BY revenue DESC
-        LIMIT %s;
-    """
-    params.append(limit)
+    params = sales_filters(start, end, store_id, channel_name=channel_name)
+    params["limit"] = limit
+
+    if mode == "approx":
+        with get_conn(WORKLOAD_ANALYTICS) as conn:
+            rows = queries.run(conn, Q_PRODUCTS_TOP_APPROX, params)
+        _mark_approx(response)
+        return [
+            {
+                "product": r[0],
+                **sampling.fields("qty", r[1], r[2], integer=True),
+                **sampling.fields("revenue", r[3], r[4]),
+            }
+            for r in rows
+        ]
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+    rows = _run_decomposable(F_PRODUCTS_TOP, Q_PRODUCTS_TOP, params, limit)
 
     return [{"product": r[0], "qty": int(r[1]), "revenue": float(r[2])} for r in rows]
 
@@ -151,36 +604,19 @@ def top_products(
 # 2) Customizações mais adicionadas
 # ======================================================
 @router.get("/customizations/top")
+@tabular
+@cached()
 def top_customizations(
     start: Optional[str] = None,
-    end: Optional[str] = None,
+    end: Optional[str] = END_EXCLUSIVE,
     store_id: Optional[int] = None,
     channel_name: Optional[str] = None,
     limit: int = 20,
 ):
-    where, params = build_filters(start, end, store_id, channel_name)
-
-    sql = f"""
-        SELECT
-            i.name AS item,
-            COUNT(*) AS times_added,
-            SUM(ips.additional_price) AS revenue_generated
-        FROM item_product_sales ips
-        JOIN items i ON i.id = ips.item_id
-        JOIN product_sales ps ON ps.id = ips.product_sale_id
-        JOIN sales s ON s.id = ps.sale_id
-        JOIN channels ch ON ch.id = s.channel_id
-        {where}
-        GROUP BY i.name
-        ORDER BY times_added DESC
-        LIMIT %s;
-    """
-    params.append(limit)
+    params = sales_filters(start, end, store_id, channel_name=channel_name)
+    params["limit"] = limit
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+    rows = _run_decomposable(F_CUSTOMIZATIONS_TOP, Q_CUSTOMIZATIONS_TOP, params, limit)
 
     return [{"item": r[0], "times_added": int(r[1]), "revenue_generated": float(r[2])} for r in rows]
 
@@ -189,71 +625,49 @@ def top_customizations(
 # 3) Delivery por região
 # ======================================================
 @router.get("/delivery/regions")
+@tabular
+@cached()
 def delivery_by_region(
     start: Optional[str] = None,
-    end: Optional[str] = None,
+    end: Optional[str] = END_EXCLUSIVE,
     store_id: Optional[int] = None,
     channel_name: Optional[str] = None,
     min_orders: int = 10,
     limit: int = 100,
 ):
-    where, params = build_filters(start, end, store_id, channel_name)
-
-    sql = f"""
-        SELECT
-            COALESCE(da.city, 'N/A') AS city,
-            COALESCE(da.neighborhood, 'N/A') AS neighborhood,
-            COUNT(*) AS deliveries,
-            AVG(s.delivery_seconds)/60.0 AS avg_delivery_minutes
-        FROM delivery_addresses da
-        JOIN sales s ON s.id = da.sale_id
-        JOIN channels ch ON ch.id = s.channel_id
-        {where}
-        GROUP BY city, neighborhood
-        HAVING COUNT(*) >= %s
-        ORDER BY avg_delivery_minutes DESC
-        LIMIT %s;
-    """
-    params.extend([min_orders, limit])
+    params = sales_filters(start, end, store_id, channel_name=channel_name)
+    params.update(min_orders=min_orders, limit=limit)
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        rows = queries.run(conn, Q_DELIVERY_REGIONS, params)
 
-    return [{"city": r[0], "neighborhood": r[1], "deliveries": r[2], "avg_delivery_minutes": float(r[3])} for r in rows]
+    return [
+        {
+            "city": r[0],
+            "neighborhood": r[1],
+            "deliveries": int(r[2]),
+            "avg_delivery_minutes": float(r[3]) if r[3] is not None else None,
+        }
+        for r in rows
+    ]
 
 
 # ======================================================
 # 4) Mix de pagamento
 # ======================================================
 @router.get("/payment/mix")
+@tabular
+@cached()
 def payment_mix(
     start: Optional[str] = None,
-    end: Optional[str] = None,
+    end: Optional[str] = END_EXCLUSIVE,
     store_id: Optional[int] = None,
     channel_name: Optional[str] = None,
 ):
-    where, params = build_filters(start, end, store_id, channel_name)
-
-    sql = f"""
-        SELECT
-            COALESCE(pt.description, 'N/A') AS payment_type,
-            COUNT(*) AS qtd,
-            SUM(pay.value) AS total
-        FROM payments pay
-        JOIN sales s ON s.id = pay.sale_id
-        LEFT JOIN payment_types pt ON pt.id = pay.payment_type_id
-        JOIN channels ch ON ch.id = s.channel_id
-        {where}
-        GROUP BY payment_type
-        ORDER BY total DESC;
-    """
+    params = sales_filters(start, end, store_id, channel_name=channel_name)
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        rows = queries.run(conn, Q_PAYMENT_MIX, params)
 
     return [{"payment_type": r[0], "count": int(r[1]), "total": float(r[2])} for r in rows]
 
@@ -262,69 +676,60 @@ def payment_mix(
 # 5) Time Series diária
 # ======================================================
 @router.get("/timeseries/daily")
+@tabular
+@cached()
 def timeseries_daily(
+    response: Response,
     store_id: Optional[List[int]] = Query(default=None),
     channel_id: Optional[List[int]] = Query(default=None),
     start: Optional[str] = None,
     end: Optional[str] = None,
-    previous: Optional[bool] = False  # ✅ NOVO
+    previous: Optional[bool] = False,  # ✅ NOVO
+    mode: str = APPROX_MODE,
+    since: Optional[str] = SINCE,
 ):
     """
     Retorna vendas por dia. Se previous=true, retorna o mesmo período anterior.
+    Com since=<watermark>, só os dias × loja × canal alterados desde então.
     """
 
-    sql = """
-        SELECT
-            DATE(s.created_at) AS day,
-            ch.name AS channel,
-            st.name AS store_name,
-            SUM(s.total_amount) AS revenue,
-            COUNT(*) AS orders
-        FROM sales s
-        JOIN channels ch ON ch.id = s.channel_id
-        JOIN stores st ON st.id = s.store_id
-        WHERE s.sale_status_desc = 'COMPLETED'
-    """
-
-    params = []
-
-    # ✅ Período corrente (default)
-    if not previous:
-        if start:
-            sql += " AND DATE(s.created_at) >= %s"
-            params.append(start)
-
-        if end:
-            sql += " AND DATE(s.created_at) <= %s"
-            params.append(end)
+    params = sales_filters(start, end, store_id, channel_id, end_inclusive=True)
 
     # ✅ Período anterior (mesma duração, deslocado para trás)
-    else:
-        sql += """
-            AND DATE(s.created_at) >= (DATE(%s) - ((DATE(%s) - DATE(%s))))
-            AND DATE(s.created_at) <= (DATE(%s) - ((DATE(%s) - DATE(%s))))
-        """
-        params.extend([start, end, start, end, end, start])
-
-    if store_id:
-        sql += " AND s.store_id = ANY(%s)"
-        params.append(store_id)
-
-    if channel_id:
-        sql += " AND ch.id = ANY(%s)"
-        params.append(channel_id)
-
-    sql += """
-        GROUP BY day, channel, store_name
-        ORDER BY day, channel, store_name;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+    if previous:
+        if not (params["start"] and params["end"]):
+            return []
+        span = params["end"] - timedelta(days=1) - params["start"]
+        params["start"] -= span
+        params["end"] -= span
+
+    if mode == "approx":
+        with get_conn(WORKLOAD_ANALYTICS) as conn:
+            rows = queries.run(conn, Q_TIMESERIES_DAILY_APPROX, params)
+        _mark_approx(response)
+        return [
+            {
+                "day": str(r[0]),
+                "channel": r[1],
+                "store_name": r[2],
+                **sampling.fields("revenue", r[3], r[4]),
+                **sampling.fields("orders", r[5], r[6], integer=True),
+            }
+            for r in rows
+        ]
 
-    return [
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        # watermark antes da leitura: o que entrar no meio volta no próximo delta
+        response.headers["X-Watermark"] = watermarks.current(conn)
+        if since is None:
+            rows = queries.run(conn, Q_TIMESERIES_DAILY, params)
+        else:
+            buckets = watermarks.changed(conn, since, params)
+            delta = watermarks.delta_params(buckets)
+            rows = queries.run(conn, Q_TIMESERIES_DAILY_DELTA, {**params, **delta}) if delta else []
+            removed = watermarks.tombstones(conn, buckets, {(r[0], r[2], r[1]) for r in rows})
+
+    out = [
         {
             "day": str(r[0]),
             "channel": r[1],
@@ -334,60 +739,50 @@ def timeseries_daily(
         }
         for r in rows
     ]
+    if since is None:
+        return out
+
+    # delta: buckets que ficaram sem vendas no filtro voltam como tombstone
+    return [{**row, "deleted": False} for row in out] + [
+        {"day": str(day), "channel": channel, "store_name": store, "revenue": 0.0, "orders": 0, "deleted": True}
+        for day, store, channel in removed
+    ]
 
 
 # ======================================================
 # NEW: Margem por produto (com custo do catálogo)
 # ======================================================
 @router.get("/products/margin")
+@tabular
+@cached()
 def get_products_margin(
+    response: Response,
     start: Optional[str] = None,
-    end: Optional[str] = None,
+    end: Optional[str] = END_EXCLUSIVE,
     store_id: Optional[int] = None,
     channel_name: Optional[str] = None,
     limit: int = 20,
+    mode: str = APPROX_MODE,
 ):
-    # usa o helper já existente
-    w_date, p_date = _date_filters(start, end)
-
-    sql = """
-        SELECT
-            p.name AS product_name,
-            SUM(ps.quantity) AS total_sold,
-            SUM(ps.total_price) AS revenue,
-            SUM(ps.quantity * ps.base_price) AS total_cost,   -- usa base_price como custo
-            (SUM(ps.total_price) - SUM(ps.quantity * ps.base_price)) AS margin
-        FROM product_sales ps
-        JOIN products p ON p.id = ps.product_id
-        JOIN sales s ON s.id = ps.sale_id
-        JOIN channels ch ON ch.id = s.channel_id
-        WHERE s.sale_status_desc = 'COMPLETED'
-    """
-
-    params = p_date
-
-    if w_date:
-        sql += f" AND {w_date}"
-
-    if store_id:
-        sql += " AND s.store_id = %s"
-        params.append(store_id)
-
-    if channel_name:
-        sql += " AND ch.name ILIKE %s"
-        params.append(channel_name)
-
-    sql += """
-        GROUP BY p.id, p.name
-        ORDER BY margin DESC
-        LIMIT %s;
-    """
-    params.append(limit)
+    params = sales_filters(start, end, store_id or None, channel_name=channel_name)
+    params["limit"] = limit
+
+    if mode == "approx":
+        with get_conn(WORKLOAD_ANALYTICS) as conn:
+            rows = queries.run(conn, Q_PRODUCTS_MARGIN_APPROX, params)
+        _mark_approx(response)
+        return [
+            {
+                "product_name": r[0],
+                **sampling.fields("total_sold", r[1], r[2], integer=True),
+                **sampling.fields("revenue", r[3], r[4]),
+                **sampling.fields("total_cost", r[5], r[6]),
+                **sampling.fields("margin", r[7], r[8], floor=None),
+            }
+            for r in rows
+        ]
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+    rows = _run_decomposable(F_PRODUCTS_MARGIN, Q_PRODUCTS_MARGIN, params, limit)
 
     return [
         {
@@ -402,53 +797,48 @@ def get_products_margin(
 # ----------------------------------------------
 # 6) Série temporal mensal (para crescimento/sazonalidade)
 # ----------------------------------------------
-# backend/app/routers/sales.py
 
 @router.get("/timeseries/monthly")
+@tabular
+@cached()
 def sales_timeseries_monthly(
+    response: Response,
     store_id: Optional[List[int]] = Query(default=None),
     channel_id: Optional[List[int]] = Query(default=None),
     start: Optional[str] = None,
-    end: Optional[str] = None,
+    end: Optional[str] = END_EXCLUSIVE,
+    mode: str = APPROX_MODE,
+    since: Optional[str] = SINCE,
 ):
-    sql = """
-        SELECT
-            TO_CHAR(s.created_at, 'YYYY-MM') AS year_month,
-            ch.name AS channel,
-            st.name AS store_name,  -- ✅ adicionar nome da loja
-            SUM(s.total_amount) AS revenue,
-            COUNT(*) AS orders
-        FROM sales s
-        JOIN channels ch ON ch.id = s.channel_id
-        JOIN stores st ON st.id = s.store_id      -- ✅ join com a tabela stores
-        WHERE s.sale_status_desc = 'COMPLETED'
-    """
+    params = sales_filters(start, end, store_id, channel_id)
 
-    params = []
-    if start:
-        sql += " AND DATE(s.created_at) >= %s"
-        params.append(start)
-    if end:
-        sql += " AND DATE(s.created_at) < %s"
-        params.append(end)
-    if store_id:
-        sql += " AND s.store_id = ANY(%s)"
-        params.append(store_id)
-    if channel_id:
-        sql += " AND ch.id = ANY(%s)"
-        params.append(channel_id)
-
-    sql += """
-        GROUP BY year_month, channel, store_name
-        ORDER BY year_month, channel, store_name;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+    if mode == "approx":
+        with get_conn(WORKLOAD_ANALYTICS) as conn:
+            rows = queries.run(conn, Q_TIMESERIES_MONTHLY_APPROX, params)
+        _mark_approx(response)
+        return [
+            {
+                "month": r[0],
+                "channel": r[1],
+                "store_name": r[2],
+                **sampling.fields("revenue", r[3], r[4]),
+                **sampling.fields("orders", r[5], r[6], integer=True),
+            }
+            for r in rows
+        ]
 
-    return [
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        response.headers["X-Watermark"] = watermarks.current(conn)
+        if since is None:
+            rows = queries.run(conn, Q_TIMESERIES_MONTHLY, params)
+        else:
+            buckets = watermarks.changed(conn, since, params)
+            delta = watermarks.delta_params(buckets, grain="month")
+            rows = queries.run(conn, Q_TIMESERIES_MONTHLY_DELTA, {**params, **delta}) if delta else []
+            present = {(date.fromisoformat(f"{r[0]}-01"), r[2], r[1]) for r in rows}
+            removed = watermarks.tombstones(conn, buckets, present, grain="month")
+
+    out = [
         {
             "month": r[0],
             "channel": r[1],
@@ -458,6 +848,13 @@ def sales_timeseries_monthly(
         }
         for r in rows
     ]
+    if since is None:
+        return out
+
+    return [{**row, "deleted": False} for row in out] + [
+        {"month": month.strftime("%Y-%m"), "channel": channel, "store_name": store, "revenue": 0.0, "orders": 0, "deleted": True}
+        for month, store, channel in removed
+    ]
 
 
 
@@ -465,6 +862,7 @@ def sales_timeseries_monthly(
 # 7) Detecção automática de anomalias (picos ou quedas)
 # ----------------------------------------------
 @router.get("/anomaly-detection")
+@cached()
 def anomaly_detection(
     min_orders_threshold: int = 50
 ):
@@ -473,99 +871,69 @@ def anomaly_detection(
     usando média móvel + desvio padrão.
     """
 
-    sql = """
-        SELECT
-            DATE_TRUNC('week', created_at)::date AS week,
-            SUM(total_amount) AS revenue,
-            COUNT(*) AS orders
-        FROM sales
-        WHERE sale_status_desc = 'COMPLETED'
-        GROUP BY week
-        ORDER BY week;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql)
-            data = cur.fetchall()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        data = queries.run(conn, Q_WEEKLY_REVENUE)
 
     if not data:
         return {"message": "No data available"}
 
-    revenues = [float(row[1]) for row in data]
-    mean_rev = sum(revenues) / len(revenues)
-    std_rev = (sum((x - mean_rev) ** 2 for x in revenues) / len(revenues)) ** 0.5
-
-    anomalies = []
-    for week, revenue, orders in data:
-        if orders < min_orders_threshold:
-            continue
+    revenues = np.array([float(row[1]) for row in data])
+    orders = np.array([row[2] for row in data], dtype=np.int64)
 
-        if revenue > mean_rev + (2 * std_rev):
-            anomalies.append({"week": str(week), "type": "peak", "value": revenue})
-        elif revenue < mean_rev - (2 * std_rev):
-            anomalies.append({"week": str(week), "type": "drop", "value": revenue})
+    # estatística no pool de processos quando a série é longa (services/analysis.py)
+    result = analysis.weekly_anomalies(revenues, orders, min_orders_threshold)
 
     return {
-        "mean_revenue": mean_rev,
-        "std_dev": std_rev,
-        "anomalies": anomalies
+        "mean_revenue": result["mean"],
+        "std_dev": result["std"],
+        "anomalies": [
+            {"week": str(data[i][0]), "type": kind, "value": float(data[i][1])}
+            for i, kind in result["anomalies"]
+        ]
     }
 
 @router.get("/topstats")
+@cached(scope=previous_period_scope)
 def sales_topstats(start: Optional[str] = None, end: Optional[str] = None):
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-
-            # Se houver intervalo definido, calcula período anterior
-            if start and end:
-                cur.execute("SELECT DATE(%s), DATE(%s)", (start, end))
-                start_date, end_date = cur.fetchone()
-
-                range_days = (end_date - start_date).days
-
-                prev_start = start_date - timedelta(days=range_days)
-                prev_end = end_date - timedelta(days=range_days)
-
-                cur.execute("""
-                    SELECT COALESCE(SUM(total_amount), 0)
-                    FROM sales
-                    WHERE date(created_at) BETWEEN %s AND %s
-                    AND sale_status_desc = 'COMPLETED'
-                """, (start, end))
-                current_sales = cur.fetchone()[0]
-
-                cur.execute("""
-                    SELECT COALESCE(SUM(total_amount), 0)
-                    FROM sales
-                    WHERE date(created_at) BETWEEN %s AND %s
-                    AND sale_status_desc = 'COMPLETED'
-                """, (prev_start, prev_end))
-                previous_sales = cur.fetchone()[0]
-
-            else:
-                # Sem filtro → compara com os últimos 30 dias
-                cur.execute("SELECT COALESCE(SUM(total_amount), 0) FROM sales WHERE created_at >= NOW() - INTERVAL '30 days'")
-                current_sales = cur.fetchone()[0]
-
-                cur.execute("SELECT COALESCE(SUM(total_amount), 0) FROM sales WHERE created_at < NOW() - INTERVAL '30 days' AND created_at >= NOW() - INTERVAL '60 days'")
-                previous_sales = cur.fetchone()[0]
-
-            performance = (
-                ((current_sales - previous_sales) / previous_sales) * 100
-                if previous_sales > 0 else 0
-            )
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
 
-            return {
-                "sales": float(current_sales),
-                "performance": round(performance, 2),
-            }
+        # Se houver intervalo definido, calcula período anterior
+        if start and end:
+            current = sales_filters(start, end, end_inclusive=True)
+            range_days = current["end"] - timedelta(days=1) - current["start"]
+
+            previous = dict(current)
+            previous["start"] = current["start"] - range_days
+            previous["end"] = current["end"] - range_days
+
+            current_sales = queries.run(conn, Q_REVENUE_TOTAL, current, one=True)[0]
+            previous_sales = queries.run(conn, Q_REVENUE_TOTAL, previous, one=True)[0]
+
+        else:
+            # Sem filtro → compara com os últimos 30 dias
+            current_sales = queries.run(
+                conn, Q_REVENUE_LAST_DAYS, {"from_days": 30, "to_days": 0}, one=True
+            )[0]
+            previous_sales = queries.run(
+                conn, Q_REVENUE_LAST_DAYS, {"from_days": 60, "to_days": 30}, one=True
+            )[0]
+
+        performance = (
+            ((current_sales - previous_sales) / previous_sales) * 100
+            if previous_sales > 0 else 0
+        )
+
+        return {
+            "sales": float(current_sales),
+            "performance": round(performance, 2),
+        }
 
 # ======================================================
 #  🔥 Recent Orders (últimas vendas com cliente e produtos)
 # ======================================================
 @router.get("/recent")
+@cached(ttl=30)
 def recent_orders(
     start: str,                                  # "YYYY-MM-DD"
     end: str,                                    # "YYYY-MM-DD"
@@ -580,50 +948,14 @@ def recent_orders(
     Suporta filtros por loja/canal/status, e paginação.
     """
 
-    # ---------- monta WHERE dinâmico ----------
-    where = ["s.created_at::date BETWEEN %s AND %s"]
-    params: List[object] = [start, end]
-
-    if store_id:
-        # Postgres: ANY(array)
-        where.append("s.store_id = ANY(%s)")
-        params.append(store_id)
-
-    if channel_id:
-        where.append("s.channel_id = ANY(%s)")
-        params.append(channel_id)
-
-    if status:
-        # normaliza para maiúsculo
-        status_norm = [s.upper() for s in status]
-        where.append("UPPER(s.sale_status_desc) = ANY(%s)")
-        params.append(status_norm)
+    # status normalizado para maiúsculo (vazio = todos)
+    params = sales_filters(
+        start, end, store_id, channel_id, statuses=status, end_inclusive=True
+    )
+    params.update(limit=limit, offset=offset)
 
-    where_sql = " AND ".join(where)
-
-    sales_sql = f"""
-        SELECT
-            s.id              AS sale_id,
-            s.created_at      AS created_at,
-            s.total_amount    AS total_amount,
-            c.customer_name   AS customer_name,
-            ch.name           AS channel,
-            st.name           AS store_name,
-            s.sale_status_desc AS status
-        FROM sales s
-        LEFT JOIN customers c ON c.id = s.customer_id
-        JOIN channels ch ON ch.id = s.channel_id
-        JOIN stores   st ON st.id = s.store_id
-        WHERE {where_sql}
-        ORDER BY s.created_at DESC
-        LIMIT %s OFFSET %s
-    """
-    params_ext = params + [limit, offset]
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sales_sql, params_ext)
-            sales_rows = cur.fetchall()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        sales_rows = queries.run(conn, Q_RECENT_SALES, params)
 
         if not sales_rows:
             return []
@@ -645,22 +977,7 @@ def recent_orders(
         sale_ids = [s["sale_id"] for s in sales]
 
         # ---------- busca produtos em lote ----------
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT
-                    ps.sale_id,
-                    p.name,
-                    ps.quantity,
-                    ps.total_price
-                FROM product_sales ps
-                JOIN products p ON p.id = ps.product_id
-                WHERE ps.sale_id = ANY(%s)
-                ORDER BY ps.sale_id
-                """,
-                [sale_ids],
-            )
-            prod_rows = cur.fetchall()
+        prod_rows = queries.run(conn, Q_RECENT_PRODUCTS, {"sale_ids": sale_ids})
 
         # agrupa produtos por sale_id
         by_sale = {sid: [] for sid in sale_ids}
@@ -682,77 +999,130 @@ def recent_orders(
 
 # 🔥 Trending Products (por dia da semana, horário e canal)
 @router.get("/customers/lost")
+@tabular
+@cached()
 def lost_customers(min_orders: int = 3, inactive_days: int = 30):
     """
     Clientes que fizeram >= min_orders, mas não voltam há inactive_days dias.
     """
 
-    sql = """
-        SELECT
-            c.customer_name,
-            COUNT(s.id) AS total_orders,
-            MAX(s.created_at)::date AS last_order
-        FROM sales s
-        JOIN customers c ON c.id = s.customer_id
-        GROUP BY c.customer_name
-        HAVING COUNT(s.id) >= %s
-        AND MAX(s.created_at) <= NOW() - INTERVAL '%s DAYS'
-        ORDER BY last_order ASC;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, (min_orders, inactive_days))
-            rows = cur.fetchall()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        rows = queries.run(
+            conn,
+            Q_LOST_CUSTOMERS,
+            {"min_orders": min_orders, "inactive_days": inactive_days},
+        )
 
     return [
         {"customer": r[0], "total_orders": r[1], "last_order": r[2].isoformat()}
         for r in rows
     ]
-@router.get("/ticket")
-def ticket_avg(
+
+
+# ======================================================
+# Coortes de aquisição × retenção mensal
+# ======================================================
+def _month_index(d) -> int:
+    return d.year * 12 + d.month - 1
+
+
+@router.get("/cohorts")
+@tabular
+@cached(scope=all_days_scope)   # start/end só escolhem as coortes; a retenção usa os meses seguintes
+def customer_cohorts(
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
     store_id: Optional[List[int]] = Query(None),
     channel_id: Optional[List[int]] = Query(None),
 ):
     """
-    Ticket médio agrupado por Loja e Canal.
+    Matriz de retenção: para cada coorte (mês da primeira compra COMPLETED
+    nas lojas/canais do filtro) e cada período (meses depois dela), clientes
+    ativos e fração da coorte. `start`/`end` limitam os meses de coorte.
+    Vem dos bitmaps mensais por cliente (services/cohorts.py).
     """
+    params = sales_filters(start, end, store_id, channel_id, end_inclusive=True)
+
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        rows = queries.run(conn, cohorts.Q_ACTIVITY, params)
+
+    result = analysis.cohort_matrix(
+        np.array([r[0] for r in rows], np.int64),
+        np.array([r[1] for r in rows], np.int64),
+        np.array([r[2] for r in rows], np.int64),
+    )
+    lo = _month_index(params["start"]) if params["start"] else None
+    hi = _month_index(params["end"] - timedelta(days=1)) if params["end"] else None
+
+    out = []
+    for c, month in enumerate(result["cohorts"]):
+        month = int(month)
+        if (lo is not None and month < lo) or (hi is not None and month > hi):
+            continue
+        size = int(result["matrix"][c, 0])
+        for period in range(result["last_month"] - month + 1):   # só períodos já observados
+            active = int(result["matrix"][c, period])
+            out.append({
+                "cohort": f"{month // 12:04d}-{month % 12 + 1:02d}",
+                "period": period,
+                "cohort_size": size,
+                "customers": active,
+                "retention": round(active / size, 4),
+            })
+    return out
 
-    where = ["1=1"]
-    params: List[object] = []
-
-    if store_id:
-        where.append("s.store_id = ANY(%s)")
-        params.append(store_id)
-
-    if channel_id:
-        where.append("s.channel_id = ANY(%s)")
-        params.append(channel_id)
 
-    sql = f"""
-        SELECT
-            st.name AS store_name,
-            ch.name AS channel_name,
-            ROUND(AVG(s.total_amount), 2) AS avg_ticket
-        FROM sales s
-        JOIN stores st ON st.id = s.store_id
-        JOIN channels ch ON ch.id = s.channel_id
-        WHERE {' AND '.join(where)}
-        GROUP BY st.name, ch.name
-        ORDER BY avg_ticket DESC;
+@router.get("/ticket")
+@tabular
+@cached(views=(MV_TICKET,))
+def ticket_avg(
+    response: Response,
+    store_id: Optional[List[int]] = Query(None),
+    channel_id: Optional[List[int]] = Query(None),
+    since: Optional[str] = SINCE,
+):
+    """
+    Ticket médio agrupado por Loja e Canal.
+    O watermark é o snapshot do último refresh da view (não o momento da leitura).
     """
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-
-    return [
+    params = sales_filters(store_ids=store_id, channel_ids=channel_id, statuses=None)
+    watermark = matviews.watermark(MV_TICKET)
+
+    delta = since is not None and watermark is not None
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        if not delta:
+            rows = queries.run(conn, Q_TICKET, params)
+        else:
+            buckets = watermarks.changed(conn, since, params)
+            pairs = sorted({(st, ch) for st, ch, _ in buckets})
+            rows = queries.run(conn, Q_TICKET_DELTA, {
+                **params,
+                "bucket_store_ids": [p[0] for p in pairs],
+                "bucket_channel_ids": [p[1] for p in pairs],
+            }) if pairs else []
+            present = {(None, r[0], r[1]) for r in rows}
+            removed = watermarks.tombstones(conn, buckets, present, grain="store_channel")
+
+    _set_as_of(response, MV_TICKET)
+    if watermark is not None:
+        response.headers["X-Watermark"] = watermark
+
+    out = [
         {"store": r[0], "channel": r[1], "ticket": float(r[2] or 0)}
         for r in rows
     ]
+    if not delta:
+        return out
+
+    return [{**row, "deleted": False} for row in out] + [
+        {"store": store, "channel": channel, "ticket": 0.0, "deleted": True}
+        for _, store, channel in removed
+    ]
 
 @router.get("/delivery/performance")
+@tabular
+@cached()
 def delivery_performance(
     start: Optional[str] = Query(None),
     end: Optional[str] = Query(None),
@@ -760,61 +1130,28 @@ def delivery_performance(
     channel_id: Optional[List[int]] = Query(None),
 ):
     """
-    Tempo médio de entrega agrupado por dia da semana e hora.
+    Tempo médio (e p90 aproximado) de entrega por dia da semana e hora,
+    somando os cubos semanais (services/delivery_cube.py).
     """
 
-    where = ["s.delivery_seconds IS NOT NULL"]
-    params: List[object] = []
-
-    # filtro por período
-    if start and end:
-        where.append("s.created_at::date BETWEEN %s AND %s")
-        params.extend([start, end])
+    # filtro por período só quando ambos os limites vierem
+    if not (start and end):
+        start = end = None
 
-    # filtro store_id
-    if store_id:
-        where.append("s.store_id = ANY(%s)")
-        params.append(store_id)
+    params = sales_filters(
+        start, end, store_id, channel_id, statuses=None, end_inclusive=True
+    )
 
-    # filtro channel_id
-    if channel_id:
-        where.append("s.channel_id = ANY(%s)")
-        params.append(channel_id)
-
-    sql = f"""
-        SELECT
-            EXTRACT(DOW FROM s.created_at) AS weekday,
-            EXTRACT(HOUR FROM s.created_at) AS hour,
-            ROUND(AVG(s.delivery_seconds) / 60.0, 2) AS avg_delivery_minutes
-        FROM sales s
-        WHERE {" AND ".join(where)}
-        GROUP BY weekday, hour
-        ORDER BY weekday, hour;
-    """
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        cube = delivery_cube.fold(conn, params)
 
-    print("\n--- SQL DEBUG ---")
-    print(sql)
-    print("PARAMS:", params)
-    print("--- END DEBUG ---\n")
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-
-    return [
-        {
-            "weekday": int(r[0]),
-            "hour": int(r[1]),
-            "avg_delivery_minutes": float(r[2]),
-        }
-        for r in rows
-    ]
+    return delivery_cube.heatmap(cube)
 
 
 
-# backend/app/routers/sales.py
 @router.get("/products/trending")
+@tabular
+@cached()
 def trending_products(
     start: Optional[str] = None,                 # ✅ FILTRO DE PERÍODO
     end: Optional[str] = None,
@@ -834,48 +1171,17 @@ def trending_products(
     ✅ canal
     """
 
-    where = ["1=1"]
-    params: List[object] = []
-
-    if start and end:
-        where.append("DATE(s.created_at) BETWEEN %s AND %s")
-        params.extend([start, end])
-
-    if weekday is not None:
-        where.append("EXTRACT(DOW FROM s.created_at) = %s")
-        params.append(weekday)
+    if not (start and end):
+        start = end = None
 
-    if start_hour is not None and end_hour is not None:
-        where.append("EXTRACT(HOUR FROM s.created_at) BETWEEN %s AND %s")
-        params.extend([start_hour, end_hour])
+    params = sales_filters(
+        start, end, store_id, channel_id, statuses=None, end_inclusive=True
+    )
+    params.update(_trending_params(weekday, start_hour, end_hour))
+    params["limit"] = limit
 
-    if store_id:
-        where.append("s.store_id = ANY(%s)")
-        params.append(store_id)
-
-    if channel_id:
-        where.append("s.channel_id = ANY(%s)")
-        params.append(channel_id)
-
-    sql = f"""
-        SELECT
-            p.name,
-            SUM(ps.quantity) AS qty,
-            SUM(ps.total_price) AS revenue
-        FROM product_sales ps
-        JOIN products p ON p.id = ps.product_id
-        JOIN sales s ON s.id = ps.sale_id
-        WHERE {' AND '.join(where)}
-        GROUP BY p.name
-        ORDER BY qty DESC
-        LIMIT %s;
-    """
-    params.append(limit)
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        rows = queries.run(conn, Q_TRENDING, params)
 
     return [
         {"product": r[0], "qty": int(r[1]), "revenue": float(r[2])}
@@ -883,8 +1189,8 @@ def trending_products(
     ]
 
 
-# backend/app/routers/sales.py
 @router.get("/products/trending/hourly")
+@cached()
 def trending_products_hourly(
     start: Optional[str] = None,
     end: Optional[str] = None,
@@ -900,60 +1206,34 @@ def trending_products_hourly(
         (23, 24)
     ]
 
+    if not (start and end):
+        start = end = None
+
+    base = sales_filters(
+        start, end, store_id, channel_id, statuses=None, end_inclusive=True
+    )
+
     results = []
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            for start_hour, end_hour in HOUR_BUCKETS:
-                where = ["1=1"]
-                params: List[object] = []
-
-                if start and end:
-                    where.append("DATE(s.created_at) BETWEEN %s AND %s")
-                    params.extend([start, end])
-
-                where.append("EXTRACT(HOUR FROM s.created_at) BETWEEN %s AND %s")
-                params.extend([start_hour, end_hour - 1])
-
-                if store_id:
-                    where.append("s.store_id = ANY(%s)")
-                    params.append(store_id)
-
-                if channel_id:
-                    where.append("s.channel_id = ANY(%s)")
-                    params.append(channel_id)
-
-                base_sql = f"""
-                    FROM product_sales ps
-                    JOIN products p ON p.id = ps.product_id
-                    JOIN sales s ON s.id = ps.sale_id
-                    WHERE {' AND '.join(where)}
-                    GROUP BY p.name
-                """
-
-                cur.execute(
-                    "SELECT p.name, SUM(ps.quantity) AS qty " + base_sql + " ORDER BY qty DESC LIMIT 1",
-                    params
-                )
-                best = cur.fetchone()
-
-                cur.execute(
-                    "SELECT p.name, SUM(ps.quantity) AS qty " + base_sql + " ORDER BY qty ASC LIMIT 1",
-                    params
-                )
-                worst = cur.fetchone()
-
-                results.append({
-                    "start_hour": start_hour,
-                    "end_hour": end_hour,
-                    "top_product": {"product": best[0], "qty": int(best[1])} if best else None,
-                    "worst_product": {"product": worst[0], "qty": int(worst[1])} if worst else None,
-                })
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        for start_hour, end_hour in HOUR_BUCKETS:
+            params = {**base, **_trending_params(None, start_hour, end_hour - 1)}
+
+            best = queries.run(conn, Q_TRENDING_BEST, params, one=True)
+            worst = queries.run(conn, Q_TRENDING_WORST, params, one=True)
+
+            results.append({
+                "start_hour": start_hour,
+                "end_hour": end_hour,
+                "top_product": {"product": best[0], "qty": int(best[1])} if best else None,
+                "worst_product": {"product": worst[0], "qty": int(worst[1])} if worst else None,
+            })
 
     return results
 
-# backend/app/routers/sales.py
 @router.get("/products/not-selling")
+@tabular
+@cached()
 def products_not_selling(
     store_id: Optional[List[int]] = Query(None),
     channel_id: Optional[List[int]] = Query(None),
@@ -963,47 +1243,10 @@ def products_not_selling(
     + quantos dias estão sem vender.
     """
 
-    sql_filters = []
-    params: list[Any] = []
-
-    if store_id:
-        sql_filters.append("s.store_id = ANY(%s)")
-        params.append(store_id)
-
-    if channel_id:
-        sql_filters.append("s.channel_id = ANY(%s)")
-        params.append(channel_id)
-
-    where = " AND ".join(sql_filters) if sql_filters else "1=1"
-
-    sql = f"""
-        WITH last_sales AS (
-            SELECT
-                p.id,
-                p.name,
-                MAX(s.created_at) AS last_sale
-            FROM products p
-            LEFT JOIN product_sales ps ON ps.product_id = p.id
-            LEFT JOIN sales s ON s.id = ps.sale_id AND {where}
-            GROUP BY p.id, p.name
-        )
-        SELECT
-            id,
-            name,
-            last_sale,
-            COALESCE(
-                DATE_PART('day', NOW() - last_sale),
-                DATE_PART('day', NOW() - NOW())
-            ) AS days_without_sale
-        FROM last_sales
-        WHERE last_sale IS NULL OR last_sale < NOW() - INTERVAL '30 days'
-        ORDER BY days_without_sale DESC;
-    """
+    params = sales_filters(store_ids=store_id, channel_ids=channel_id, statuses=None)
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            result = cur.fetchall()
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        result = queries.run(conn, Q_NOT_SELLING, params)
 
     return [
         {
@@ -1014,3 +1257,111 @@ def products_not_selling(
         }
         for row in result
     ]
+
+
+# ======================================================
+# Produtos comprados juntos
+# ======================================================
+@router.get("/products/affinity")
+@tabular
+@cached()
+def product_affinity(
+    product_id: int,
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+    store_id: Optional[List[int]] = Query(None),
+    channel_id: Optional[List[int]] = Query(None),
+    limit: int = Query(10, ge=1, le=100),
+    min_orders: int = Query(3, ge=1, description="mínimo de pedidos com os dois produtos"),
+    sort: str = Query("lift", pattern="^(lift|confidence|support)$"),
+):
+    """
+    Top parceiros de um produto nos pedidos COMPLETED: support (fração dos
+    pedidos com os dois), confidence (dos pedidos com o produto, quantos têm
+    o parceiro) e lift (confidence / frequência do parceiro). Vem do índice
+    semanal de coocorrência (services/affinity.py).
+    """
+    params = sales_filters(start, end, store_id, channel_id, end_inclusive=True)
+
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        inputs = affinity.fold(conn, params, product_id)
+        ranked = analysis.affinity_rank(
+            **inputs, product_id=product_id, min_orders=min_orders, sort=sort, limit=limit
+        )
+        ids = [p["product_id"] for p in ranked["partners"]]
+        names = dict(queries.run(conn, Q_PRODUCT_NAMES, {"product_ids": ids})) if ids else {}
+
+    return [
+        {
+            "product_id": p["product_id"],
+            "product": names.get(p["product_id"]),
+            "orders_together": p["orders_together"],
+            "support": round(p["support"], 4),
+            "confidence": round(p["confidence"], 4),
+            "lift": round(p["lift"], 2),
+        }
+        for p in ranked["partners"]
+    ]
+
+
+# ======================================================
+# Previsão diária por loja × canal
+# ======================================================
+@router.get("/forecast")
+@tabular
+def sales_forecast(
+    response: Response,
+    horizon: int = Query(14, ge=1, le=settings.FORECAST_MAX_HORIZON_DAYS),
+    store_id: Optional[List[int]] = Query(None),
+    channel_id: Optional[List[int]] = Query(None),
+):
+    """
+    Faturamento e pedidos previstos para os próximos `horizon` dias (a partir
+    de hoje), por loja e canal. Lê o modelo já ajustado em memória
+    (services/forecast.py); X-Forecast-Through = último dia fechado usado.
+    """
+    model = forecast.current()
+    if model is None and not forecast.ready():
+        raise HTTPException(
+            status_code=503,
+            detail="Previsão ainda sendo ajustada",
+            headers={"Retry-After": str(settings.QUERY_RETRY_AFTER_SECONDS)},
+        )
+    if model is None:
+        raise HTTPException(status_code=404, detail="Histórico insuficiente para previsão")
+
+    response.headers["X-Forecast-Through"] = model.through.isoformat()
+    return forecast.predict(model, horizon, store_id or [], channel_id or [])
+
+
+# ======================================================
+# KPIs de hoje ao vivo (Server-Sent Events)
+# ======================================================
+@router.get("/live")
+async def live_kpis(
+    request: Request,
+    store_id: Optional[List[int]] = Query(None),
+    channel_id: Optional[List[int]] = Query(None),
+):
+    """
+    Stream SSE com faturamento, pedidos, ticket e cancelamentos de hoje e o
+    produto mais vendido da hora. Primeiro um `snapshot`, depois um `update`
+    (totais + delta) a cada lote de vendas novas.
+    """
+    return StreamingResponse(
+        live.stream(store_id, channel_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ======================================================
+# Freshness das materialized views ("as of" para a UI)
+# ======================================================
+@router.get("/freshness")
+def views_freshness():
+    """
+    Horário do último refresh de cada view, duração e contadores
+    (refreshes feitos / pulados por não haver vendas novas).
+    """
+    return matviews.freshness()
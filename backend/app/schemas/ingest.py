@@ -0,0 +1,104 @@
+# backend/app/schemas/ingest.py
+from datetime import datetime, timezone
+from decimal import Decimal
+from pydantic import BaseModel, TypeAdapter, field_validator
+from typing import Optional
+
+
+class IngestItem(BaseModel):
+    item_id: int
+    option_group_id: Optional[int] = None
+    quantity: float = 1
+    additional_price: float = 0
+    price: float = 0
+    amount: float = 1
+
+
+class IngestProduct(BaseModel):
+    product_id: int
+    quantity: float
+    base_price: float
+    total_price: float
+    observations: Optional[str] = None
+    items: list[IngestItem] = []
+
+
+class IngestAddress(BaseModel):
+    street: Optional[str] = None
+    number: Optional[str] = None
+    complement: Optional[str] = None
+    neighborhood: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    postal_code: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+class IngestDelivery(BaseModel):
+    courier_name: Optional[str] = None
+    courier_phone: Optional[str] = None
+    courier_type: Optional[str] = None
+    delivery_type: Optional[str] = None
+    status: Optional[str] = None
+    delivery_fee: Optional[float] = None
+    courier_fee: Optional[float] = None
+    address: Optional[IngestAddress] = None
+
+
+class IngestPayment(BaseModel):
+    payment_type_id: Optional[int] = None
+    value: Decimal
+    is_online: bool = False
+
+
+class IngestSale(BaseModel):
+    store_id: int
+    channel_id: int
+    customer_id: Optional[int] = None
+    customer_name: Optional[str] = None
+    cod_sale1: Optional[str] = None          # id do pedido no PDV / marketplace
+    created_at: datetime
+    sale_status_desc: str = "COMPLETED"
+    total_amount_items: Decimal
+    total_discount: Decimal = Decimal(0)
+    total_increase: Decimal = Decimal(0)
+    delivery_fee: Decimal = Decimal(0)
+    service_tax_fee: Decimal = Decimal(0)
+    total_amount: Decimal
+    value_paid: Decimal = Decimal(0)
+    production_seconds: Optional[int] = None
+    delivery_seconds: Optional[int] = None
+    people_quantity: Optional[int] = None
+    discount_reason: Optional[str] = None
+    origin: str = "POS"
+    products: list[IngestProduct] = []
+    delivery: Optional[IngestDelivery] = None
+    payments: list[IngestPayment] = []
+
+    @field_validator("created_at")
+    @classmethod
+    def naive_utc(cls, v: datetime) -> datetime:
+        # sales.created_at é "timestamp without time zone"
+        if v.tzinfo is not None:
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        return v
+
+    @field_validator("sale_status_desc")
+    @classmethod
+    def upper_status(cls, v: str) -> str:
+        return v.upper()
+
+
+# validação do lote inteiro de uma vez (pydantic-core, sem loop em Python)
+SalesBatch = TypeAdapter(list[IngestSale])
+
+
+class IngestResult(BaseModel):
+    accepted: int
+    sale_ids: list[int]
+    products: int
+    items: int
+    payments: int
+    deliveries: int
+    duration_ms: float
@@ -0,0 +1,30 @@
+# backend/app/schemas/query.py
+from datetime import date
+from pydantic import BaseModel, Field
+from typing import Any, Literal, Optional
+
+Measure = Literal["revenue", "orders", "qty", "avg_ticket", "p90_delivery"]
+Dimension = Literal["day", "week", "hour", "dow", "store", "channel", "product", "city"]
+
+
+class QueryFilters(BaseModel):
+    start: Optional[date] = None          # inclusivo
+    end: Optional[date] = None            # inclusivo
+    store_id: list[int] = []
+    channel_id: list[int] = []
+    product_id: list[int] = []
+    status: list[str] = ["COMPLETED"]     # [] = todos
+
+
+class MetricsQuery(BaseModel):
+    measures: list[Measure] = Field(..., min_length=1)
+    dimensions: list[Dimension] = []
+    filters: QueryFilters = QueryFilters()
+    order_by: Optional[str] = None        # medida ou dimensão; "-revenue" = decrescente
+    limit: int = Field(default=1000, ge=1, le=10000)
+
+
+class MetricsResult(BaseModel):
+    source: str                           # tabela escolhida pelo planner
+    as_of: Optional[str] = None           # refresh da view usada (None = dado ao vivo)
+    data: list[dict[str, Any]]
@@ -0,0 +1,293 @@
+# backend/app/services/affinity.py
+"""
+Índice de coocorrência de produtos ("comprados juntos").
+
+Uma linha por (semana, loja, canal) em `product_affinity_weekly`, só com
+vendas COMPLETED e produtos distintos por pedido:
+  - orders:   pedidos com ao menos um produto
+  - products: ids (uint32, ordenados) ‖ pedidos com o produto (uint32)
+  - pairs:    chaves a << 32 | b (uint64, ordenadas) ‖ pedidos com a e b (uint32)
+
+Cada par é gravado nas duas orientações, então os parceiros de um produto
+são um trecho contíguo das chaves (busca binária por blob, sem varrer a
+matriz). Tudo é somável: o período é a soma das semanas inteiras do
+índice mais as pontas (semanas parciais) calculadas das vendas brutas —
+nas pontas, só os pares do produto pedido. Períodos de segunda a domingo
+(ou sem período) não tocam as vendas.
+
+Mantido pela ingestão como os demais rollups (services/rollups.py); dados
+carregados por fora exigem
+`python -m app.services.rollups --rebuild --only product_affinity_weekly`.
+"""
+
+from datetime import date
+from typing import Optional
+
+import numpy as np
+
+from .. import queries
+from ..queries import SALES_WHERE
+from .delivery_cube import _monday, _next_monday
+
+TABLE = "product_affinity_weekly"
+
+ID_DTYPE = np.dtype("<u4")
+KEY_DTYPE = np.dtype("<u8")
+COUNT_DTYPE = np.dtype("<u4")
+
+DDL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        week       DATE NOT NULL,          -- segunda-feira (DATE_TRUNC('week'))
+        store_id   INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        orders     INTEGER NOT NULL,
+        products   BYTEA NOT NULL,
+        pairs      BYTEA NOT NULL,
+        PRIMARY KEY (week, store_id, channel_id)
+    )
+"""
+
+# produtos distintos por pedido; `{where}` filtra o lote / o período
+_BASKETS = """
+    WITH items AS (
+        SELECT DISTINCT
+            DATE_TRUNC('week', s.created_at)::date AS week,
+            s.store_id,
+            s.channel_id,
+            ps.sale_id,
+            ps.product_id
+        FROM product_sales ps
+        JOIN sales s ON s.id = ps.sale_id
+        WHERE s.sale_status_desc = 'COMPLETED' {where}
+    )
+"""
+
+# product_id NULL = total de pedidos do bucket
+_PRODUCTS_SQL = _BASKETS + """
+    SELECT week, store_id, channel_id, product_id, COUNT(DISTINCT sale_id)
+    FROM items
+    GROUP BY GROUPING SETS ((week, store_id, channel_id, product_id), (week, store_id, channel_id))
+"""
+
+_PAIRS_SQL = _BASKETS + """
+    SELECT a.week, a.store_id, a.channel_id,
+           (a.product_id::bigint << 32) | b.product_id,
+           COUNT(*)
+    FROM items a
+    JOIN items b ON b.sale_id = a.sale_id AND b.product_id <> a.product_id
+    GROUP BY 1, 2, 3, 4
+"""
+
+_BATCH_WHERE = "AND s.id = ANY(%(sale_ids)s::int[])"
+
+Q_BLOBS = queries.register("affinity_weeks", f"""
+    SELECT r.orders, r.products, r.pairs
+    FROM {TABLE} r
+    WHERE (%(weeks_from)s::date IS NULL OR r.week >= %(weeks_from)s::date)
+      AND (%(weeks_to)s::date IS NULL OR r.week < %(weeks_to)s::date)
+      AND (cardinality(%(store_ids)s::int[]) = 0 OR r.store_id = ANY(%(store_ids)s::int[]))
+      AND (cardinality(%(channel_ids)s::int[]) = 0 OR r.channel_id = ANY(%(channel_ids)s::int[]))
+""")
+
+# pontas do período, direto das vendas, numa passada: por produto, pedidos
+# com ele e pedidos com ele e o produto pedido; product_id NULL = total de pedidos
+Q_EDGE = queries.register("affinity_edge", f"""
+    WITH items AS (
+        SELECT DISTINCT ps.sale_id, ps.product_id
+        FROM product_sales ps
+        JOIN sales s ON s.id = ps.sale_id
+        WHERE s.sale_status_desc = 'COMPLETED' AND {SALES_WHERE}
+    ),
+    with_product AS (
+        SELECT sale_id FROM items WHERE product_id = %(product_id)s
+    )
+    SELECT i.product_id, COUNT(DISTINCT i.sale_id), COUNT(w.sale_id)
+    FROM items i
+    LEFT JOIN with_product w ON w.sale_id = i.sale_id
+    GROUP BY GROUPING SETS ((i.product_id), ())
+""")
+
+
+# ------------------------------------------------------
+# Blob: chaves ordenadas ‖ contagens
+# ------------------------------------------------------
+def encode(keys: np.ndarray, counts: np.ndarray, key_dtype: np.dtype) -> bytes:
+    if counts.max(initial=0) > np.iinfo(COUNT_DTYPE).max:
+        raise OverflowError("Contagem do índice de afinidade acima de uint32")
+    return keys.astype(key_dtype).tobytes() + counts.astype(COUNT_DTYPE).tobytes()
+
+
+def decode(blob: bytes, key_dtype: np.dtype) -> tuple[np.ndarray, np.ndarray]:
+    n, rest = divmod(len(blob), key_dtype.itemsize + COUNT_DTYPE.itemsize)
+    if rest:
+        raise ValueError(f"Blob de afinidade com {len(blob)} bytes: rode o rebuild")
+    split = n * key_dtype.itemsize
+    return np.frombuffer(blob, key_dtype, n), np.frombuffer(blob, COUNT_DTYPE, n, split)
+
+
+def merge(keys: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Soma contagens de chaves repetidas; devolve chaves ordenadas"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    total = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(total, inverse, counts)
+    return unique, total
+
+
+_LOW = np.uint64(0xFFFFFFFF)     # b de uma chave a << 32 | b
+
+
+def partners(pair_keys: np.ndarray, product_id: int) -> slice:
+    """Trecho das chaves (ordenadas) com pares a = product_id"""
+    lo = np.searchsorted(pair_keys, np.uint64(product_id) << np.uint64(32))
+    hi = np.searchsorted(pair_keys, np.uint64(product_id + 1) << np.uint64(32))
+    return slice(int(lo), int(hi))
+
+
+class _Bucket:
+    __slots__ = ("orders", "product_ids", "product_counts", "pair_keys", "pair_counts")
+
+    def __init__(self):
+        self.orders = 0
+        self.product_ids, self.product_counts = [], []
+        self.pair_keys, self.pair_counts = [], []
+
+    def arrays(self):
+        products = merge(np.array(self.product_ids, np.int64), np.array(self.product_counts, np.int64))
+        pairs = merge(np.array(self.pair_keys, np.uint64), np.array(self.pair_counts, np.int64))
+        return products, pairs
+
+
+def _build(product_rows, pair_rows) -> dict[tuple, _Bucket]:
+    """Linhas de _PRODUCTS_SQL / _PAIRS_SQL → bucket por (semana, loja, canal)"""
+    buckets: dict[tuple, _Bucket] = {}
+    for week, store_id, channel_id, product_id, n in product_rows:
+        b = buckets.setdefault((week, store_id, channel_id), _Bucket())
+        if product_id is None:
+            b.orders += n
+        else:
+            b.product_ids.append(product_id)
+            b.product_counts.append(n)
+    for week, store_id, channel_id, key, n in pair_rows:
+        b = buckets[(week, store_id, channel_id)]
+        b.pair_keys.append(key)
+        b.pair_counts.append(n)
+    return buckets
+
+
+def _fetch(conn, where: str, params: dict) -> dict[tuple, _Bucket]:
+    products = conn.execute(_PRODUCTS_SQL.format(where=where), params).fetchall()
+    pairs = conn.execute(_PAIRS_SQL.format(where=where), params).fetchall()
+    return _build(products, pairs)
+
+
+def _add(a: bytes, b: bytes, key_dtype: np.dtype) -> bytes:
+    (keys_a, counts_a), (keys_b, counts_b) = decode(a, key_dtype), decode(b, key_dtype)
+    return encode(*merge(np.concatenate([keys_a, keys_b]), np.concatenate([counts_a, counts_b])), key_dtype)
+
+
+def _row(b: _Bucket) -> tuple:
+    (ids, id_counts), (keys, key_counts) = b.arrays()
+    return b.orders, encode(ids, id_counts, ID_DTYPE), encode(keys, key_counts, KEY_DTYPE)
+
+
+# ------------------------------------------------------
+# Manutenção (chamada por services/rollups.py)
+# ------------------------------------------------------
+def backfill(conn):
+    buckets = _fetch(conn, "", {})
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY {TABLE} (week, store_id, channel_id, orders, products, pairs) FROM STDIN") as copy:
+            for key, b in buckets.items():
+                copy.write_row((*key, *_row(b)))
+
+
+def apply(conn, sale_ids: list[int]):
+    """Soma os pedidos do lote nos índices das suas semanas (na transação do chamador)"""
+    buckets = _fetch(conn, _BATCH_WHERE, {"sale_ids": sale_ids})
+
+    # ordem fixa das chaves: lotes concorrentes travam as linhas na mesma ordem
+    for key, b in sorted(buckets.items()):
+        orders, products, pairs = _row(b)
+        inserted = conn.execute(
+            f"INSERT INTO {TABLE} (week, store_id, channel_id, orders, products, pairs) "
+            "VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING RETURNING 1",
+            [*key, orders, products, pairs],
+        ).fetchone()
+        if inserted:
+            continue
+        old_orders, old_products, old_pairs = conn.execute(
+            f"SELECT orders, products, pairs FROM {TABLE} "
+            "WHERE week = %s AND store_id = %s AND channel_id = %s FOR UPDATE",
+            key,
+        ).fetchone()
+        conn.execute(
+            f"UPDATE {TABLE} SET orders = %s, products = %s, pairs = %s "
+            "WHERE week = %s AND store_id = %s AND channel_id = %s",
+            [
+                old_orders + orders,
+                _add(old_products, products, ID_DTYPE),
+                _add(old_pairs, pairs, KEY_DTYPE),
+                *key,
+            ],
+        )
+
+
+# ------------------------------------------------------
+# Consulta
+# ------------------------------------------------------
+def fold(conn, params: dict, product_id: int) -> dict:
+    """
+    Entradas de analysis.affinity_rank para os filtros de sales_filters
+    (start inclusivo, end exclusivo, store_ids, channel_ids): pedidos, contagens
+    por produto e os pares de `product_id`, sem somar (chaves podem repetir).
+    """
+    start: Optional[date] = params["start"]
+    end: Optional[date] = params["end"]
+    weeks_from = _next_monday(start) if start else None
+    weeks_to = _monday(end) if end else None
+
+    edges: list[tuple[Optional[date], Optional[date]]] = []
+    if weeks_from and weeks_to and weeks_from >= weeks_to:
+        edges.append((start, end))                 # período menor que uma semana inteira
+        weeks = False
+    else:
+        weeks = True
+        if start and start < weeks_from:
+            edges.append((start, weeks_from))
+        if end and weeks_to < end:
+            edges.append((weeks_to, end))
+
+    orders = 0
+    product_ids, product_counts, partner_ids, partner_counts = [], [], [], []
+    if weeks:
+        blobs = queries.run(conn, Q_BLOBS, {**params, "weeks_from": weeks_from, "weeks_to": weeks_to})
+        for n, products, pairs in blobs:
+            orders += n
+            ids, counts = decode(products, ID_DTYPE)
+            product_ids.append(ids)
+            product_counts.append(counts)
+            keys, counts = decode(pairs, KEY_DTYPE)
+            own = partners(keys, product_id)
+            partner_ids.append(keys[own] & _LOW)
+            partner_counts.append(counts[own])
+
+    for lo, hi in edges:
+        rows = queries.run(conn, Q_EDGE, {**params, "start": lo, "end": hi, "product_id": product_id})
+        orders += sum(n for pid, n, _ in rows if pid is None)
+        counted = [(pid, n, together) for pid, n, together in rows if pid is not None]
+        product_ids.append(np.array([r[0] for r in counted], np.int64))
+        product_counts.append(np.array([r[1] for r in counted], np.int64))
+        paired = [r for r in counted if r[2] and r[0] != product_id]
+        partner_ids.append(np.array([r[0] for r in paired], np.int64))
+        partner_counts.append(np.array([r[2] for r in paired], np.int64))
+
+    def cat(parts: list, dtype) -> np.ndarray:
+        return np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype)
+
+    return {
+        "orders": orders,
+        "product_ids": cat(product_ids, np.int64),
+        "product_counts": cat(product_counts, np.int64),
+        "partner_ids": cat(partner_ids, np.int64),
+        "partner_counts": cat(partner_counts, np.int64),
+    }
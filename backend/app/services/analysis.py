@@ -0,0 +1,191 @@
+# backend/app/services/analysis.py
+"""
+Etapas de CPU dos endpoints, executáveis no pool de processos (app/compute.py).
+
+Recebem e devolvem arrays NumPy / estruturas simples (nada de conexão ou
+request): o worker importa este módulo pelo nome, então ele deve continuar
+leve — sem importar routers nem o pool do banco.
+"""
+
+import numpy as np
+
+from ..compute import offloadable
+
+
+@offloadable()
+def weekly_anomalies(revenue: np.ndarray, orders: np.ndarray, min_orders: int) -> dict:
+    """
+    Semanas com receita fora de média ± 2 desvios (populacional).
+    Devolve índices das semanas e o tipo (peak / drop).
+    """
+    mean = float(revenue.mean())
+    std = float(revenue.std())
+    eligible = orders >= min_orders
+    peaks = np.flatnonzero(eligible & (revenue > mean + 2 * std))
+    drops = np.flatnonzero(eligible & (revenue < mean - 2 * std))
+    flagged = sorted([(int(i), "peak") for i in peaks] + [(int(i), "drop") for i in drops])
+    return {"mean": mean, "std": std, "anomalies": flagged}
+
+
+@offloadable()
+def affinity_rank(
+    orders: int,
+    product_ids: np.ndarray,
+    product_counts: np.ndarray,
+    partner_ids: np.ndarray,
+    partner_counts: np.ndarray,
+    product_id: int,
+    min_orders: int,
+    sort: str,
+    limit: int,
+) -> dict:
+    """
+    Parceiros de `product_id` com support, confidence e lift (entradas de
+    services/affinity.fold, ainda com ids repetidos por semana/loja/canal).
+    """
+    ids, inverse = np.unique(product_ids, return_inverse=True)
+    counts = np.zeros(len(ids), dtype=np.int64)
+    np.add.at(counts, inverse, product_counts)
+    at = np.searchsorted(ids, product_id)
+    base = int(counts[at]) if at < len(ids) and ids[at] == product_id else 0
+
+    partners, inverse = np.unique(partner_ids, return_inverse=True)
+    together = np.zeros(len(partners), dtype=np.int64)
+    np.add.at(together, inverse, partner_counts)
+    keep = together >= max(min_orders, 1)
+    partners, together = partners[keep], together[keep]
+
+    if not (orders and base and len(partners)):
+        return {"orders": orders, "product_orders": base, "partners": []}
+
+    partner_orders = counts[np.searchsorted(ids, partners)]
+    support = together / orders
+    confidence = together / base
+    lift = confidence / (partner_orders / orders)
+    key = {"support": support, "confidence": confidence, "lift": lift}[sort]
+    top = np.lexsort((-together, -key))[:limit]         # empate: mais pedidos juntos primeiro
+
+    return {
+        "orders": orders,
+        "product_orders": base,
+        "partners": [
+            {
+                "product_id": int(partners[i]),
+                "orders_together": int(together[i]),
+                "support": float(support[i]),
+                "confidence": float(confidence[i]),
+                "lift": float(lift[i]),
+            }
+            for i in top
+        ],
+    }
+
+
+# ------------------------------------------------------
+# Previsão diária (services/forecast.py)
+# ------------------------------------------------------
+# Holt-Winters com tendência amortecida e sazonalidade semanal multiplicativa.
+# Todas as séries e todas as combinações da grade andam juntas: estado [G, N]
+# (G combinações × N séries); cada série usa a combinação de menor erro.
+SEASON = 7
+WARMUP_DAYS = 2 * SEASON            # duas semanas para o estado inicial
+PHI = 0.9                           # amortecimento da tendência
+_GRID = np.array([
+    (alpha, beta, gamma)
+    for alpha in (0.05, 0.1, 0.2, 0.3, 0.5)
+    for beta in (0.0, 0.02, 0.05, 0.1)
+    for gamma in (0.05, 0.1, 0.2, 0.3)
+])
+_EPS = 1e-9
+
+
+def _smooth(state: dict, y: np.ndarray, weekdays: np.ndarray) -> dict:
+    """Avança o estado dia a dia (y: [D, N]); acumula o erro de 1 passo"""
+    level, trend, season, sse = (state[k].copy() for k in ("level", "trend", "season", "sse"))
+    alpha, beta, gamma = (_GRID[:, i, None] for i in range(3))
+    for t, w in enumerate(weekdays):
+        s = season[:, :, w]
+        base = level + PHI * trend
+        sse += (y[t] - base * s) ** 2
+        seasonal = s > _EPS
+        new_level = np.where(seasonal, alpha * y[t] / np.where(seasonal, s, 1) + (1 - alpha) * base, base)
+        trend = beta * (new_level - level) + (1 - beta) * PHI * trend
+        season[:, :, w] = np.where(
+            new_level > _EPS, gamma * y[t] / np.maximum(new_level, _EPS) + (1 - gamma) * s, s
+        )
+        level = np.maximum(new_level, 0)
+    return {"level": level, "trend": trend, "season": season, "sse": sse, "days": state["days"] + len(weekdays)}
+
+
+# custo: dias × séries × combinações da grade (o filtro anda todas juntas)
+@offloadable(cost=lambda y, weekdays: y.size * len(_GRID))
+def smoothing_fit(y: np.ndarray, weekdays: np.ndarray) -> dict:
+    """Estado inicial pelas duas primeiras semanas e filtro sobre o resto (y: [D, N])"""
+    n_series = y.shape[1]
+    weeks = y[:WARMUP_DAYS].reshape(2, SEASON, n_series)
+    means = weeks.mean(axis=1)                                          # [2, N]
+    ratios = np.where(means[:, None] > _EPS, weeks / np.maximum(means[:, None], _EPS), 1.0)
+    season = np.ones((n_series, SEASON))
+    season[:, weekdays[:SEASON]] = ratios.mean(axis=0).T
+    g = len(_GRID)
+    state = {
+        "level": np.repeat(means[1][None], g, axis=0),
+        "trend": np.repeat(((means[1] - means[0]) / SEASON)[None], g, axis=0),
+        "season": np.repeat(season[None], g, axis=0),
+        "sse": np.zeros((g, n_series)),
+        "days": 0,
+    }
+    return _smooth(state, y[WARMUP_DAYS:], weekdays[WARMUP_DAYS:])
+
+
+@offloadable(cost=lambda state, y, weekdays: y.size * len(_GRID))
+def smoothing_update(state: dict, y: np.ndarray, weekdays: np.ndarray) -> dict:
+    """Dias novos fechados, sem refazer o ajuste"""
+    return _smooth(state, y, weekdays)
+
+
+def smoothing_best(state: dict) -> dict:
+    """Combinação de menor erro por série: parâmetros e estado prontos para prever"""
+    best = state["sse"].argmin(axis=0)
+    cols = np.arange(len(best))
+    return {
+        "params": _GRID[best],
+        "level": state["level"][best, cols],
+        "trend": state["trend"][best, cols],
+        "season": state["season"][best, cols],
+        "rmse": np.sqrt(state["sse"][best, cols] / max(state["days"], 1)),
+    }
+
+
+def smoothing_forecast(best: dict, weekdays: np.ndarray) -> np.ndarray:
+    """Previsão [H, N] para os próximos dias (weekdays: dia da semana de cada um)"""
+    damping = np.cumsum(PHI ** np.arange(1, len(weekdays) + 1))        # Σ φ^i, i = 1..h
+    base = best["level"][None] + damping[:, None] * best["trend"][None]
+    return np.maximum(base * best["season"][:, weekdays].T, 0)
+
+
+# ------------------------------------------------------
+# Coortes (services/cohorts.py)
+# ------------------------------------------------------
+@offloadable()
+def cohort_matrix(customer_ids: np.ndarray, years: np.ndarray, months: np.ndarray) -> dict:
+    """
+    Bitmaps (cliente, ano) → matriz coorte × período. Meses como índice
+    absoluto (ano * 12 + mês - 1); `matrix[c, k]` = clientes da coorte c
+    ativos k meses depois da primeira compra.
+    """
+    if not len(customer_ids):
+        return {"cohorts": np.zeros(0, np.int64), "matrix": np.zeros((0, 0), np.int64), "last_month": None}
+    _, customer = np.unique(customer_ids, return_inverse=True)
+    row, bit = np.nonzero((months.astype(np.int64)[:, None] >> np.arange(12)) & 1)
+    customer = customer[row]
+    month = years.astype(np.int64)[row] * 12 + bit
+
+    first = np.full(customer.max() + 1, np.iinfo(np.int64).max)
+    np.minimum.at(first, customer, month)
+    cohort_month = first[customer]
+    cohorts, cohort = np.unique(cohort_month, return_inverse=True)
+
+    matrix = np.zeros((len(cohorts), int((month - cohort_month).max()) + 1), np.int64)
+    np.add.at(matrix, (cohort, month - cohort_month), 1)
+    return {"cohorts": cohorts, "matrix": matrix, "last_month": int(month.max())}
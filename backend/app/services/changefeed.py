@@ -0,0 +1,249 @@
+# backend/app/services/changefeed.py
+"""
+Change feed de vendas via LISTEN/NOTIFY.
+
+  - Um trigger por comando (FOR EACH STATEMENT, com transition tables) em
+    `sales` agrupa as linhas afetadas por (loja, canal, dia) e emite
+    NOTIFY em lotes de CHANGEFEED_KEYS_PER_NOTIFY chaves (o payload do
+    NOTIFY tem limite de 8000 bytes). Um COPY de 5000 vendas vira poucas
+    notificações, entregues só no commit. O mesmo trigger marca os buckets
+    em sales_bucket_versions (services/watermarks.py), por isso é instalado
+    mesmo com CHANGEFEED_ENABLED=false (só sem o NOTIFY).
+  - Uma thread com conexão dedicada (autocommit, fora dos pools) faz LISTEN
+    e repassa cada ChangeEvent aos assinantes registrados com subscribe().
+
+Assinantes padrão: invalidação do cache por chave e marcação das
+materialized views como sujas. Se a conexão cair, os assinantes recebem
+um evento `resync` (podem ter perdido notificações).
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Callable, Optional
+
+from ..db import connect_primary, get_conn, WORKLOAD_PRIMARY
+from ..settings import settings
+from . import watermarks
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChangeEvent:
+    op: str                                   # INSERT | UPDATE | DELETE | RESYNC
+    keys: list[tuple[int, int, date]] = field(default_factory=list)
+    min_id: Optional[int] = None              # faixa de ids das linhas deste lote de chaves
+    max_id: Optional[int] = None
+
+    @property
+    def resync(self) -> bool:
+        return self.op == "RESYNC"
+
+
+# ======================================================
+# Trigger
+# ======================================================
+# chaves (loja, canal, dia) distintas de uma transition table, em lotes
+_KEYS_SQL = """
+        FOR payload IN
+            SELECT json_build_object(
+                       'op', TG_OP,
+                       'min_id', MIN(k.min_id),
+                       'max_id', MAX(k.max_id),
+                       'keys', json_agg(json_build_array(k.store_id, k.channel_id, k.day))
+                   )::text
+            FROM (
+                SELECT store_id, channel_id, created_at::date AS day,
+                       MIN(id) AS min_id, MAX(id) AS max_id,
+                       (ROW_NUMBER() OVER (ORDER BY store_id, channel_id, created_at::date) - 1)
+                           / {keys_per_notify} AS chunk
+                FROM ({source}) changed
+                GROUP BY store_id, channel_id, created_at::date
+            ) k
+            GROUP BY k.chunk
+        LOOP
+            PERFORM pg_notify('{channel}', payload);
+        END LOOP;
+"""
+
+
+def _trigger_ddl(notify: bool) -> list[str]:
+    def keys(source: str) -> str:
+        body = watermarks.MARK.format(source=source)
+        if notify:
+            body += _KEYS_SQL.format(
+                source=source,
+                keys_per_notify=int(settings.CHANGEFEED_KEYS_PER_NOTIFY),
+                channel=settings.CHANGEFEED_CHANNEL,
+            )
+        return body
+
+    function = f"""
+        CREATE OR REPLACE FUNCTION notify_sales_changes() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            payload text;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                {keys("SELECT store_id, channel_id, created_at, id FROM new_rows")}
+            ELSIF TG_OP = 'UPDATE' THEN
+                {keys("SELECT store_id, channel_id, created_at, id FROM new_rows "
+                      "UNION SELECT store_id, channel_id, created_at, id FROM old_rows")}
+            ELSE
+                {keys("SELECT store_id, channel_id, created_at, id FROM old_rows")}
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """
+
+    # transition tables exigem um trigger por evento
+    return [
+        function,
+        """
+        CREATE OR REPLACE TRIGGER sales_changes_insert
+            AFTER INSERT ON sales
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_sales_changes()
+        """,
+        """
+        CREATE OR REPLACE TRIGGER sales_changes_update
+            AFTER UPDATE ON sales
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_sales_changes()
+        """,
+        """
+        CREATE OR REPLACE TRIGGER sales_changes_delete
+            AFTER DELETE ON sales
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_sales_changes()
+        """,
+    ]
+
+
+def ensure_trigger():
+    """Cria/atualiza a função e os triggers (idempotente); NOTIFY só com o change feed ligado"""
+    with get_conn(WORKLOAD_PRIMARY) as conn:
+        for ddl in _trigger_ddl(notify=settings.CHANGEFEED_ENABLED):
+            conn.execute(ddl)
+
+
+# ======================================================
+# Assinantes
+# ======================================================
+_subscribers: list[tuple[str, Callable[[ChangeEvent], None]]] = []
+
+stats: dict = {
+    "connected": False,
+    "notifications": 0,
+    "keys": 0,
+    "reconnects": 0,
+    "subscriber_errors": 0,
+    "last_event_at": None,
+    "last_error": None,
+}
+
+
+def subscribe(name: str, fn: Callable[[ChangeEvent], None]):
+    """Registra um assinante; roda na thread do listener, então deve ser rápido"""
+    if any(existing == name for existing, _ in _subscribers):
+        return
+    _subscribers.append((name, fn))
+
+
+def install_default_subscribers():
+    from .. import cache
+    from . import live, matviews
+
+    subscribe("cache", cache.on_sales_change)
+    subscribe("matviews", matviews.on_sales_change)
+    subscribe("live", live.hub.on_sales_change)
+
+
+def is_connected() -> bool:
+    return stats["connected"]
+
+
+def _parse(payload: str) -> ChangeEvent:
+    data = json.loads(payload)
+    return ChangeEvent(
+        op=data["op"],
+        keys=[(k[0], k[1], date.fromisoformat(k[2])) for k in data.get("keys") or []],
+        min_id=data.get("min_id"),
+        max_id=data.get("max_id"),
+    )
+
+
+def publish(event: ChangeEvent):
+    for name, fn in list(_subscribers):
+        try:
+            fn(event)
+        except Exception as e:
+            stats["subscriber_errors"] += 1
+            logger.error(f"❌ Assinante '{name}' do change feed falhou: {e}")
+
+
+# ======================================================
+# Listener (thread dedicada)
+# ======================================================
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _listen_once(resync: bool):
+    with connect_primary(autocommit=True) as conn:
+        conn.execute(f"LISTEN {settings.CHANGEFEED_CHANNEL}")
+        stats["connected"] = True
+        logger.info(f"👂 LISTEN {settings.CHANGEFEED_CHANNEL}")
+
+        # reconexão: o que mudou enquanto estava desconectado não foi notificado
+        if resync:
+            publish(ChangeEvent(op="RESYNC"))
+
+        while not _stop.is_set():
+            # timeout curto para conseguir checar o _stop
+            for notify in conn.notifies(timeout=1.0):
+                event = _parse(notify.payload)
+                stats["notifications"] += 1
+                stats["keys"] += len(event.keys)
+                stats["last_event_at"] = datetime.now(timezone.utc).isoformat()
+                publish(event)
+
+
+def _run():
+    first = True
+    while not _stop.is_set():
+        try:
+            _listen_once(resync=not first)
+        except Exception as e:
+            stats["last_error"] = str(e)
+            logger.warning(f"⚠️ Change feed desconectado: {e}")
+        finally:
+            stats["connected"] = False
+            first = False
+
+        if not _stop.is_set():
+            stats["reconnects"] += 1
+            _stop.wait(settings.CHANGEFEED_RECONNECT_SECONDS)
+
+
+def start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="changefeed", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+
+
+def snapshot() -> dict:
+    return {**stats, "subscribers": [name for name, _ in _subscribers]}
@@ -0,0 +1,57 @@
+# backend/app/services/cohorts.py
+"""
+Coortes de aquisição (mês da primeira compra) e retenção mês a mês.
+
+`customer_activity_monthly` guarda, por (cliente, loja, canal, ano), um
+bitmap dos meses com compra COMPLETED (bit m-1 = mês m, SMALLINT). É um
+rollup (services/rollups.py): a ingestão faz OR dos meses do lote na
+mesma transação do COPY.
+
+Para um filtro de lojas/canais, os bitmaps das linhas selecionadas são
+somados por OR (cliente, ano) no banco; a coorte de cada cliente é o
+primeiro mês ativo dentro do filtro e a matriz sai em NumPy
+(analysis.cohort_matrix) — sem autojunção sobre o histórico de vendas.
+"""
+
+from .. import queries
+
+TABLE = "customer_activity_monthly"
+
+DDL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        customer_id INTEGER NOT NULL,
+        store_id    INTEGER NOT NULL,
+        channel_id  INTEGER NOT NULL,
+        year        SMALLINT NOT NULL,
+        months      SMALLINT NOT NULL,      -- bit m-1 = comprou no mês m
+        PRIMARY KEY (customer_id, store_id, channel_id, year)
+    )
+"""
+
+_ACTIVITY_SELECT = """
+    SELECT
+        s.customer_id,
+        s.store_id,
+        s.channel_id,
+        EXTRACT(YEAR FROM s.created_at)::smallint,
+        bit_or(1 << (EXTRACT(MONTH FROM s.created_at)::int - 1))::smallint
+    FROM sales s
+    WHERE s.customer_id IS NOT NULL AND s.sale_status_desc = 'COMPLETED' {where}
+    GROUP BY 1, 2, 3, 4
+"""
+
+BACKFILL = f"INSERT INTO {TABLE} " + _ACTIVITY_SELECT.format(where="")
+
+APPLY = (
+    f"INSERT INTO {TABLE} "
+    + _ACTIVITY_SELECT.format(where="AND s.id = ANY(%(sale_ids)s::int[])")
+    + f" ON CONFLICT (customer_id, store_id, channel_id, year) DO UPDATE SET months = {TABLE}.months | EXCLUDED.months"
+)
+
+Q_ACTIVITY = queries.register("cohort_activity", f"""
+    SELECT r.customer_id, r.year, bit_or(r.months)
+    FROM {TABLE} r
+    WHERE (cardinality(%(store_ids)s::int[]) = 0 OR r.store_id = ANY(%(store_ids)s::int[]))
+      AND (cardinality(%(channel_ids)s::int[]) = 0 OR r.channel_id = ANY(%(channel_ids)s::int[]))
+    GROUP BY 1, 2
+""")
@@ -0,0 +1,234 @@
+# backend/app/services/delivery_cube.py
+"""
+Cubo denso dia da semana × hora do tempo de entrega.
+
+Uma linha por (semana, loja, canal) em `delivery_heatmap_weekly`, com um
+blob de tamanho fixo: matriz 7 × 24 × CELL_FIELDS de uint32 (little-endian)
+onde cada célula guarda contagem, soma de delivery_seconds e um
+histograma em faixas de minutos (BUCKET_EDGES_MIN) — o "sketch" que dá o
+p90 aproximado. Tudo é somável: o heatmap de qualquer filtro é a soma de
+poucas matrizes pequenas.
+
+Na consulta, as semanas inteiras do período vêm do cubo e os dias das
+pontas (semanas parciais) das vendas brutas, agregados no mesmo formato.
+
+Mantido pela ingestão como os demais rollups (services/rollups.py).
+Mudar BUCKET_EDGES_MIN muda o tamanho do blob e exige
+`python -m app.services.rollups --rebuild --only delivery_heatmap_weekly`.
+"""
+
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Optional
+
+import numpy as np
+
+from .. import queries
+from ..queries import SALES_WHERE
+
+TABLE = "delivery_heatmap_weekly"
+
+BUCKET_EDGES_MIN = (15, 20, 25, 30, 35, 40, 45, 50, 55)   # faixas: <15, [15,20), ..., ≥55
+N_BUCKETS = len(BUCKET_EDGES_MIN) + 1
+COUNT, SECONDS, HIST = 0, 1, 2                               # campos da célula
+CELL_FIELDS = HIST + N_BUCKETS
+SHAPE = (7, 24, CELL_FIELDS)                                 # weekday (0 = domingo) × hora
+BLOB_DTYPE = np.dtype("<u4")
+BLOB_SIZE = int(np.prod(SHAPE)) * BLOB_DTYPE.itemsize
+
+DDL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        week       DATE NOT NULL,          -- segunda-feira (DATE_TRUNC('week'))
+        store_id   INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        cube       BYTEA NOT NULL,
+        PRIMARY KEY (week, store_id, channel_id)
+    )
+"""
+
+# células (weekday, hora, faixa) por semana × loja × canal
+_CELLS_SQL = """
+    SELECT
+        DATE_TRUNC('week', s.created_at)::date,
+        s.store_id,
+        s.channel_id,
+        EXTRACT(DOW FROM s.created_at)::int,
+        EXTRACT(HOUR FROM s.created_at)::int,
+        width_bucket(s.delivery_seconds / 60.0, %(bucket_edges)s::numeric[]),
+        COUNT(*),
+        SUM(s.delivery_seconds)
+    FROM sales s
+    WHERE s.delivery_seconds IS NOT NULL {where}
+    GROUP BY 1, 2, 3, 4, 5, 6
+"""
+
+Q_CUBES = queries.register("delivery_cube_weeks", f"""
+    SELECT r.cube
+    FROM {TABLE} r
+    WHERE (%(weeks_from)s::date IS NULL OR r.week >= %(weeks_from)s::date)
+      AND (%(weeks_to)s::date IS NULL OR r.week < %(weeks_to)s::date)
+      AND (cardinality(%(store_ids)s::int[]) = 0 OR r.store_id = ANY(%(store_ids)s::int[]))
+      AND (cardinality(%(channel_ids)s::int[]) = 0 OR r.channel_id = ANY(%(channel_ids)s::int[]))
+""")
+
+# dias das pontas do período (semanas parciais), direto das vendas
+Q_EDGE_CELLS = queries.register("delivery_cube_edges", f"""
+    SELECT
+        EXTRACT(DOW FROM s.created_at)::int,
+        EXTRACT(HOUR FROM s.created_at)::int,
+        width_bucket(s.delivery_seconds / 60.0, %(bucket_edges)s::numeric[]),
+        COUNT(*),
+        SUM(s.delivery_seconds)
+    FROM sales s
+    WHERE s.delivery_seconds IS NOT NULL AND {SALES_WHERE}
+    GROUP BY 1, 2, 3
+""")
+
+
+# ------------------------------------------------------
+# Blob
+# ------------------------------------------------------
+def empty() -> np.ndarray:
+    return np.zeros(SHAPE, dtype=np.int64)
+
+
+def encode(cube: np.ndarray) -> bytes:
+    if cube.max(initial=0) > np.iinfo(BLOB_DTYPE).max:
+        raise OverflowError("Célula do cubo acima de uint32")
+    return cube.astype(BLOB_DTYPE).tobytes()
+
+
+def decode(blob: bytes) -> np.ndarray:
+    if len(blob) != BLOB_SIZE:
+        raise ValueError(f"Blob do cubo com {len(blob)} bytes (esperado {BLOB_SIZE}): rode o rebuild")
+    return np.frombuffer(blob, dtype=BLOB_DTYPE).reshape(SHAPE)
+
+
+def _add_cells(cube: np.ndarray, weekday: int, hour: int, bucket: int, n: int, seconds: int):
+    cell = cube[weekday, hour]
+    cell[COUNT] += n
+    cell[SECONDS] += seconds
+    cell[HIST + bucket] += n
+
+
+def _build(rows) -> dict[tuple, np.ndarray]:
+    """Linhas de _CELLS_SQL → cubo por (semana, loja, canal)"""
+    cubes: dict[tuple, np.ndarray] = {}
+    for week, store_id, channel_id, weekday, hour, bucket, n, seconds in rows:
+        key = (week, store_id, channel_id)
+        if key not in cubes:
+            cubes[key] = empty()
+        _add_cells(cubes[key], weekday, hour, bucket, n, seconds)
+    return cubes
+
+
+# ------------------------------------------------------
+# Manutenção (chamada por services/rollups.py)
+# ------------------------------------------------------
+def backfill(conn):
+    rows = conn.execute(
+        _CELLS_SQL.format(where=""), {"bucket_edges": list(BUCKET_EDGES_MIN)}
+    ).fetchall()
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY {TABLE} (week, store_id, channel_id, cube) FROM STDIN") as copy:
+            for key, cube in _build(rows).items():
+                copy.write_row((*key, encode(cube)))
+
+
+def apply(conn, sale_ids: list[int]):
+    """Soma as vendas do lote nos cubos das suas semanas (na transação do chamador)"""
+    rows = conn.execute(
+        _CELLS_SQL.format(where="AND s.id = ANY(%(sale_ids)s::int[])"),
+        {"bucket_edges": list(BUCKET_EDGES_MIN), "sale_ids": sale_ids},
+    ).fetchall()
+
+    # ordem fixa das chaves: lotes concorrentes travam as linhas na mesma ordem
+    for key, delta in sorted(_build(rows).items()):
+        inserted = conn.execute(
+            f"INSERT INTO {TABLE} (week, store_id, channel_id, cube) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT DO NOTHING RETURNING 1",
+            [*key, encode(delta)],
+        ).fetchone()
+        if inserted:
+            continue
+        (blob,) = conn.execute(
+            f"SELECT cube FROM {TABLE} WHERE week = %s AND store_id = %s AND channel_id = %s FOR UPDATE",
+            key,
+        ).fetchone()
+        conn.execute(
+            f"UPDATE {TABLE} SET cube = %s WHERE week = %s AND store_id = %s AND channel_id = %s",
+            [encode(decode(blob) + delta), *key],
+        )
+
+
+# ------------------------------------------------------
+# Consulta
+# ------------------------------------------------------
+def _next_monday(d: date) -> date:
+    return d + timedelta(days=-d.weekday() % 7)
+
+
+def _monday(d: date) -> date:
+    return d - timedelta(days=d.weekday())
+
+
+def fold(conn, params: dict) -> np.ndarray:
+    """
+    Cubo somado para os filtros de sales_filters (start inclusivo, end
+    exclusivo, store_ids, channel_ids): semanas inteiras do cubo + pontas brutas.
+    """
+    start: Optional[date] = params["start"]
+    end: Optional[date] = params["end"]
+    weeks_from = _next_monday(start) if start else None
+    weeks_to = _monday(end) if end else None
+
+    edges: list[tuple[Optional[date], Optional[date]]] = []
+    if weeks_from and weeks_to and weeks_from >= weeks_to:
+        edges.append((start, end))                 # período menor que uma semana inteira
+        weeks = False
+    else:
+        weeks = True
+        if start and start < weeks_from:
+            edges.append((start, weeks_from))
+        if end and weeks_to < end:
+            edges.append((weeks_to, end))
+
+    total = empty()
+    if weeks:
+        for (blob,) in queries.run(conn, Q_CUBES, {**params, "weeks_from": weeks_from, "weeks_to": weeks_to}):
+            total += decode(blob)
+
+    for lo, hi in edges:
+        edge_params = {**params, "start": lo, "end": hi, "bucket_edges": list(BUCKET_EDGES_MIN)}
+        for weekday, hour, bucket, n, seconds in queries.run(conn, Q_EDGE_CELLS, edge_params):
+            _add_cells(total, weekday, hour, bucket, n, seconds)
+    return total
+
+
+def _quantile_minutes(hist: np.ndarray, q: float) -> float:
+    """Quantil aproximado pelo histograma (interpolação linear dentro da faixa)"""
+    bounds = (0, *BUCKET_EDGES_MIN, 2 * BUCKET_EDGES_MIN[-1] - BUCKET_EDGES_MIN[-2])
+    target = q * hist.sum()
+    seen = 0
+    for b, n in enumerate(hist):
+        if n and seen + n >= target:
+            return bounds[b] + (bounds[b + 1] - bounds[b]) * (target - seen) / n
+        seen += n
+    return float(bounds[-1])
+
+
+def heatmap(cube: np.ndarray) -> list[dict]:
+    """Células com entregas, no formato de /sales/delivery/performance"""
+    out = []
+    for weekday, hour in zip(*np.nonzero(cube[:, :, COUNT])):
+        cell = cube[weekday, hour]
+        out.append({
+            "weekday": int(weekday),
+            "hour": int(hour),
+            # mesmo arredondamento do ROUND(numeric) do Postgres
+            "avg_delivery_minutes": float(
+                (Decimal(int(cell[SECONDS])) / int(cell[COUNT]) / 60).quantize(Decimal("0.01"), ROUND_HALF_UP)
+            ),
+            "p90_delivery_minutes": round(float(_quantile_minutes(cell[HIST:], 0.9)), 1),
+        })
+    return out
@@ -0,0 +1,264 @@
+# backend/app/services/duckdb_engine.py
+"""
+Motor analítico embutido: DuckDB sobre os snapshots Parquet locais.
+
+O snapshot em SNAPSHOT_DIR é gerado por services/exporter.py
+(sales e filhas particionadas por date=/store_id=, dimensões em arquivos
+avulsos). As views leem só os arquivos listados em _snapshot.json e são
+recriadas quando o manifesto muda.
+
+Dias até `closed_through` são considerados fechados. Um endpoint que
+declara SQL DuckDB para o seu FanoutShape (register) tem o período
+dividido em duas partes: os dias fechados rodam aqui, a cauda aberta
+(hoje) no Postgres, ao mesmo tempo, e os parciais são combinados pelo
+Merge do shape — o mesmo caminho do fan-out mensal.
+
+Um dia fechado que mudou depois da exportação (buckets de
+sales_bucket_versions não visíveis no pg_snapshot `versions` do manifesto:
+venda tardia, UPDATE, DELETE) puxa a divisão para trás: dali em diante,
+dentro do filtro, tudo vai para o Postgres até a próxima exportação.
+
+DuckDB é opcional: sem o pacote ou sem snapshot, tudo continua no Postgres.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+from ..db import get_conn, WORKLOAD_ANALYTICS
+from ..settings import settings
+from . import fanout, watermarks
+from .fanout import FanoutShape
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TABLES = ("sales", "product_sales", "item_product_sales", "payments", "delivery_addresses")
+DIMENSION_TABLES = ("products", "items", "stores", "channels", "payment_types")
+MANIFEST = "_snapshot.json"
+
+# Equivalente de SALES_WHERE; "date" e store_id são colunas de partição (poda de arquivos)
+DUCK_SALES_WHERE = """
+        ($start::DATE IS NULL OR s."date" >= $start::DATE)
+    AND ($end::DATE IS NULL OR s."date" < $end::DATE)
+    AND (len($store_ids::INTEGER[]) = 0 OR list_contains($store_ids::INTEGER[], s.store_id))
+    AND (len($channel_ids::INTEGER[]) = 0 OR list_contains($channel_ids::INTEGER[], s.channel_id))
+    AND ($channel_name::VARCHAR IS NULL
+         OR s.channel_id IN (SELECT id FROM channels WHERE name ILIKE $channel_name::VARCHAR))
+    AND (len($statuses::VARCHAR[]) = 0 OR list_contains($statuses::VARCHAR[], s.sale_status_desc))
+"""
+
+
+def partition_where(alias: str) -> str:
+    """Mesmos limites de data/loja para uma tabela filha (poda as partições dela também)"""
+    return f"""
+    AND ($start::DATE IS NULL OR {alias}."date" >= $start::DATE)
+    AND ($end::DATE IS NULL OR {alias}."date" < $end::DATE)
+    AND (len($store_ids::INTEGER[]) = 0 OR list_contains($store_ids::INTEGER[], {alias}.store_id))
+"""
+
+
+_PARAM = re.compile(r"\$(\w+)")
+
+SHAPES: dict[str, str] = {}     # nome do FanoutShape → SQL DuckDB
+
+stats: dict = {"runs": 0, "duckdb_ms": 0.0, "errors": 0, "last_error": None}
+
+_lock = threading.Lock()
+_con = None
+_manifest: Optional[dict] = None
+_manifest_mtime: Optional[float] = None     # manifesto refletido nas views
+_unavailable: Optional[str] = None
+
+
+def register(shape: FanoutShape, sql: str):
+    """Declara que o shape também roda no DuckDB (mesmos parâmetros, sintaxe DuckDB)"""
+    SHAPES[shape.name] = sql
+
+
+# ------------------------------------------------------
+# Conexão e manifesto
+# ------------------------------------------------------
+def _connect():
+    import duckdb
+
+    con = duckdb.connect(config={"threads": settings.DUCKDB_THREADS} if settings.DUCKDB_THREADS else {})
+    if settings.DUCKDB_MEMORY_LIMIT:
+        con.execute(f"SET memory_limit = '{settings.DUCKDB_MEMORY_LIMIT}'")
+    return con
+
+
+def _quote(path: str) -> str:
+    return "'" + path.replace("'", "''") + "'"
+
+
+def _usable(manifest: Optional[dict]) -> bool:
+    return bool(
+        manifest
+        and manifest.get("closed_through")
+        and manifest.get("versions")
+        and all(manifest.get("tables", {}).get(t, {}).get("files") for t in SNAPSHOT_TABLES)
+        and all(t in manifest.get("dimensions", {}) for t in DIMENSION_TABLES)
+    )
+
+
+def _build_views(con, manifest: dict):
+    """Uma view por tabela, só com os arquivos listados no manifesto"""
+    root = os.path.abspath(settings.SNAPSHOT_DIR)
+    for table in SNAPSHOT_TABLES:
+        files = ", ".join(_quote(os.path.join(root, f)) for f in manifest["tables"][table]["files"])
+        con.execute(f"""
+            CREATE OR REPLACE VIEW {table} AS
+            SELECT * FROM read_parquet(
+                [{files}],
+                hive_partitioning = true,
+                hive_types = {{'date': DATE, 'store_id': INTEGER}}
+            )
+        """)
+    for table in DIMENSION_TABLES:
+        path = _quote(os.path.join(root, manifest["dimensions"][table]))
+        con.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM read_parquet({path})")
+
+
+def _sync() -> Optional[dict]:
+    """
+    Manifesto em uso. Quando o arquivo muda (exportação ou compactação),
+    as views são recriadas com a nova lista de arquivos — a troca é atômica
+    para as consultas seguintes.
+    """
+    global _con, _manifest, _manifest_mtime, _unavailable
+    path = os.path.join(settings.SNAPSHOT_DIR, MANIFEST)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _lock:
+        if mtime == _manifest_mtime:
+            return _manifest
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        _manifest_mtime = mtime
+        if not _usable(manifest):
+            _manifest = None
+            return None
+        try:
+            if _con is None:
+                _con = _connect()
+            _build_views(_con, manifest)
+        except ImportError:
+            _unavailable = "pacote duckdb não instalado"
+            _manifest = None
+            return None
+        except Exception as e:
+            stats["errors"] += 1
+            stats["last_error"] = str(e)
+            logger.warning(f"⚠️ Snapshot Parquet inválido, usando só o Postgres: {e}")
+            _manifest = None
+            return None
+        _manifest = manifest
+        return manifest
+
+
+def _cursor():
+    with _lock:
+        # cursor = conexão duplicada, segura para usar em outra thread
+        return _con.cursor()
+
+
+def cutoff() -> Optional[date]:
+    """Primeiro dia NÃO coberto pelo snapshot (None = sem snapshot utilizável)"""
+    if not settings.DUCKDB_ENABLED or _unavailable:
+        return None
+    manifest = _sync()
+    if manifest is None:
+        return None
+    return date.fromisoformat(manifest["closed_through"]) + timedelta(days=1)
+
+
+# ------------------------------------------------------
+# Execução híbrida
+# ------------------------------------------------------
+def split(params: dict) -> Optional[tuple[dict, Optional[dict]]]:
+    """(parâmetros dos dias fechados, parâmetros da cauda no Postgres ou None)"""
+    limit = cutoff()
+    manifest = _manifest
+    if limit is None or manifest is None:
+        return None
+    start, end = params["start"], params["end"]
+    if start is not None and start >= limit:
+        return None                                  # período todo aberto
+
+    # dias alterados depois da exportação: o snapshot não vale mais para eles
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        changed = watermarks.first_changed(conn, manifest["versions"], {**params, "end": min(end, limit) if end else limit})
+    if changed is not None:
+        limit = changed
+        if start is not None and start >= limit:
+            return None
+
+    closed = {**params, "end": min(end, limit) if end else limit}
+    tail = {**params, "start": limit} if end is None or end > limit else None
+    return closed, tail
+
+
+def plan(shape: FanoutShape, params: dict) -> Optional[tuple[dict, Optional[dict]]]:
+    """split() do período quando o shape roda no DuckDB (None = não se aplica); vai direto para run()"""
+    if shape.name not in SHAPES:
+        return None
+    return split(params)
+
+
+def _run_duckdb(shape: FanoutShape, params: dict) -> list[tuple]:
+    sql = SHAPES[shape.name]
+    used = set(_PARAM.findall(sql))
+    t0 = time.perf_counter()
+    cur = _cursor()
+    try:
+        rows = cur.execute(sql, {k: v for k, v in params.items() if k in used}).fetchall()
+    finally:
+        cur.close()
+    stats["duckdb_ms"] += (time.perf_counter() - t0) * 1000
+    return rows
+
+
+def run(shape: FanoutShape, parts: tuple[dict, Optional[dict]], limit: Optional[int] = None) -> list[tuple]:
+    """
+    Dias fechados no DuckDB e a cauda aberta no Postgres (em paralelo),
+    combinados pelo Merge do shape. Falha no DuckDB → tudo no Postgres.
+    `parts` é o retorno de plan(), sem refazer o split (que abre conexão).
+    """
+    closed, tail = parts
+    tail_future = fanout.submit(shape, tail) if tail is not None else None
+
+    try:
+        partials = [_run_duckdb(shape, closed)]
+    except Exception as e:
+        stats["errors"] += 1
+        stats["last_error"] = str(e)
+        logger.warning(f"⚠️ DuckDB indisponível para {shape.name}, usando o Postgres: {e}")
+        partials = fanout.gather([fanout.submit(shape, closed)])
+
+    if tail_future is not None:
+        partials += fanout.gather([tail_future])
+
+    stats["runs"] += 1
+    return fanout.finish(shape, partials, limit)
+
+
+def snapshot() -> dict:
+    limit = cutoff()
+    manifest = _manifest if limit else None
+    return {
+        **stats,
+        "enabled": settings.DUCKDB_ENABLED,
+        "unavailable": _unavailable,
+        "snapshot_dir": os.path.abspath(settings.SNAPSHOT_DIR),
+        "closed_through": manifest.get("closed_through") if manifest else None,
+        "cutoff": limit.isoformat() if limit else None,
+        "shapes": sorted(SHAPES),
+    }
@@ -0,0 +1,424 @@
+# backend/app/services/exporter.py
+"""
+Exportação incremental das vendas para Parquet (snapshot do DuckDB).
+
+    SNAPSHOT_DIR/
+      _snapshot.json                             manifesto (único ponto de verdade)
+      sales/date=AAAA-MM-DD/store_id=N/part-*.parquet
+      product_sales/..., item_product_sales/..., payments/..., delivery_addresses/...
+      products.parquet, items.parquet, ...       dimensões (reescritas a cada execução)
+
+A primeira execução exporta as vendas (e os filhos delas) em lotes de
+ids. As seguintes reexportam só as partições (dia × loja) com buckets
+alterados em sales_bucket_versions (services/watermarks.py) depois do
+pg_snapshot gravado no manifesto — vendas novas, tardias, UPDATE e DELETE,
+pela API ou por fora — e os arquivos antigos dessas partições saem do
+manifesto. Os arquivos são escritos com zstd, dicionário e estatísticas
+por row group. Quem lê (services/duckdb_engine.py)
+só enxerga os arquivos listados no manifesto, que é trocado de forma
+atômica — arquivos novos ou compactados aparecem todos de uma vez, e os
+substituídos só são apagados depois de EXPORT_RETIRE_SECONDS.
+
+O watermark (maior id e pg_snapshot) é lido com um lock consultivo
+exclusivo que a ingestão segura (compartilhado) durante a transação.
+O snapshot é tirado antes da leitura: o que entrar no meio é reexportado
+na execução seguinte.
+
+    python -m app.services.exporter            # uma exportação incremental
+    python -m app.services.exporter --compact  # + compactação das partições
+    python -m app.services.exporter --full     # recomeça do zero
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+from ..db import get_conn, WORKLOAD_PRIMARY
+from ..queries import sales_filters
+from ..settings import settings
+from . import watermarks
+from .duckdb_engine import DIMENSION_TABLES, MANIFEST
+
+logger = logging.getLogger(__name__)
+
+# lock consultivo: ingestão segura compartilhado, leitura do watermark exclusivo
+INGEST_FENCE_LOCK = 48_151_623
+# uma exportação por vez (API e CLI)
+EXPORT_RUN_LOCK = 48_151_624
+
+PARTITION_COLUMNS = ["date", "store_id"]
+
+# tabela → SELECT com as colunas de partição ("date", store_id) vindas da venda;
+# {where} escolhe as vendas do lote (BY_IDS ou BY_PARTITIONS)
+EXPORTS: dict[str, str] = {
+    "sales": """
+        SELECT s.*, DATE(s.created_at) AS "date"
+        FROM sales s
+        WHERE {where}
+    """,
+    "product_sales": """
+        SELECT ps.*, DATE(s.created_at) AS "date", s.store_id
+        FROM product_sales ps
+        JOIN sales s ON s.id = ps.sale_id
+        WHERE {where}
+    """,
+    "item_product_sales": """
+        SELECT ips.*, DATE(s.created_at) AS "date", s.store_id
+        FROM item_product_sales ips
+        JOIN product_sales ps ON ps.id = ips.product_sale_id
+        JOIN sales s ON s.id = ps.sale_id
+        WHERE {where}
+    """,
+    "payments": """
+        SELECT pay.*, DATE(s.created_at) AS "date", s.store_id
+        FROM payments pay
+        JOIN sales s ON s.id = pay.sale_id
+        WHERE {where}
+    """,
+    "delivery_addresses": """
+        SELECT da.*, DATE(s.created_at) AS "date", s.store_id
+        FROM delivery_addresses da
+        JOIN sales s ON s.id = da.sale_id
+        WHERE {where}
+    """,
+}
+
+BY_IDS = "s.id > %(lo)s AND s.id <= %(hi)s"
+
+BY_PARTITIONS = """
+            DATE(s.created_at) >= %(first_day)s::date
+        AND DATE(s.created_at) <= %(last_day)s::date
+        AND (DATE(s.created_at), s.store_id) IN (
+            SELECT * FROM unnest(%(days)s::date[], %(store_ids)s::int[])
+        )"""
+
+progress: dict = {"status": "idle", "last_run": None, "last_error": None}
+
+
+def hold_ingest_fence(cur):
+    """Chamado pela ingestão dentro da transação do lote"""
+    cur.execute("SELECT pg_advisory_xact_lock_shared(%s)", [INGEST_FENCE_LOCK])
+
+
+# ------------------------------------------------------
+# Manifesto
+# ------------------------------------------------------
+def _root() -> str:
+    return os.path.abspath(settings.SNAPSHOT_DIR)
+
+
+def load_manifest() -> dict:
+    path = os.path.join(_root(), MANIFEST)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {
+            "watermark": 0,
+            "versions": None,
+            "closed_through": None,
+            "tables": {t: {"files": [], "rows": 0} for t in EXPORTS},
+            "dimensions": {},
+            "retired": [],
+        }
+
+
+def _save_manifest(manifest: dict):
+    manifest["exported_at"] = datetime.now(timezone.utc).isoformat()
+    path = os.path.join(_root(), MANIFEST)
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+
+
+# ------------------------------------------------------
+# Postgres → Arrow
+# ------------------------------------------------------
+def _arrow_type(col):
+    import pyarrow as pa
+
+    oid = col.type_code
+    if oid == 1700:                                        # numeric
+        return pa.decimal128(col.precision or 18, col.scale or 2)
+    return {
+        16: pa.bool_(),
+        20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+        700: pa.float32(), 701: pa.float64(),
+        1082: pa.date32(),
+        1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC"),
+    }.get(oid, pa.string())
+
+
+def _fetch_table(cur, sql: str, params: Optional[dict] = None):
+    import pyarrow as pa
+
+    cur.execute(sql, params or {})
+    columns = cur.description
+    rows = cur.fetchall()
+    schema = pa.schema([(c.name, _arrow_type(c)) for c in columns])
+    arrays = [
+        pa.array([r[i] for r in rows], type=schema.field(i).type)
+        for i in range(len(columns))
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _write_options() -> dict:
+    return {
+        "compression": "zstd",
+        "use_dictionary": True,
+        "write_statistics": True,
+        "row_group_size": settings.EXPORT_ROW_GROUP_SIZE,
+    }
+
+
+def _write_partitioned(table, name: str, tag: str) -> list[str]:
+    """Escreve numa área de staging e move para as partições; devolve os caminhos relativos"""
+    import pyarrow.parquet as pq
+
+    if table.num_rows == 0:
+        return []
+    staging = os.path.join(_root(), ".staging", tag, name)
+    pq.write_to_dataset(
+        table,
+        staging,
+        partition_cols=PARTITION_COLUMNS,
+        basename_template=f"part-{tag}-{{i}}.parquet",
+        **_write_options(),
+    )
+
+    written = []
+    for folder, _, files in os.walk(staging):
+        for file in files:
+            rel = os.path.join(name, os.path.relpath(os.path.join(folder, file), staging))
+            os.makedirs(os.path.dirname(os.path.join(_root(), rel)), exist_ok=True)
+            os.replace(os.path.join(folder, file), os.path.join(_root(), rel))
+            written.append(rel)
+    shutil.rmtree(os.path.join(_root(), ".staging", tag), ignore_errors=True)
+    return sorted(written)
+
+
+def _write_dimension(cur, name: str, tag: str) -> str:
+    import pyarrow.parquet as pq
+
+    table = _fetch_table(cur, f"SELECT * FROM {name}")
+    rel = f"{name}-{tag}.parquet"
+    tmp = os.path.join(_root(), f".{rel}.tmp")
+    pq.write_table(table, tmp, **_write_options())
+    os.replace(tmp, os.path.join(_root(), rel))
+    return rel
+
+
+# ------------------------------------------------------
+# Exportação incremental
+# ------------------------------------------------------
+def _read_watermark(conn) -> tuple[int, date, str]:
+    """Maior id de venda já commitado (nenhum lote da ingestão em voo), o dia atual e o pg_snapshot"""
+    with conn.transaction():
+        conn.execute("SELECT pg_advisory_xact_lock(%s)", [INGEST_FENCE_LOCK])
+        return conn.execute(
+            "SELECT COALESCE(MAX(id), 0), CURRENT_DATE, pg_current_snapshot()::text FROM sales"
+        ).fetchone()
+
+
+def _retire(manifest: dict, paths: list[str]):
+    now = time.time()
+    manifest.setdefault("retired", []).extend({"path": p, "at": now} for p in paths)
+
+
+def _purge_retired(manifest: dict):
+    """Apaga arquivos fora do manifesto há mais de EXPORT_RETIRE_SECONDS (leitores já trocaram)"""
+    keep = []
+    for item in manifest.get("retired", []):
+        if time.time() - item["at"] < settings.EXPORT_RETIRE_SECONDS:
+            keep.append(item)
+            continue
+        try:
+            os.remove(os.path.join(_root(), item["path"]))
+        except FileNotFoundError:
+            pass
+    manifest["retired"] = keep
+
+
+def _file_rows(paths: list[str]) -> int:
+    import pyarrow.parquet as pq
+
+    total = 0
+    for rel in paths:
+        try:
+            total += pq.ParquetFile(os.path.join(_root(), rel)).metadata.num_rows
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _export_batch(cur, manifest: dict, where: str, params: dict, tag: str, counts: dict,
+                  partitions: tuple = ()):
+    """Um lote de vendas em todas as tabelas; `partitions` (dia, loja) têm os arquivos antigos trocados"""
+    replaced = {f"date={day.isoformat()}/store_id={store_id}" for day, store_id in partitions}
+    for name, sql in EXPORTS.items():
+        table = _fetch_table(cur, sql.format(where=where), params)
+        files = _write_partitioned(table, name, tag)
+        entry = manifest["tables"].setdefault(name, {"files": [], "rows": 0})
+        if replaced:
+            old = [f for f in entry["files"] if os.path.relpath(os.path.dirname(f), name) in replaced]
+            entry["rows"] -= _file_rows(old)
+            entry["files"] = [f for f in entry["files"] if f not in set(old)]
+            _retire(manifest, old)
+        entry["files"].extend(files)
+        entry["rows"] += table.num_rows
+        counts[name] += table.num_rows
+
+
+def _changed_partitions(conn, since: str) -> list[tuple[date, int]]:
+    """(dia, loja) com vendas alteradas depois do snapshot `since`"""
+    buckets = watermarks.changed(conn, since, sales_filters())
+    return sorted({(day, store_id) for store_id, _, day in buckets})
+
+
+def _export(conn, manifest: dict, tag: str) -> dict:
+    since = manifest.get("versions")
+    hi, today, versions = _read_watermark(conn)
+    counts = {t: 0 for t in EXPORTS}
+
+    with conn.cursor() as cur:
+        if since is None:
+            lo = int(manifest.get("watermark") or 0)
+            step = settings.EXPORT_BATCH_SALES
+            for batch, start in enumerate(range(lo, hi, step)):
+                bounds = {"lo": start, "hi": min(start + step, hi)}
+                _export_batch(cur, manifest, BY_IDS, bounds, f"{tag}-{batch}", counts)
+                conn.commit()
+        else:
+            partitions = _changed_partitions(conn, since)
+            step = settings.EXPORT_BATCH_PARTITIONS
+            for batch, i in enumerate(range(0, len(partitions), step)):
+                chunk = partitions[i:i + step]
+                keys = {
+                    "first_day": chunk[0][0],
+                    "last_day": max(p[0] for p in chunk),
+                    "days": [p[0] for p in chunk],
+                    "store_ids": [p[1] for p in chunk],
+                }
+                _export_batch(cur, manifest, BY_PARTITIONS, keys, f"{tag}-p{batch}", counts, tuple(chunk))
+                conn.commit()
+
+        old_dims = list(manifest.get("dimensions", {}).values())
+        manifest["dimensions"] = {d: _write_dimension(cur, d, tag) for d in DIMENSION_TABLES}
+        _retire(manifest, old_dims)
+    conn.commit()
+
+    manifest["watermark"] = hi
+    manifest["versions"] = versions
+    # dias anteriores a hoje estão fechados; o que mudar neles depois de `versions`
+    # é lido do Postgres (duckdb_engine.split) até a próxima exportação
+    manifest["closed_through"] = (today - timedelta(days=1)).isoformat()
+    return counts
+
+
+def compact(manifest: dict, tag: str) -> int:
+    """Junta partições com muitos arquivos pequenos num arquivo só (ordenado por id)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    merged = 0
+    for name, entry in manifest["tables"].items():
+        by_partition: dict[str, list[str]] = defaultdict(list)
+        for rel in entry["files"]:
+            by_partition[os.path.dirname(rel)].append(rel)
+
+        for partition, files in by_partition.items():
+            if len(files) < settings.EXPORT_COMPACT_MIN_FILES:
+                continue
+            table = pa.concat_tables(
+                [pq.read_table(os.path.join(_root(), f), partitioning=None) for f in files],
+                promote_options="default",
+            ).sort_by("id")
+            rel = os.path.join(partition, f"compact-{tag}.parquet")
+            tmp = os.path.join(_root(), partition, f".compact-{tag}.tmp")
+            pq.write_table(table, tmp, **_write_options())
+            os.replace(tmp, os.path.join(_root(), rel))
+
+            done = set(files)
+            entry["files"] = [f for f in entry["files"] if f not in done] + [rel]
+            _retire(manifest, files)
+            merged += len(files)
+
+    manifest["compacted_at"] = time.time()
+    return merged
+
+
+def export_once(full: bool = False, compact_files: Optional[bool] = None) -> dict:
+    """Uma execução (incremental + compactação se estiver na hora); segura o lock de execução"""
+    root = _root()
+    with get_conn(WORKLOAD_PRIMARY) as conn:
+        got = conn.execute("SELECT pg_try_advisory_lock(%s)", [EXPORT_RUN_LOCK]).fetchone()[0]
+        conn.commit()
+        if not got:
+            return {"skipped": "outra exportação em andamento"}
+        try:
+            t0 = time.perf_counter()
+            progress["status"] = "running"
+            if full:
+                shutil.rmtree(root, ignore_errors=True)
+            os.makedirs(root, exist_ok=True)
+
+            manifest = load_manifest()
+            tag = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+            counts = _export(conn, manifest, tag)
+
+            if compact_files is None:
+                compact_files = (
+                    time.time() - manifest.get("compacted_at", 0) >= settings.EXPORT_COMPACT_INTERVAL_SECONDS
+                )
+            merged = compact(manifest, tag) if compact_files else 0
+
+            _purge_retired(manifest)
+            _save_manifest(manifest)
+
+            result = {
+                "rows": counts,
+                "compacted_files": merged,
+                "watermark": manifest["watermark"],
+                "closed_through": manifest["closed_through"],
+                "duration_ms": round((time.perf_counter() - t0) * 1000, 1),
+            }
+            progress.update(status="idle", last_run=result, last_error=None)
+            logger.info(f"📦 Snapshot Parquet: {result}")
+            return result
+        except Exception as e:
+            progress.update(status="error", last_error=str(e))
+            raise
+        finally:
+            conn.rollback()
+            conn.execute("SELECT pg_advisory_unlock(%s)", [EXPORT_RUN_LOCK])
+            conn.commit()
+
+
+async def run_exporter():
+    """Job de fundo: exportação incremental a cada EXPORT_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await asyncio.to_thread(export_once)
+        except Exception as e:
+            logger.error(f"❌ Falha na exportação Parquet: {e}")
+        await asyncio.sleep(settings.EXPORT_INTERVAL_SECONDS)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Snapshot Parquet das vendas (particionado por data/loja)")
+    parser.add_argument("--full", action="store_true", help="apaga o snapshot e exporta tudo de novo")
+    parser.add_argument("--compact", action="store_true", help="força a compactação das partições")
+    args = parser.parse_args()
+
+    print(export_once(full=args.full, compact_files=True if args.compact else None))
@@ -0,0 +1,210 @@
+# backend/app/services/fanout.py
+"""
+Execução map-reduce de agregações sobre períodos longos.
+
+Um período grande (ex.: um ano de /sales/products/margin) vira uma
+consulta por mês, executadas em paralelo em conexões separadas do pool
+de analytics; os agregados parciais são combinados aqui. A latência
+passa a escalar com os núcleos do banco em vez de ficar presa num só
+backend.
+
+Só funciona para agregados decomponíveis: sum, count, min e max (média
+= soma / contagem no finalize). Cada endpoint que aceita o modo declara
+um FanoutShape — o SQL parcial (sem ORDER BY/LIMIT, para o top-K ficar
+exato) e como combinar as linhas.
+"""
+
+import contextvars
+import heapq
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Callable, Optional
+
+from .. import queries
+from ..db import get_conn, WORKLOAD_ANALYTICS
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+_COMBINE: dict[str, Callable[[Any, Any], Any]] = {
+    "sum": lambda a, b: b if a is None else a if b is None else a + b,
+    "count": lambda a, b: (a or 0) + (b or 0),
+    "min": lambda a, b: b if a is None else a if b is None else min(a, b),
+    "max": lambda a, b: b if a is None else a if b is None else max(a, b),
+}
+
+
+@dataclass
+class Merge:
+    keys: int                                   # colunas iniciais = chave do GROUP BY
+    aggs: tuple[str, ...]                       # uma por coluna restante: sum | count | min | max
+    sort_key: Optional[Callable[[tuple], Any]] = None   # sobre a linha final (maior primeiro)
+    finalize: Optional[Callable[[tuple], tuple]] = None  # colunas derivadas (média, margem...)
+
+
+@dataclass
+class FanoutShape:
+    name: str
+    merge: Merge
+
+
+SHAPES: dict[str, FanoutShape] = {}
+
+stats: dict = {"runs": 0, "chunks": 0, "max_chunks": 0, "total_ms": 0.0}
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.FANOUT_MAX_WORKERS, thread_name_prefix="fanout"
+)
+
+
+def register(name: str, sql: str, merge: Merge) -> FanoutShape:
+    """Declara a versão parcial de um shape (mesmos parâmetros de SALES_WHERE/ROLLUP_WHERE)"""
+    if len(merge.aggs) == 0 or any(a not in _COMBINE for a in merge.aggs):
+        raise ValueError(f"Agregações não decomponíveis em {name}: {merge.aggs}")
+    shape = FanoutShape(name=queries.register(f"{name}_partial", sql), merge=merge)
+    SHAPES[name] = shape
+    return shape
+
+
+# ------------------------------------------------------
+# Divisão do período
+# ------------------------------------------------------
+_EXTENT_TTL_SECONDS = 300
+_extent: Optional[tuple[date, date]] = None
+_extent_at = 0.0
+
+
+def _data_extent() -> Optional[tuple[date, date]]:
+    """Primeiro e último dia com vendas (só para fatiar períodos abertos)"""
+    global _extent, _extent_at
+    if _extent is not None and time.monotonic() - _extent_at < _EXTENT_TTL_SECONDS:
+        return _extent
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        lo, hi = conn.execute(
+            "SELECT MIN(DATE(created_at)), MAX(DATE(created_at)) FROM sales"
+        ).fetchone()
+    _extent = (lo, hi) if lo and hi else None
+    _extent_at = time.monotonic()
+    return _extent
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def month_chunks(start: Optional[date], end: Optional[date]) -> list[tuple[Optional[date], Optional[date]]]:
+    """
+    Fatias mensais de [start, end) (end exclusivo, como em sales_filters).
+    Extremos abertos continuam abertos na primeira/última fatia, então
+    vendas fora do extent em cache ainda entram no resultado.
+    """
+    extent = _data_extent()
+    if extent is None:
+        return [(start, end)]
+    first = max(start, extent[0]) if start else extent[0]
+    last = min(end, extent[1] + timedelta(days=1)) if end else extent[1] + timedelta(days=1)
+    if first >= last or (last - first).days < settings.FANOUT_MIN_DAYS:
+        return [(start, end)]
+
+    edges = [first]
+    cursor = _next_month(first)
+    while cursor < last:
+        edges.append(cursor)
+        cursor = _next_month(cursor)
+    edges.append(last)
+
+    chunks = list(zip(edges[:-1], edges[1:]))
+    chunks[0] = (start, chunks[0][1])
+    chunks[-1] = (chunks[-1][0], end)
+    return chunks
+
+
+def plan(params: dict) -> Optional[list[tuple[Optional[date], Optional[date]]]]:
+    """Fatias do período quando vale dividir (None = uma consulta só); vão direto para run()"""
+    if not settings.FANOUT_ENABLED:
+        return None
+    chunks = month_chunks(params["start"], params["end"])
+    return chunks if len(chunks) > 1 else None
+
+
+# ------------------------------------------------------
+# Map / reduce
+# ------------------------------------------------------
+def _run_chunk(name: str, params: dict) -> list[tuple]:
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        return queries.run(conn, name, params)
+
+
+def combine(merge: Merge, partials: list[list[tuple]]) -> list[tuple]:
+    groups: dict[tuple, list] = {}
+    for rows in partials:
+        for row in rows:
+            key = tuple(row[:merge.keys])
+            values = row[merge.keys:]
+            acc = groups.get(key)
+            if acc is None:
+                groups[key] = list(values)
+                continue
+            for i, agg in enumerate(merge.aggs):
+                acc[i] = _COMBINE[agg](acc[i], values[i])
+
+    rows = [key + tuple(values) for key, values in groups.items()]
+    if merge.finalize is not None:
+        rows = [merge.finalize(r) for r in rows]
+    return rows
+
+
+def submit(shape: FanoutShape, params: dict) -> Future:
+    """Agenda uma fatia no executor, com uma cópia do contexto da requisição"""
+    return _executor.submit(contextvars.copy_context().run, _run_chunk, shape.name, params)
+
+
+def gather(futures: list[Future]) -> list[list[tuple]]:
+    try:
+        return [f.result() for f in futures]
+    except Exception:
+        for f in futures:
+            f.cancel()
+        raise
+
+
+def finish(shape: FanoutShape, partials: list[list[tuple]], limit: Optional[int] = None) -> list[tuple]:
+    """Combina os parciais e aplica a ordenação / top-K do shape"""
+    rows = combine(shape.merge, partials)
+    if shape.merge.sort_key is None:
+        return rows
+    if limit is not None:
+        return heapq.nlargest(limit, rows, key=shape.merge.sort_key)
+    return sorted(rows, key=shape.merge.sort_key, reverse=True)
+
+
+def run(shape: FanoutShape, params: dict, chunks: list[tuple[Optional[date], Optional[date]]],
+        limit: Optional[int] = None) -> list[tuple]:
+    """
+    Executa o shape parcial em fatias mensais concorrentes e combina.
+    Cada fatia roda com uma cópia do contexto da requisição, então o
+    orçamento (statement_timeout / cancelamento) vale para todas.
+    `chunks` é o retorno de plan().
+    """
+    t0 = time.perf_counter()
+    futures = [submit(shape, {**params, "start": s, "end": e}) for s, e in chunks]
+    rows = finish(shape, gather(futures), limit)
+
+    ms = (time.perf_counter() - t0) * 1000
+    stats["runs"] += 1
+    stats["chunks"] += len(chunks)
+    stats["max_chunks"] = max(stats["max_chunks"], len(chunks))
+    stats["total_ms"] += ms
+    logger.debug(f"🧩 {shape.name}: {len(chunks)} fatias em {ms:.0f}ms")
+    return rows
+
+
+def snapshot() -> dict:
+    return {
+        **stats,
+        "avg_ms": round(stats["total_ms"] / stats["runs"], 1) if stats["runs"] else None,
+        "shapes": sorted(SHAPES),
+    }
@@ -0,0 +1,210 @@
+# backend/app/services/forecast.py
+"""
+Previsão diária de faturamento e pedidos por loja × canal.
+
+O modelo (Holt-Winters amortecido com multiplicadores por dia da semana,
+services/analysis.py) fica em memória no processo da API, já ajustado:
+uma previsão é só a leitura do modelo atual (sem lock, sem conexão) e a
+projeção do estado.
+
+Um job de fundo (run_refresher) mantém o modelo em dia. A conexão só é
+usada nas leituras; o ajuste roda depois de devolvê-la, no pool de
+processos (app/compute.py).
+
+  - Ajuste completo: últimos FORECAST_HISTORY_DAYS dias fechados (até
+    ontem), todas as séries de uma vez. Feito no startup.
+  - Dia novo fechado: só os dias que faltam são lidos e o estado (de
+    todas as combinações da grade) anda esses dias — a escolha dos
+    parâmetros por série acompanha sem refazer o ajuste.
+  - Qualquer escrita em vendas de dias já ajustados ou uma série nova →
+    ajuste completo. O gatilho é sales_bucket_versions
+    (services/watermarks.py), que marca o bucket em toda escrita, de
+    qualquer status: uma venda tardia, mas também um cancelamento ou uma
+    troca de status de um pedido antigo refazem o ajuste, mesmo quando o
+    faturamento COMPLETED daquele dia não mudou. É aceito: o ajuste
+    completo roda fora das requisições e as séries nunca ficam velhas.
+
+As checagens rodam a cada FORECAST_CHECK_SECONDS.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+
+from .. import queries
+from ..db import get_conn, WORKLOAD_ANALYTICS
+from ..queries import sales_filters
+from ..settings import settings
+from . import analysis, watermarks
+
+logger = logging.getLogger(__name__)
+
+Q_STATUS = queries.register("forecast_status", "SELECT CURRENT_DATE, pg_current_snapshot()::text")
+
+Q_DAILY = queries.register("forecast_daily", """
+    SELECT DATE(s.created_at), s.store_id, s.channel_id, SUM(s.total_amount), COUNT(*)
+    FROM sales s
+    WHERE s.sale_status_desc = 'COMPLETED'
+      AND DATE(s.created_at) >= %(start)s::date
+      AND DATE(s.created_at) < %(end)s::date
+    GROUP BY 1, 2, 3
+""")
+
+
+@dataclass
+class Model:
+    series: list[tuple[int, int]]          # (store_id, channel_id); colunas: faturamento e depois pedidos
+    first_day: date
+    through: date                          # último dia fechado no estado
+    watermark: str                         # snapshot tirado antes da leitura
+    state: dict
+    best: dict
+
+
+_model: Optional[Model] = None
+_lock = threading.Lock()          # um refresh por vez (job de fundo e chamadas manuais)
+_stats = {"checks": 0, "fits": 0, "updates": 0, "fit_ms": 0.0, "update_ms": 0.0, "last_error": None}
+
+
+def _days(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+def _weekdays(days: list[date]) -> np.ndarray:
+    return np.array([d.weekday() for d in days], dtype=np.intp)
+
+
+def _matrix(rows, days: list[date], series: list[tuple[int, int]]) -> np.ndarray:
+    """Linhas de Q_DAILY → [dias, 2 × séries] (faturamento | pedidos), zeros onde não houve venda"""
+    day_at = {d: i for i, d in enumerate(days)}
+    col_at = {key: j for j, key in enumerate(series)}
+    y = np.zeros((len(days), 2 * len(series)))
+    for day, store_id, channel_id, revenue, orders in rows:
+        j = col_at[(store_id, channel_id)]
+        y[day_at[day], j] = float(revenue or 0)
+        y[day_at[day], len(series) + j] = orders
+    return y
+
+
+def _fit(rows, today: date, snapshot: str) -> Optional[Model]:
+    if not rows:
+        return None
+    first = min(r[0] for r in rows)
+    days = _days(first, today)
+    if len(days) < analysis.WARMUP_DAYS + analysis.SEASON:
+        return None
+    series = sorted({(r[1], r[2]) for r in rows})
+    t0 = time.perf_counter()
+    state = analysis.smoothing_fit(_matrix(rows, days, series), _weekdays(days))
+    _stats["fits"] += 1
+    _stats["fit_ms"] += (time.perf_counter() - t0) * 1000
+    logger.info(f"📈 Previsão ajustada: {len(series)} séries, {len(days)} dias")
+    return Model(series, first, days[-1], snapshot, state, analysis.smoothing_best(state))
+
+
+def _pending(conn, model: Model, today: date) -> Optional[tuple[list[date], list]]:
+    """Dias fechados que faltam ao estado e as vendas deles; None quando só um ajuste completo serve"""
+    fitted_days = sales_filters(end=model.through.isoformat(), end_inclusive=True)
+    if watermarks.changed(conn, model.watermark, fitted_days):
+        return None
+    days = _days(model.through + timedelta(days=1), today)
+    if not days:
+        return days, []
+    rows = queries.run(conn, Q_DAILY, {"start": days[0], "end": today})
+    if any((r[1], r[2]) not in model.series for r in rows):
+        return None
+    return days, rows
+
+
+def _update(model: Model, days: list[date], rows, snapshot: str) -> Model:
+    """Anda o estado até ontem"""
+    if not days:
+        return Model(model.series, model.first_day, model.through, snapshot, model.state, model.best)
+    t0 = time.perf_counter()
+    state = analysis.smoothing_update(model.state, _matrix(rows, days, model.series), _weekdays(days))
+    _stats["updates"] += 1
+    _stats["update_ms"] += (time.perf_counter() - t0) * 1000
+    return Model(model.series, model.first_day, days[-1], snapshot, state, analysis.smoothing_best(state))
+
+
+def refresh():
+    """Põe o modelo em dia: leituras com uma conexão, ajuste depois de devolvê-la"""
+    global _model
+    with _lock:
+        model = _model
+        with get_conn(WORKLOAD_ANALYTICS) as conn:
+            today, snapshot = queries.run(conn, Q_STATUS, one=True)
+            pending = _pending(conn, model, today) if model is not None else None
+            if pending is None:
+                start = today - timedelta(days=settings.FORECAST_HISTORY_DAYS)
+                history = queries.run(conn, Q_DAILY, {"start": start, "end": today})
+
+        _model = _update(model, *pending, snapshot) if pending is not None else _fit(history, today, snapshot)
+        _stats["checks"] += 1
+
+
+def current() -> Optional[Model]:
+    """Modelo atual (None = ainda não ajustado ou histórico insuficiente)"""
+    return _model
+
+
+def ready() -> bool:
+    """Já houve ao menos uma checagem (o None de current() é definitivo)"""
+    return _stats["checks"] > 0
+
+
+async def run_refresher():
+    """Job de fundo: ajuste no startup e checagem a cada FORECAST_CHECK_SECONDS"""
+    while True:
+        try:
+            await asyncio.to_thread(refresh)
+            _stats["last_error"] = None
+        except Exception as e:
+            _stats["last_error"] = str(e)
+            logger.error(f"❌ Falha ao atualizar a previsão: {e}")
+        await asyncio.sleep(settings.FORECAST_CHECK_SECONDS)
+
+
+def predict(model: Model, horizon: int, store_ids: list[int], channel_ids: list[int]) -> list[dict]:
+    """Linhas (dia, loja, canal, faturamento, pedidos) dos próximos `horizon` dias"""
+    days = _days(model.through + timedelta(days=1), model.through + timedelta(days=horizon + 1))
+    y = analysis.smoothing_forecast(model.best, _weekdays(days))
+    n = len(model.series)
+    out = []
+    for j, (store_id, channel_id) in enumerate(model.series):
+        if (store_ids and store_id not in store_ids) or (channel_ids and channel_id not in channel_ids):
+            continue
+        for i, day in enumerate(days):
+            out.append({
+                "day": day,
+                "store_id": store_id,
+                "channel_id": channel_id,
+                "revenue": round(float(y[i, j]), 2),
+                "orders": round(float(y[i, n + j]), 1),
+            })
+    return out
+
+
+def snapshot() -> dict:
+    model = _model
+    info = {
+        **_stats,
+        "fit_ms": round(_stats["fit_ms"], 1),
+        "update_ms": round(_stats["update_ms"], 1),
+        "fitted": model is not None,
+    }
+    if model is not None:
+        info.update({
+            "series": len(model.series),
+            "first_day": model.first_day.isoformat(),
+            "through": model.through.isoformat(),
+            "rmse_revenue": round(float(model.best["rmse"][:len(model.series)].mean()), 2),
+            "rmse_orders": round(float(model.best["rmse"][len(model.series):].mean()), 2),
+        })
+    return info
@@ -0,0 +1,377 @@
+# backend/app/services/index_advisor.py
+"""
+Conselheiro de índices.
+
+Reexecuta a carga dos routers contra conjuntos de índices candidatos e
+mede, por endpoint, quanto cada um ajuda — e quanto custa para a escrita
+(tamanho, bytes por linha, índices a mais na tabela).
+
+Carga:
+  - sintética (padrão): chama os endpoints GET de /sales e /metadata com
+    algumas combinações de filtro (sem período, últimos 30 dias, últimos
+    7 dias de uma loja) e grava os shapes/parâmetros que cada um executou;
+  - gravada: --workload <arquivo JSONL> no formato do log de consultas
+    lentas (app/slowlog.py): shape, endpoint e params por linha.
+
+Cada candidato é criado de verdade dentro de uma transação que é
+desfeita no final (ROLLBACK): nada fica no banco, mas o CREATE INDEX
+segura um lock SHARE na tabela (bloqueia escritas) enquanto mede. Em
+produção, aponte --db-url para uma cópia.
+
+Custo = custo estimado pelo planner (EXPLAIN); com --analyze, tempo real
+de execução (EXPLAIN ANALYZE). Os candidatos com ganho ≥ --min-gain em
+algum endpoint entram numa migração (CREATE INDEX CONCURRENTLY):
+
+    python -m app.services.index_advisor
+    python -m app.services.index_advisor --analyze --workload data/slow_queries.jsonl
+"""
+
+import argparse
+import inspect
+import json
+import logging
+import os
+import statistics
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import psycopg
+
+from .. import queries
+from ..budget import QueryBudget, budget_ms, set_budget
+from ..db import connect_primary, get_conn, WORKLOAD_READ
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Candidate:
+    name: str
+    table: str
+    definition: str          # colunas / INCLUDE / WHERE, depois do nome da tabela
+
+    def ddl(self, concurrently: bool = False) -> str:
+        mode = "CONCURRENTLY " if concurrently else ""
+        return f"CREATE INDEX {mode}IF NOT EXISTS {self.name} ON {self.table} {self.definition}"
+
+
+CANDIDATES: list[Candidate] = [
+    # join product_sales → sales sem voltar à heap para quantidade/valor
+    Candidate("idx_product_sales_sale_cover", "product_sales",
+              "(sale_id) INCLUDE (product_id, quantity, total_price)"),
+    # status + período como o SALES_WHERE filtra (DATE(created_at))
+    Candidate("idx_sales_status_day_cover", "sales",
+              "(sale_status_desc, DATE(created_at)) INCLUDE (store_id, channel_id, total_amount)"),
+    Candidate("idx_sales_status_created_cover", "sales",
+              "(sale_status_desc, created_at) INCLUDE (store_id, channel_id, total_amount)"),
+    Candidate("idx_sales_store_day", "sales", "(store_id, DATE(created_at))"),
+    Candidate("idx_sales_customer_created", "sales", "(customer_id, created_at)"),
+    Candidate("idx_item_product_sales_product_sale", "item_product_sales",
+              "(product_sale_id) INCLUDE (item_id, quantity, price)"),
+    Candidate("idx_payments_sale", "payments", "(sale_id) INCLUDE (payment_type_id, value)"),
+    Candidate("idx_delivery_addresses_sale", "delivery_addresses", "(sale_id) INCLUDE (neighborhood, city)"),
+]
+
+
+@dataclass
+class WorkItem:
+    endpoint: str
+    shape: str
+    params: dict
+    weight: float = 1.0
+
+
+# ------------------------------------------------------
+# Carga
+# ------------------------------------------------------
+def synthetic_workload() -> list[WorkItem]:
+    """Chama os endpoints (sem cache) e grava os shapes que cada um executou"""
+    from fastapi.routing import APIRoute
+    from ..main import app
+    from .warmup import kwargs_for
+
+    # só o Postgres interessa aqui; uma consulta por período (sem fatias mensais)
+    settings.CACHE_ENABLED = False
+    settings.DUCKDB_ENABLED = False
+    settings.FANOUT_ENABLED = False
+    settings.SLOW_QUERY_ENABLED = False
+
+    with get_conn(WORKLOAD_READ) as conn:
+        last_day, store_id = conn.execute(
+            "SELECT (SELECT max(created_at)::date FROM sales), (SELECT min(id) FROM stores WHERE is_active)"
+        ).fetchone()
+    combos = [{"start": None, "end": None}]
+    for days, scope in ((30, {}), (7, {"store_id": store_id})):
+        start = last_day - timedelta(days=days - 1)
+        combos.append({"start": start.isoformat(), "end": last_day.isoformat(), **scope})
+
+    routes = [
+        r for r in app.routes
+        if isinstance(r, APIRoute) and "GET" in r.methods
+        and r.path.removeprefix(settings.API_PREFIX).startswith(("/sales/", "/metadata/"))
+        and r.path.removeprefix(settings.API_PREFIX) not in ("/sales/live", "/sales/freshness")
+    ]
+
+    items = []
+    for combo in combos:
+        for route in routes:
+            path = route.path.removeprefix(settings.API_PREFIX)
+            kwargs = kwargs_for(inspect.signature(route.endpoint), combo)
+            if kwargs is None:
+                continue
+            queries.reset_samples()
+            set_budget(QueryBudget(path, budget_ms(path)))
+            try:
+                route.endpoint(**kwargs)
+            except Exception as e:
+                logger.warning(f"⚠️ {path} {kwargs}: {e}")
+                continue
+            finally:
+                set_budget(None)
+            for shape, params in queries.endpoint_samples().get(path, {}).items():
+                items.append(WorkItem(path, shape, params))
+    return items
+
+
+def recorded_workload(path: str) -> list[WorkItem]:
+    """Linhas JSONL {shape, endpoint, params}; repetições viram peso"""
+    from .. import main  # noqa: F401 — registra os shapes dos routers
+
+    grouped: dict[tuple, WorkItem] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue
+            if r.get("shape") not in queries.SHAPES:
+                continue
+            key = (r.get("endpoint"), r["shape"], json.dumps(r.get("params"), sort_keys=True))
+            if key in grouped:
+                grouped[key].weight += 1
+            else:
+                grouped[key] = WorkItem(r.get("endpoint") or r["shape"], r["shape"], r.get("params") or {})
+    return list(grouped.values())
+
+
+# ------------------------------------------------------
+# Medição
+# ------------------------------------------------------
+def _begin(conn):
+    conn.execute("SELECT set_config('statement_timeout', %s, true)", [str(settings.QUERY_BUDGET_DEFAULT_MS * 10)])
+    conn.execute("SET LOCAL lock_timeout = '5s'")
+
+
+def _explain(conn, item: WorkItem, analyze: bool) -> float:
+    mode = "ANALYZE, FORMAT JSON" if analyze else "FORMAT JSON"
+    plan = conn.execute(f"EXPLAIN ({mode}) {queries.SHAPES[item.shape].sql}", item.params).fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return float(plan[0]["Execution Time"] if analyze else plan[0]["Plan"]["Total Cost"])
+
+
+def _measure(conn, items: list[WorkItem], analyze: bool, repeat: int) -> list[Optional[float]]:
+    """
+    Custo (ou tempo, com analyze) de cada item; erro → None.
+    Com analyze, a 1ª execução só aquece o cache e vale a mediana das `repeat` seguintes.
+    """
+    out = []
+    for item in items:
+        conn.execute("SAVEPOINT advisor_item")
+        try:
+            if analyze:
+                _explain(conn, item, analyze)
+                value = statistics.median(_explain(conn, item, analyze) for _ in range(repeat))
+            else:
+                value = _explain(conn, item, analyze)
+            conn.execute("RELEASE SAVEPOINT advisor_item")
+        except psycopg.Error as e:
+            conn.execute("ROLLBACK TO SAVEPOINT advisor_item")
+            logger.warning(f"⚠️ {item.shape}: {e}")
+            value = None
+        out.append(value)
+    return out
+
+
+def _evaluate(conn, candidates: list[Candidate], tables: set[str], items: list[WorkItem],
+              analyze: bool, repeat: int) -> dict:
+    """Cria os candidatos, mede a carga e desfaz tudo"""
+    _begin(conn)
+    try:
+        built = {}
+        for c in candidates:
+            t0 = time.perf_counter()
+            conn.execute(c.ddl())
+            size, rows = conn.execute(
+                "SELECT pg_relation_size(%s::regclass), GREATEST(reltuples, 1)::bigint FROM pg_class WHERE oid = %s::regclass",
+                [c.name, c.table],
+            ).fetchone()
+            built[c.name] = {
+                "build_ms": round((time.perf_counter() - t0) * 1000, 1),
+                "size_mb": round(size / 2**20, 2),
+                "bytes_per_row": round(size / rows, 1),
+            }
+        # estatísticas das expressões indexadas (ex.: DATE(created_at)); o baseline também analisa
+        for table in sorted(tables):
+            conn.execute(f"ANALYZE {table}")
+        return {"indexes": built, "costs": _measure(conn, items, analyze, repeat)}
+    finally:
+        conn.rollback()
+
+
+def _by_endpoint(items: list[WorkItem], costs: list[Optional[float]], skip: set[int]) -> dict[str, float]:
+    totals: dict[str, float] = defaultdict(float)
+    for i, (item, cost) in enumerate(zip(items, costs)):
+        if i not in skip:
+            totals[item.endpoint] += item.weight * cost
+    return dict(totals)
+
+
+def _gains(base: dict[str, float], other: dict[str, float]) -> dict[str, dict]:
+    return {
+        endpoint: {
+            "before": round(before, 2),
+            "after": round(other[endpoint], 2),
+            "speedup": round(before / other[endpoint], 2) if other[endpoint] else None,
+            "gain": round(1 - other[endpoint] / before, 3) if before else 0.0,
+        }
+        for endpoint, before in sorted(base.items())
+    }
+
+
+def advise(items: list[WorkItem], candidates: list[Candidate], analyze: bool = False,
+           repeat: int = 3, min_gain: float = 0.2, db_url: Optional[str] = None) -> dict:
+    tables = {c.table for c in candidates}
+    conn = psycopg.connect(db_url) if db_url else connect_primary()
+    try:
+        index_counts = dict(conn.execute(
+            "SELECT c.relname, count(i.indexrelid) FROM pg_class c "
+            "LEFT JOIN pg_index i ON i.indrelid = c.oid WHERE c.relname = ANY(%s) GROUP BY c.relname",
+            [sorted(tables)],
+        ).fetchall())
+
+        baseline = _evaluate(conn, [], tables, items, analyze, repeat)["costs"]
+        runs = {}
+        for c in candidates:
+            try:
+                runs[c.name] = _evaluate(conn, [c], tables, items, analyze, repeat)
+            except psycopg.Error as e:
+                logger.warning(f"⚠️ Candidato {c.name} falhou: {e}")
+
+        # itens que falharam em alguma rodada ficam fora de todas as comparações
+        skip = {i for i, cost in enumerate(baseline) if cost is None}
+        for run in runs.values():
+            skip |= {i for i, cost in enumerate(run["costs"]) if cost is None}
+        base = _by_endpoint(items, baseline, skip)
+
+        report = []
+        for c in candidates:
+            if c.name not in runs:
+                continue
+            gains = _gains(base, _by_endpoint(items, runs[c.name]["costs"], skip))
+            best = max((g["gain"] for g in gains.values()), default=0.0)
+            report.append({
+                "name": c.name,
+                "ddl": c.ddl(),
+                **runs[c.name]["indexes"][c.name],
+                "table_indexes": f"{index_counts.get(c.table, 0)} → {index_counts.get(c.table, 0) + 1}",
+                "best_gain": best,
+                "recommended": best >= min_gain,
+                "endpoints": {e: g for e, g in gains.items() if abs(g["gain"]) >= 0.01},
+            })
+
+        chosen = [c for c in candidates if any(r["name"] == c.name and r["recommended"] for r in report)]
+        combined = None
+        if chosen:
+            run = _evaluate(conn, chosen, tables, items, analyze, repeat)
+            combined = _gains(base, _by_endpoint(items, run["costs"], skip))
+    finally:
+        conn.close()
+
+    return {
+        "metric": "execution_ms" if analyze else "planner_cost",
+        "items": len(items),
+        "skipped_items": len(skip),
+        "candidates": sorted(report, key=lambda r: r["best_gain"], reverse=True),
+        "recommended": [c.name for c in chosen],
+        "combined": combined,
+    }
+
+
+def write_migration(path: str, chosen: list[Candidate], result: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    lines = [
+        f"-- Índices recomendados pelo index_advisor em {datetime.now().isoformat(timespec='seconds')}",
+        f"-- métrica: {result['metric']}, {result['items']} consultas da carga",
+        "-- CONCURRENTLY não roda dentro de transação: aplicar com autocommit.",
+        "",
+    ]
+    by_name = {r["name"]: r for r in result["candidates"]}
+    for c in chosen:
+        r = by_name[c.name]
+        lines.append(f"-- ganho máx. {r['best_gain']:.0%}, {r['size_mb']} MB, índices em {c.table}: {r['table_indexes']}")
+        lines.append(c.ddl(concurrently=True) + ";")
+        lines.append("")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def _print(result: dict):
+    print(f"\nMétrica: {result['metric']} | consultas: {result['items']} (ignoradas: {result['skipped_items']})\n")
+    for r in result["candidates"]:
+        flag = "✅" if r["recommended"] else "  "
+        print(f"{flag} {r['name']:<40} ganho máx. {r['best_gain']:>6.0%}  {r['size_mb']:>8} MB  "
+              f"{r['bytes_per_row']:>6} B/linha  índices {r['table_indexes']}")
+        for endpoint, g in r["endpoints"].items():
+            print(f"      {endpoint:<40} {g['before']:>12} → {g['after']:>12}  (x{g['speedup']})")
+    if result["combined"]:
+        print("\nConjunto recomendado:")
+        for endpoint, g in result["combined"].items():
+            if abs(g["gain"]) >= 0.01:
+                print(f"   {endpoint:<40} x{g['speedup']}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Avalia índices candidatos contra a carga dos endpoints")
+    parser.add_argument("--workload", help="JSONL gravado (formato do log de consultas lentas); padrão: carga sintética")
+    parser.add_argument("--db-url", help="banco onde os candidatos são testados (padrão: primário da API)")
+    parser.add_argument("--analyze", action="store_true", help="mede tempo real (EXPLAIN ANALYZE) em vez do custo estimado")
+    parser.add_argument("--repeat", type=int, default=3, help="execuções medidas por consulta com --analyze (mediana)")
+    parser.add_argument("--min-gain", type=float, default=0.2, help="ganho mínimo em algum endpoint para recomendar")
+    parser.add_argument("--only", action="append", help="avalia só estes candidatos (nome)")
+    parser.add_argument("--candidate", action="append", default=[],
+                        help='candidato extra: "nome:tabela:(colunas) INCLUDE (...)"')
+    parser.add_argument("--output", help="arquivo de migração (padrão: migrations/<data>_advised_indexes.sql)")
+    parser.add_argument("--json", action="store_true", help="imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    candidates = [c for c in CANDIDATES if not args.only or c.name in args.only]
+    for spec in args.candidate:
+        name, table, definition = spec.split(":", 2)
+        candidates.append(Candidate(name, table, definition))
+
+    items = recorded_workload(args.workload) if args.workload else synthetic_workload()
+    if not items:
+        raise SystemExit("Carga vazia: nada para avaliar")
+
+    result = advise(items, candidates, analyze=args.analyze, repeat=args.repeat, min_gain=args.min_gain, db_url=args.db_url)
+    chosen = [c for c in candidates if c.name in result["recommended"]]
+
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+    else:
+        _print(result)
+
+    if chosen:
+        output = args.output or os.path.join(
+            "migrations", f"{datetime.now():%Y%m%d_%H%M%S}_advised_indexes.sql"
+        )
+        write_migration(output, chosen, result)
+        print(f"\n📝 Migração: {output}")
+    else:
+        print("\nNenhum candidato atingiu o ganho mínimo")
@@ -0,0 +1,230 @@
+# backend/app/services/ingest.py
+"""
+Gravação de lotes de vendas.
+
+Um lote = uma transação no primário:
+  1. reserva os ids (nextval em lote) de sales / product_sales / delivery_sales,
+     para que os filhos já saibam o id do pai sem RETURNING linha a linha;
+  2. COPY em cada tabela;
+  3. atualiza os rollups incrementais (services/rollups.py) com os ids do lote;
+  4. o trigger do change feed notifica (loja, canal, dia) no commit e o
+     cache é invalidado só nessas chaves (sem o feed: invalidação total).
+"""
+
+import json
+import threading
+import time
+from typing import Any
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from .. import cache
+from ..db import get_conn, pool_stats, WORKLOAD_PRIMARY
+from ..schemas.ingest import IngestResult, IngestSale, SalesBatch
+from ..settings import settings
+from . import changefeed, exporter, rollups
+
+# lotes simultâneos (o resto recebe 429 em vez de enfileirar no pool)
+_slots = threading.BoundedSemaphore(settings.INGEST_MAX_CONCURRENT_BATCHES)
+
+_SALES_COLUMNS = (
+    "id", "store_id", "channel_id", "customer_id", "customer_name", "cod_sale1",
+    "created_at", "sale_status_desc", "total_amount_items", "total_discount",
+    "total_increase", "delivery_fee", "service_tax_fee", "total_amount", "value_paid",
+    "production_seconds", "delivery_seconds", "people_quantity", "discount_reason", "origin",
+)
+_PRODUCT_COLUMNS = ("id", "sale_id", "product_id", "quantity", "base_price", "total_price", "observations")
+_ITEM_COLUMNS = ("product_sale_id", "item_id", "option_group_id", "quantity", "additional_price", "price", "amount")
+_DELIVERY_COLUMNS = (
+    "id", "sale_id", "courier_name", "courier_phone", "courier_type",
+    "delivery_type", "status", "delivery_fee", "courier_fee",
+)
+_ADDRESS_COLUMNS = (
+    "sale_id", "delivery_sale_id", "street", "number", "complement",
+    "neighborhood", "city", "state", "postal_code", "latitude", "longitude",
+)
+_PAYMENT_COLUMNS = ("sale_id", "payment_type_id", "value", "is_online")
+
+
+# ------------------------------------------------------
+# Parsing (NDJSON ou colunar)
+# ------------------------------------------------------
+def _validation_error(e: ValidationError) -> HTTPException:
+    errors = [
+        {"row": err["loc"][0] if err["loc"] else None,
+         "field": ".".join(str(p) for p in err["loc"][1:]),
+         "error": err["msg"]}
+        for err in e.errors()[:50]
+    ]
+    return HTTPException(status_code=422, detail={"error": "Lote inválido", "errors": errors})
+
+
+def parse_ndjson(body: bytes) -> list[IngestSale]:
+    """Uma venda por linha; o lote é validado numa única chamada ao pydantic-core"""
+    lines = [line for line in body.split(b"\n") if line.strip()]
+    try:
+        return SalesBatch.validate_json(b"[" + b",".join(lines) + b"]")
+    except ValidationError as e:
+        raise _validation_error(e)
+
+
+def parse_columnar(payload: Any) -> list[IngestSale]:
+    """
+    {"columns": {"store_id": [...], "channel_id": [...], "products": [[...], ...]}}
+    (uma lista por campo, todas do mesmo tamanho). Também aceita uma lista de vendas.
+    """
+    if isinstance(payload, dict) and isinstance(payload.get("columns"), dict):
+        columns = payload["columns"]
+        sizes = {len(v) for v in columns.values() if isinstance(v, list)}
+        if len(sizes) != 1 or len(columns) != sum(isinstance(v, list) for v in columns.values()):
+            raise HTTPException(status_code=422, detail="Colunas devem ser listas do mesmo tamanho")
+        names = list(columns)
+        rows = [dict(zip(names, values)) for values in zip(*columns.values())]
+    elif isinstance(payload, list):
+        rows = payload
+    else:
+        raise HTTPException(status_code=422, detail="Esperado {'columns': {...}} ou lista de vendas")
+
+    try:
+        return SalesBatch.validate_python(rows)
+    except ValidationError as e:
+        raise _validation_error(e)
+
+
+def parse_body(body: bytes, content_type: str) -> list[IngestSale]:
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        return parse_ndjson(body)
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    return parse_columnar(payload)
+
+
+# ------------------------------------------------------
+# Backpressure
+# ------------------------------------------------------
+def _busy(detail: str, status_code: int = 503) -> HTTPException:
+    return HTTPException(
+        status_code=status_code,
+        detail=detail,
+        headers={"Retry-After": str(settings.INGEST_RETRY_AFTER_SECONDS)},
+    )
+
+
+def _check_pool():
+    stats = pool_stats().get("primary")
+    if not stats:
+        return
+    if stats["waiting"] > 0 or stats["saturation"] >= settings.INGEST_MAX_POOL_SATURATION:
+        raise _busy("Pool do primário saturado — tente novamente")
+
+
+# ------------------------------------------------------
+# Escrita
+# ------------------------------------------------------
+def _reserve_ids(cur, sequence: str, n: int) -> list[int]:
+    if n == 0:
+        return []
+    cur.execute("SELECT nextval(%s) FROM generate_series(1, %s)", [sequence, n])
+    return [r[0] for r in cur.fetchall()]
+
+
+def _copy(cur, table: str, columns: tuple, rows: list):
+    if not rows:
+        return
+    with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+
+
+def write_batch(sales: list[IngestSale]) -> IngestResult:
+    if len(sales) > settings.INGEST_MAX_BATCH:
+        raise HTTPException(
+            status_code=413, detail=f"Lote acima do limite ({settings.INGEST_MAX_BATCH} vendas)"
+        )
+
+    if not _slots.acquire(blocking=False):
+        raise _busy("Muitos lotes em andamento — tente novamente", status_code=429)
+    try:
+        _check_pool()
+        t0 = time.perf_counter()
+
+        n_products = sum(len(s.products) for s in sales)
+        n_deliveries = sum(1 for s in sales if s.delivery is not None)
+
+        with get_conn(WORKLOAD_PRIMARY) as conn:
+            with conn.transaction(), conn.cursor() as cur:
+                # o exportador Parquet lê o watermark só sem lotes em voo
+                exporter.hold_ingest_fence(cur)
+                sale_ids = _reserve_ids(cur, "sales_id_seq", len(sales))
+                product_ids = iter(_reserve_ids(cur, "product_sales_id_seq", n_products))
+                delivery_ids = iter(_reserve_ids(cur, "delivery_sales_id_seq", n_deliveries))
+
+                sale_rows, product_rows, item_rows = [], [], []
+                delivery_rows, address_rows, payment_rows = [], [], []
+
+                for sale_id, s in zip(sale_ids, sales):
+                    sale_rows.append((
+                        sale_id, s.store_id, s.channel_id, s.customer_id, s.customer_name,
+                        s.cod_sale1, s.created_at, s.sale_status_desc, s.total_amount_items,
+                        s.total_discount, s.total_increase, s.delivery_fee, s.service_tax_fee,
+                        s.total_amount, s.value_paid, s.production_seconds, s.delivery_seconds,
+                        s.people_quantity, s.discount_reason, s.origin,
+                    ))
+
+                    for p in s.products:
+                        product_sale_id = next(product_ids)
+                        product_rows.append((
+                            product_sale_id, sale_id, p.product_id, p.quantity,
+                            p.base_price, p.total_price, p.observations,
+                        ))
+                        for it in p.items:
+                            item_rows.append((
+                                product_sale_id, it.item_id, it.option_group_id,
+                                it.quantity, it.additional_price, it.price, it.amount,
+                            ))
+
+                    if s.delivery is not None:
+                        d = s.delivery
+                        delivery_sale_id = next(delivery_ids)
+                        delivery_rows.append((
+                            delivery_sale_id, sale_id, d.courier_name, d.courier_phone,
+                            d.courier_type, d.delivery_type, d.status, d.delivery_fee, d.courier_fee,
+                        ))
+                        if d.address is not None:
+                            a = d.address
+                            address_rows.append((
+                                sale_id, delivery_sale_id, a.street, a.number, a.complement,
+                                a.neighborhood, a.city, a.state, a.postal_code,
+                                a.latitude, a.longitude,
+                            ))
+
+                    for pay in s.payments:
+                        payment_rows.append((sale_id, pay.payment_type_id, pay.value, pay.is_online))
+
+                _copy(cur, "sales", _SALES_COLUMNS, sale_rows)
+                _copy(cur, "product_sales", _PRODUCT_COLUMNS, product_rows)
+                _copy(cur, "item_product_sales", _ITEM_COLUMNS, item_rows)
+                _copy(cur, "delivery_sales", _DELIVERY_COLUMNS, delivery_rows)
+                _copy(cur, "delivery_addresses", _ADDRESS_COLUMNS, address_rows)
+                _copy(cur, "payments", _PAYMENT_COLUMNS, payment_rows)
+
+                rollups.apply(conn, sale_ids)
+
+        # com o feed ativo a invalidação chega por chave (services/changefeed.py)
+        if not changefeed.is_connected():
+            cache.invalidate()
+
+        return IngestResult(
+            accepted=len(sale_ids),
+            sale_ids=sale_ids,
+            products=len(product_rows),
+            items=len(item_rows),
+            payments=len(payment_rows),
+            deliveries=len(delivery_rows),
+            duration_ms=round((time.perf_counter() - t0) * 1000, 1),
+        )
+    finally:
+        _slots.release()
@@ -0,0 +1,363 @@
+# backend/app/services/live.py
+"""
+KPIs ao vivo (SSE) calculados a partir das vendas novas.
+
+Clientes com os mesmos filtros (lojas, canais) compartilham um LiveGroup:
+o snapshot de hoje é consultado uma vez por grupo e, a cada notificação
+do change feed, uma única consulta busca as vendas novas (faixa de ids
+do evento), que são somadas em todos os grupos. Cada grupo serializa
+sua mensagem uma vez e só a enfileira para os clientes — o custo por
+evento não depende de quantos streams estão abertos.
+
+As mensagens levam os totais absolutos (+ o delta), então a fila de
+cada cliente pode descartar mensagens antigas sem o cliente divergir.
+
+O snapshot guarda o maior id de venda que já inclui (lido com o fence da
+ingestão, services/exporter.py: nenhum lote com id menor em voo); vendas
+de eventos até esse id não são somadas de novo no grupo. O snapshot roda
+fora do lock do hub.
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Optional
+
+from .. import queries
+from ..db import get_conn, WORKLOAD_PRIMARY
+from ..queries import SALES_WHERE, sales_filters
+from ..settings import settings
+from . import changefeed, exporter
+
+logger = logging.getLogger(__name__)
+
+
+Q_LIVE_TODAY = queries.register("live_today", f"""
+    SELECT
+        COALESCE(SUM(s.total_amount) FILTER (WHERE s.sale_status_desc = 'COMPLETED'), 0),
+        COUNT(*) FILTER (WHERE s.sale_status_desc = 'COMPLETED'),
+        COUNT(*) FILTER (WHERE s.sale_status_desc = 'CANCELLED'),
+        (SELECT COALESCE(MAX(id), 0) FROM sales)
+    FROM sales s
+    WHERE {SALES_WHERE}
+""")
+
+Q_LIVE_HOUR_PRODUCTS = queries.register("live_hour_products", f"""
+    SELECT p.name, SUM(ps.quantity)
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE {SALES_WHERE}
+      AND s.created_at >= %(hour_start)s
+    GROUP BY p.name
+""")
+
+# vendas novas de um evento (todas as lojas/canais; cada grupo filtra em memória)
+Q_LIVE_NEW_SALES = queries.register("live_new_sales", """
+    SELECT s.id, s.store_id, s.channel_id, s.created_at, s.total_amount, s.sale_status_desc
+    FROM sales s
+    WHERE s.id BETWEEN %(min_id)s AND %(max_id)s
+      AND s.created_at >= %(day)s::date
+      AND s.created_at < %(day)s::date + 1
+""")
+
+Q_LIVE_NEW_PRODUCTS = queries.register("live_new_products", """
+    SELECT ps.sale_id, p.name, ps.quantity
+    FROM product_sales ps
+    JOIN products p ON p.id = ps.product_id
+    WHERE ps.sale_id = ANY(%(sale_ids)s::int[])
+""")
+
+
+def _hour_start(now: datetime) -> datetime:
+    return now.replace(minute=0, second=0, microsecond=0)
+
+
+@dataclass
+class LiveClient:
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue
+
+
+@dataclass
+class LiveGroup:
+    stores: tuple[int, ...]
+    channels: tuple[int, ...]
+    day: Optional[date] = None
+    hour: Optional[datetime] = None
+    revenue: float = 0.0
+    orders: int = 0
+    cancellations: int = 0
+    hour_products: dict[str, float] = field(default_factory=dict)
+    loaded_through: int = 0                # maior id de venda já contido no snapshot
+    clients: list[LiveClient] = field(default_factory=list)
+    last_message: Optional[str] = None
+
+    def matches(self, store_id: int, channel_id: int) -> bool:
+        return (
+            (not self.stores or store_id in self.stores)
+            and (not self.channels or channel_id in self.channels)
+        )
+
+    def load(self, now: datetime):
+        """Snapshot de hoje (uma consulta por grupo, não por cliente)"""
+        day = now.date()
+        params = sales_filters(
+            day.isoformat(), day.isoformat(), list(self.stores), list(self.channels),
+            statuses=None, end_inclusive=True,
+        )
+        with get_conn(WORKLOAD_PRIMARY) as conn:
+            # com o fence nenhum lote da ingestão comita no meio: as duas leituras
+            # e o maior id descrevem as mesmas vendas
+            with conn.transaction():
+                conn.execute("SELECT pg_advisory_xact_lock(%s)", [exporter.INGEST_FENCE_LOCK])
+                revenue, orders, cancellations, through = queries.run(conn, Q_LIVE_TODAY, params, one=True)
+                hour_params = {**params, "statuses": ["COMPLETED"], "hour_start": _hour_start(now)}
+                products = queries.run(conn, Q_LIVE_HOUR_PRODUCTS, hour_params)
+
+        self.day = day
+        self.hour = _hour_start(now)
+        self.revenue = float(revenue)
+        self.orders = int(orders)
+        self.cancellations = int(cancellations)
+        self.hour_products = {name: float(qty) for name, qty in products}
+        self.loaded_through = int(through)
+
+    def message(self, kind: str, delta: Optional[dict] = None) -> str:
+        top = max(self.hour_products.items(), key=lambda kv: kv[1], default=None)
+        data = {
+            "day": self.day.isoformat() if self.day else None,
+            "revenue": round(self.revenue, 2),
+            "orders": self.orders,
+            "ticket": round(self.revenue / self.orders, 2) if self.orders else 0,
+            "cancellations": self.cancellations,
+            "top_product": {"product": top[0], "qty": top[1]} if top else None,
+        }
+        if delta is not None:
+            data["delta"] = delta
+        return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+def _offer(q: asyncio.Queue, message: str):
+    # roda no event loop; fila cheia → descarta a mensagem mais antiga
+    if q.full():
+        try:
+            q.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+    q.put_nowait(message)
+
+
+class LiveHub:
+    def __init__(self):
+        self.groups: dict[tuple, LiveGroup] = {}
+        self.lock = threading.Lock()
+        self.events: "queue.Queue" = queue.Queue()
+        self.seen: deque[int] = deque(maxlen=settings.LIVE_SEEN_IDS)
+        self.seen_set: set[int] = set()
+        self.worker: Optional[threading.Thread] = None
+        self.last_poll = 0.0
+        self.generation = 0                      # eventos já tirados da fila pelo worker
+        self.stale: set[tuple] = set()           # grupos criados enquanto o worker andava
+        self.stats = {"events": 0, "new_sales": 0, "resyncs": 0, "messages": 0}
+
+    # ---------- clientes ----------
+    def join(self, store_ids, channel_ids, client: LiveClient) -> LiveGroup:
+        key = (tuple(sorted(set(store_ids or []))), tuple(sorted(set(channel_ids or []))))
+        with self.lock:
+            group = self.groups.get(key)
+            if group is not None:
+                group.clients.append(client)
+            generation = self.generation
+
+        if group is None:
+            # snapshot fora do lock: o worker segue atendendo os outros grupos
+            fresh = LiveGroup(stores=key[0], channels=key[1])
+            fresh.load(datetime.now())
+            fresh.last_message = fresh.message("snapshot")
+            with self.lock:
+                group = self.groups.setdefault(key, fresh)
+                group.clients.append(client)
+                # evento tratado durante o snapshot pode não ter chegado a este grupo
+                missed = group is fresh and self.generation != generation
+                if missed:
+                    self.stale.add(key)
+            if missed:
+                self.events.put(None)
+        self._ensure_worker()
+        return group
+
+    def leave(self, group: LiveGroup, client: LiveClient):
+        with self.lock:
+            if client in group.clients:
+                group.clients.remove(client)
+            if not group.clients:
+                self.groups.pop((group.stores, group.channels), None)
+
+    def _broadcast(self, group: LiveGroup, message: str):
+        group.last_message = message
+        for client in list(group.clients):
+            client.loop.call_soon_threadsafe(_offer, client.queue, message)
+        self.stats["messages"] += len(group.clients)
+
+    # ---------- eventos ----------
+    def on_sales_change(self, event: "changefeed.ChangeEvent"):
+        """Assinante do change feed (thread do listener): só enfileira"""
+        if self.groups:
+            self.events.put(event)
+
+    def _ensure_worker(self):
+        if self.worker is None or not self.worker.is_alive():
+            self.worker = threading.Thread(target=self._run, name="live-hub", daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                event = self.events.get(timeout=settings.LIVE_TICK_SECONDS)
+            except queue.Empty:
+                event = None
+            try:
+                self._tick(event)
+            except Exception as e:
+                logger.error(f"❌ Live hub: {e}")
+
+    def _tick(self, event):
+        now = datetime.now()
+        with self.lock:
+            if event is not None:
+                self.generation += 1
+            groups = list(self.groups.values())
+            stale = [self.groups[k] for k in self.stale if k in self.groups]
+            self.stale.clear()
+        if not groups:
+            return
+        if stale:
+            self._resync(stale, now)
+
+        # virada de dia → snapshot de novo; feed fora do ar → polling lento
+        poll_due = (
+            event is None
+            and not changefeed.is_connected()
+            and time.monotonic() - self.last_poll >= settings.LIVE_POLL_SECONDS
+        )
+        if any(g.day != now.date() for g in groups) or poll_due:
+            self.last_poll = time.monotonic()
+            self._resync(groups, now)
+            return
+
+        # virada de hora: zera o top produto da hora
+        hour = _hour_start(now)
+        for g in groups:
+            if g.hour != hour:
+                g.hour = hour
+                g.hour_products = {}
+                self._broadcast(g, g.message("update"))
+
+        if event is None:
+            return
+        self.stats["events"] += 1
+
+        today = now.date()
+        if event.resync or event.op != "INSERT":
+            # status alterado / exclusão: refaz só os grupos afetados
+            affected = [
+                g for g in groups
+                if event.resync or any(day == today and g.matches(st, ch) for st, ch, day in event.keys)
+            ]
+            self._resync(affected, now)
+            return
+
+        if event.min_id is None or not any(day == today for _, _, day in event.keys):
+            return
+        self._apply_inserts(groups, event, now)
+
+    def _resync(self, groups: list[LiveGroup], now: datetime):
+        self.stats["resyncs"] += 1
+        for g in groups:
+            g.load(now)
+            self._broadcast(g, g.message("snapshot"))
+
+    def _apply_inserts(self, groups: list[LiveGroup], event, now: datetime):
+        with get_conn(WORKLOAD_PRIMARY) as conn:
+            rows = queries.run(conn, Q_LIVE_NEW_SALES, {
+                "min_id": event.min_id, "max_id": event.max_id, "day": now.date(),
+            })
+            # outro lote concorrente pode ter ids na mesma faixa: ignora os já vistos
+            rows = [r for r in rows if r[0] not in self.seen_set]
+            if not rows:
+                return
+
+            hour = _hour_start(now)
+            hour_ids = [r[0] for r in rows if r[5] == "COMPLETED" and r[3] >= hour]
+            products = (
+                queries.run(conn, Q_LIVE_NEW_PRODUCTS, {"sale_ids": hour_ids}) if hour_ids else []
+            )
+
+        for r in rows:
+            if len(self.seen) == self.seen.maxlen:
+                self.seen_set.discard(self.seen[0])
+            self.seen.append(r[0])
+            self.seen_set.add(r[0])
+        self.stats["new_sales"] += len(rows)
+
+        sale_scope = {r[0]: (r[1], r[2]) for r in rows}
+        for g in groups:
+            delta = {"revenue": 0.0, "orders": 0, "cancellations": 0}
+            for sale_id, store_id, channel_id, _, amount, status in rows:
+                # já contada no snapshot do grupo
+                if sale_id <= g.loaded_through or not g.matches(store_id, channel_id):
+                    continue
+                if status == "COMPLETED":
+                    delta["revenue"] += float(amount)
+                    delta["orders"] += 1
+                elif status == "CANCELLED":
+                    delta["cancellations"] += 1
+            for sale_id, name, qty in products:
+                if sale_id > g.loaded_through and g.matches(*sale_scope[sale_id]):
+                    g.hour_products[name] = g.hour_products.get(name, 0.0) + float(qty)
+
+            if not (delta["orders"] or delta["cancellations"]):
+                continue
+            g.revenue += delta["revenue"]
+            g.orders += delta["orders"]
+            g.cancellations += delta["cancellations"]
+            delta["revenue"] = round(delta["revenue"], 2)
+            self._broadcast(g, g.message("update", delta))
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                **self.stats,
+                "groups": len(self.groups),
+                "clients": sum(len(g.clients) for g in self.groups.values()),
+            }
+
+
+hub = LiveHub()
+
+
+async def stream(store_ids, channel_ids, is_disconnected):
+    """Gerador SSE de um cliente: snapshot, depois updates (+ heartbeat)"""
+    client = LiveClient(asyncio.get_running_loop(), asyncio.Queue(settings.LIVE_CLIENT_QUEUE))
+    group = await asyncio.to_thread(hub.join, store_ids, channel_ids, client)
+    try:
+        yield group.last_message
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    client.queue.get(), timeout=settings.LIVE_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                message = ": ping\n\n"
+            yield message
+    finally:
+        hub.leave(group, client)
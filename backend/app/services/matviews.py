@@ -0,0 +1,299 @@
+# backend/app/services/matviews.py
+"""
+Read models pesados declarados como materialized views.
+
+Cada view tem um índice único (pré-requisito do REFRESH ... CONCURRENTLY)
+e sua própria cadência. O agendador roda dentro do processo da API
+(asyncio), pula o refresh quando a tabela sales não mudou e grava a
+duração/horário de cada refresh em `matview_refreshes`, de onde sai o
+"as of" exposto nas respostas.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from ..db import get_conn, WORKLOAD_PRIMARY
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MatView:
+    name: str
+    sql: str
+    unique: tuple[str, ...]
+    refresh_seconds: int
+
+
+MATVIEWS: dict[str, MatView] = {}
+
+# views antigas que viraram rollups incrementais (services/rollups.py)
+RETIRED = ("mv_payment_mix_daily", "mv_customizations_daily", "mv_delivery_heatmap")
+
+
+def declare(name: str, sql: str, unique: tuple[str, ...], refresh_seconds: int) -> str:
+    MATVIEWS[name] = MatView(name, sql.strip(), unique, refresh_seconds)
+    return name
+
+
+# ======================================================
+# Views
+# ======================================================
+MV_TICKET = declare("mv_ticket_store_channel", """
+    SELECT
+        s.store_id,
+        s.channel_id,
+        SUM(s.total_amount) AS total_amount,
+        COUNT(*) AS orders
+    FROM sales s
+    GROUP BY 1, 2
+""", unique=("store_id", "channel_id"), refresh_seconds=120)
+
+# read models genéricos do planner de métricas (services/semantic.py)
+MV_SALES_HOURLY = declare("mv_sales_hourly", """
+    SELECT
+        DATE(s.created_at) AS day,
+        EXTRACT(HOUR FROM s.created_at)::int AS hour,
+        s.store_id,
+        s.channel_id,
+        SUM(s.total_amount) AS revenue,
+        COUNT(*) AS orders
+    FROM sales s
+    WHERE s.sale_status_desc = 'COMPLETED'
+    GROUP BY 1, 2, 3, 4
+""", unique=("day", "hour", "store_id", "channel_id"), refresh_seconds=300)
+
+MV_PRODUCT_DAILY = declare("mv_product_daily", """
+    SELECT
+        DATE(s.created_at) AS day,
+        s.store_id,
+        s.channel_id,
+        ps.product_id,
+        SUM(ps.quantity) AS qty,
+        SUM(ps.total_price) AS revenue,
+        COUNT(DISTINCT s.id) AS orders
+    FROM product_sales ps
+    JOIN sales s ON s.id = ps.sale_id
+    WHERE s.sale_status_desc = 'COMPLETED'
+    GROUP BY 1, 2, 3, 4
+""", unique=("day", "store_id", "channel_id", "product_id"), refresh_seconds=600)
+
+
+# ======================================================
+# DDL / refresh
+# ======================================================
+_DDL_REFRESHES = """
+    CREATE TABLE IF NOT EXISTS matview_refreshes (
+        view_name    TEXT PRIMARY KEY,
+        refreshed_at TIMESTAMPTZ NOT NULL,
+        duration_ms  DOUBLE PRECISION NOT NULL,
+        sales_marker BIGINT
+    )
+"""
+
+# pg_snapshot lido pelo refresh: watermark do delta sync (services/watermarks.py)
+_DDL_REFRESHES_SNAPSHOT = "ALTER TABLE matview_refreshes ADD COLUMN IF NOT EXISTS snapshot TEXT"
+
+# muda a cada INSERT/UPDATE/DELETE em sales (estatística do próprio Postgres)
+_SALES_MARKER_SQL = """
+    SELECT COALESCE(n_tup_ins + n_tup_upd + n_tup_del, 0)
+    FROM pg_stat_user_tables
+    WHERE relname = 'sales'
+"""
+
+# estado em memória (espelha matview_refreshes)
+_state: dict[str, dict] = {}
+
+# views com vendas novas, segundo o change feed (None = feed sem eventos
+# ainda; aí vale só o marcador do pg_stat_user_tables)
+_dirty: Optional[set[str]] = None
+
+
+def on_sales_change(event):
+    """Assinante do change feed: toda venda nova suja todas as views"""
+    global _dirty
+    if _dirty is None:
+        _dirty = set()
+    _dirty.update(MATVIEWS)
+
+
+def ensure_views():
+    """Cria as views (com dados) e os índices únicos, se ainda não existirem"""
+    with get_conn(WORKLOAD_PRIMARY) as conn:
+        conn.execute(_DDL_REFRESHES)
+        conn.execute(_DDL_REFRESHES_SNAPSHOT)
+        for name in RETIRED:
+            conn.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name}")
+            conn.execute("DELETE FROM matview_refreshes WHERE view_name = %s", [name])
+        for mv in MATVIEWS.values():
+            exists = conn.execute("SELECT to_regclass(%s)", [mv.name]).fetchone()[0]
+            if exists:
+                continue
+
+            t0 = time.perf_counter()
+            snapshot = conn.execute("SELECT pg_current_snapshot()::text").fetchone()[0]
+            conn.execute(f"CREATE MATERIALIZED VIEW {mv.name} AS {mv.sql}")
+            conn.execute(
+                f"CREATE UNIQUE INDEX {mv.name}_uniq ON {mv.name} ({', '.join(mv.unique)})"
+            )
+            # estatísticas já na criação (o planner do POST /query usa reltuples)
+            conn.execute(f"ANALYZE {mv.name}")
+            # a criação já popula a view: conta como primeiro refresh
+            conn.execute(
+                """
+                INSERT INTO matview_refreshes (view_name, refreshed_at, duration_ms, sales_marker, snapshot)
+                VALUES (%s, now(), %s, (""" + _SALES_MARKER_SQL + """), %s)
+                ON CONFLICT (view_name) DO NOTHING
+                """,
+                [mv.name, (time.perf_counter() - t0) * 1000, snapshot],
+            )
+            logger.info(f"🧱 Materialized view {mv.name} criada")
+    load_state()
+
+
+def load_state():
+    with get_conn(WORKLOAD_PRIMARY) as conn:
+        rows = conn.execute(
+            "SELECT view_name, refreshed_at, duration_ms, sales_marker, snapshot FROM matview_refreshes"
+        ).fetchall()
+    for name, refreshed_at, duration_ms, marker, snapshot in rows:
+        st = _state.setdefault(name, {"refreshes": 0, "skipped": 0, "last_error": None})
+        st.update(refreshed_at=refreshed_at, duration_ms=duration_ms, sales_marker=marker, snapshot=snapshot)
+
+
+def refresh(name: str, force: bool = False) -> bool:
+    """
+    REFRESH MATERIALIZED VIEW CONCURRENTLY, se houve vendas novas desde o último.
+    Retorna True se a view foi atualizada.
+    """
+    st = _state.setdefault(name, {"refreshes": 0, "skipped": 0, "last_error": None})
+
+    # o feed diz que nada mudou: nem consulta o marcador
+    if not force and _dirty is not None and name not in _dirty:
+        st["skipped"] += 1
+        return False
+
+    with get_conn(WORKLOAD_PRIMARY) as conn:
+        marker = conn.execute(_SALES_MARKER_SQL).fetchone()
+        marker = int(marker[0]) if marker else 0
+
+        if not force and st.get("sales_marker") == marker:
+            st["skipped"] += 1
+            return False
+
+        # evita refresh duplicado quando há várias instâncias da API
+        locked = conn.execute(
+            "SELECT pg_try_advisory_xact_lock(hashtext(%s))", [name]
+        ).fetchone()[0]
+        if not locked:
+            return False
+
+        # eventos que chegarem durante o refresh sujam a view de novo
+        if _dirty is not None:
+            _dirty.discard(name)
+
+        try:
+            # "as of" = início do refresh (o snapshot lido pela view)
+            refreshed_at = datetime.now(timezone.utc)
+            # tirado antes do REFRESH: a view vê tudo que este snapshot vê (ou mais)
+            snapshot = conn.execute("SELECT pg_current_snapshot()::text").fetchone()[0]
+            t0 = time.perf_counter()
+            conn.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+            duration_ms = (time.perf_counter() - t0) * 1000
+
+            conn.execute(
+                """
+                INSERT INTO matview_refreshes (view_name, refreshed_at, duration_ms, sales_marker, snapshot)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (view_name) DO UPDATE
+                   SET refreshed_at = EXCLUDED.refreshed_at,
+                       duration_ms = EXCLUDED.duration_ms,
+                       sales_marker = EXCLUDED.sales_marker,
+                       snapshot = EXCLUDED.snapshot
+                """,
+                [name, refreshed_at, duration_ms, marker, snapshot],
+            )
+            conn.commit()
+        except Exception:
+            # refresh falhou: a view continua suja para o próximo tick
+            if _dirty is not None:
+                _dirty.add(name)
+            raise
+
+    st.update(
+        refreshed_at=refreshed_at,
+        duration_ms=duration_ms,
+        sales_marker=marker,
+        snapshot=snapshot,
+        refreshes=st["refreshes"] + 1,
+        last_error=None,
+    )
+    logger.info(f"♻️ {name} atualizada em {duration_ms:.0f} ms")
+
+    # respostas em cache leram a versão anterior da view
+    from .. import cache
+    cache.on_view_refresh(name)
+    return True
+
+
+def as_of(*names: str) -> Optional[datetime]:
+    """Horário do refresh mais antigo entre as views usadas por uma resposta"""
+    times = [_state.get(n, {}).get("refreshed_at") for n in names]
+    if not times or any(t is None for t in times):
+        return None
+    return min(times)
+
+
+def watermark(name: str) -> Optional[str]:
+    """pg_snapshot do último refresh da view (None = view sem snapshot gravado ainda)"""
+    return _state.get(name, {}).get("snapshot")
+
+
+def freshness() -> list[dict]:
+    out = []
+    for mv in MATVIEWS.values():
+        st = _state.get(mv.name, {})
+        refreshed_at = st.get("refreshed_at")
+        out.append({
+            "view": mv.name,
+            "refresh_seconds": mv.refresh_seconds,
+            "as_of": refreshed_at.isoformat() if refreshed_at else None,
+            "last_duration_ms": round(st["duration_ms"], 1) if st.get("duration_ms") is not None else None,
+            "refreshes": st.get("refreshes", 0),
+            "skipped": st.get("skipped", 0),
+            "last_error": st.get("last_error"),
+        })
+    return out
+
+
+# ======================================================
+# Agendador (asyncio, iniciado no create_app)
+# ======================================================
+async def run_scheduler():
+    """Loop de refresh; as views já foram criadas por ensure_views() no startup"""
+    next_run = {name: 0.0 for name in MATVIEWS}
+
+    while True:
+        # outra instância pode ter atualizado as views
+        try:
+            await asyncio.to_thread(load_state)
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao ler matview_refreshes: {e}")
+
+        now = time.monotonic()
+        for name, mv in MATVIEWS.items():
+            if now < next_run[name]:
+                continue
+            try:
+                await asyncio.to_thread(refresh, name)
+            except Exception as e:
+                logger.error(f"❌ Falha no refresh de {name}: {e}")
+                _state.setdefault(name, {"refreshes": 0, "skipped": 0})["last_error"] = str(e)
+            next_run[name] = time.monotonic() + mv.refresh_seconds
+
+        await asyncio.sleep(settings.MATVIEW_TICK_SECONDS)
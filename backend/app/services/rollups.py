@@ -0,0 +1,399 @@
+# backend/app/services/rollups.py
+"""
+Tabelas de resumo mantidas incrementalmente.
+
+Diferente das materialized views (recalculadas inteiras), cada rollup
+declara três SQLs:
+  - ddl:      CREATE TABLE IF NOT EXISTS
+  - backfill: INSERT ... SELECT sobre todo o histórico (criação / rebuild)
+  - apply:    upsert só das vendas de um lote (%(sale_ids)s), executado
+              pela ingestão na mesma transação do COPY
+
+Rollups que não cabem num upsert SQL (ex.: o cubo de entregas em
+services/delivery_cube.py) passam funções no lugar do backfill/apply.
+
+Dados carregados por fora da API (generate_data.py) exigem um rebuild:
+    python -m app.services.rollups --rebuild
+"""
+
+import argparse
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+from ..db import get_conn, WORKLOAD_PRIMARY
+from . import affinity, cohorts, delivery_cube, sampling, watermarks
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Rollup:
+    name: str
+    ddl: str
+    backfill: Union[str, Callable]     # SQL ou fn(conn)
+    apply: Union[str, Callable]        # SQL com %(sale_ids)s ou fn(conn, sale_ids)
+
+    def run_backfill(self, conn):
+        if callable(self.backfill):
+            self.backfill(conn)
+        else:
+            conn.execute(self.backfill)
+
+    def run_apply(self, conn, sale_ids: list[int]):
+        if callable(self.apply):
+            self.apply(conn, sale_ids)
+        else:
+            conn.execute(self.apply, {"sale_ids": sale_ids})
+
+
+ROLLUPS: dict[str, Rollup] = {}
+
+
+def _strip(step):
+    return step if callable(step) else step.strip()
+
+
+def declare(name: str, ddl: str, backfill: Union[str, Callable], apply: Union[str, Callable]) -> str:
+    ROLLUPS[name] = Rollup(name, ddl.strip(), _strip(backfill), _strip(apply))
+    return name
+
+
+# ======================================================
+# Resumo por cliente (pedidos, primeira/última compra)
+# ======================================================
+_CUSTOMER_SUMMARY_SELECT = """
+    SELECT
+        s.customer_id,
+        COUNT(*) AS orders,
+        SUM(s.total_amount) AS total_amount,
+        MIN(s.created_at) AS first_order,
+        MAX(s.created_at) AS last_order
+    FROM sales s
+    WHERE s.customer_id IS NOT NULL
+      {where}
+    GROUP BY s.customer_id
+    ORDER BY s.customer_id
+"""
+
+CUSTOMER_SUMMARY = declare(
+    "customer_order_summary",
+    ddl="""
+        CREATE TABLE IF NOT EXISTS customer_order_summary (
+            customer_id  INTEGER PRIMARY KEY,
+            orders       INTEGER NOT NULL,
+            total_amount NUMERIC NOT NULL,
+            first_order  TIMESTAMP NOT NULL,
+            last_order   TIMESTAMP NOT NULL
+        )
+    """,
+    backfill="INSERT INTO customer_order_summary "
+    + _CUSTOMER_SUMMARY_SELECT.format(where=""),
+    apply="INSERT INTO customer_order_summary "
+    + _CUSTOMER_SUMMARY_SELECT.format(where="AND s.id = ANY(%(sale_ids)s::int[])")
+    + """
+    ON CONFLICT (customer_id) DO UPDATE SET
+        orders       = customer_order_summary.orders + EXCLUDED.orders,
+        total_amount = customer_order_summary.total_amount + EXCLUDED.total_amount,
+        first_order  = LEAST(customer_order_summary.first_order, EXCLUDED.first_order),
+        last_order   = GREATEST(customer_order_summary.last_order, EXCLUDED.last_order)
+    """,
+)
+
+
+# ======================================================
+# Última venda por produto × loja × canal
+# ======================================================
+_PRODUCT_LAST_SALE_SELECT = """
+    SELECT
+        ps.product_id,
+        s.store_id,
+        s.channel_id,
+        MAX(s.created_at) AS last_sale
+    FROM product_sales ps
+    JOIN sales s ON s.id = ps.sale_id
+    {where}
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+"""
+
+PRODUCT_LAST_SALE = declare(
+    "product_last_sale",
+    ddl="""
+        CREATE TABLE IF NOT EXISTS product_last_sale (
+            product_id INTEGER NOT NULL,
+            store_id   INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            last_sale  TIMESTAMP NOT NULL,
+            PRIMARY KEY (product_id, store_id, channel_id)
+        )
+    """,
+    backfill="INSERT INTO product_last_sale "
+    + _PRODUCT_LAST_SALE_SELECT.format(where=""),
+    apply="INSERT INTO product_last_sale "
+    + _PRODUCT_LAST_SALE_SELECT.format(where="WHERE s.id = ANY(%(sale_ids)s::int[])")
+    + """
+    ON CONFLICT (product_id, store_id, channel_id) DO UPDATE SET
+        last_sale = GREATEST(product_last_sale.last_sale, EXCLUDED.last_sale)
+    """,
+)
+
+
+# ======================================================
+# Agregados diários aditivos (tabelas de itens da venda)
+# ======================================================
+def declare_daily(name: str, keys: dict[str, str], measures: dict[str, str], select: str) -> str:
+    """
+    Rollup diário por (day, store_id, channel_id, *keys) com medidas somáveis.
+    `select` devolve as colunas na ordem day, store_id, channel_id, keys,
+    measures e tem um `{where}` para o filtro do lote; o upsert soma as medidas.
+    """
+    columns = {"day": "DATE", "store_id": "INTEGER", "channel_id": "INTEGER", **keys, **measures}
+    pk = ", ".join(["day", "store_id", "channel_id", *keys])
+    insert = f"INSERT INTO {name} ({', '.join(columns)}) "
+    return declare(
+        name,
+        ddl=f"""
+            CREATE TABLE IF NOT EXISTS {name} (
+                {", ".join(f"{col} {typ} NOT NULL" for col, typ in columns.items())},
+                PRIMARY KEY ({pk})
+            )
+        """,
+        backfill=insert + select.format(where=""),
+        apply=insert
+        + select.format(where="AND s.id = ANY(%(sale_ids)s::int[])")
+        + f" ON CONFLICT ({pk}) DO UPDATE SET "
+        + ", ".join(f"{m} = {name}.{m} + EXCLUDED.{m}" for m in measures),
+    )
+
+
+# Só vendas COMPLETED (os endpoints não filtram por outro status)
+PAYMENT_MIX_DAILY = declare_daily(
+    "payment_mix_daily",
+    keys={"payment_type_id": "INTEGER"},       # 0 = sem tipo
+    measures={"payments": "BIGINT", "total": "NUMERIC"},
+    select="""
+        SELECT DATE(s.created_at), s.store_id, s.channel_id,
+               COALESCE(pay.payment_type_id, 0),
+               COUNT(*), SUM(pay.value)
+        FROM payments pay
+        JOIN sales s ON s.id = pay.sale_id
+        WHERE s.sale_status_desc = 'COMPLETED' {where}
+        GROUP BY 1, 2, 3, 4
+    """,
+)
+
+CUSTOMIZATIONS_DAILY = declare_daily(
+    "customizations_daily",
+    keys={"item_id": "INTEGER"},
+    measures={"times_added": "BIGINT", "revenue_generated": "DOUBLE PRECISION"},
+    select="""
+        SELECT DATE(s.created_at), s.store_id, s.channel_id,
+               ips.item_id,
+               COUNT(*), SUM(ips.additional_price)
+        FROM item_product_sales ips
+        JOIN product_sales ps ON ps.id = ips.product_sale_id
+        JOIN sales s ON s.id = ps.sale_id
+        WHERE s.sale_status_desc = 'COMPLETED' {where}
+        GROUP BY 1, 2, 3, 4
+    """,
+)
+
+DELIVERY_REGIONS_DAILY = declare_daily(
+    "delivery_regions_daily",
+    keys={"city": "TEXT", "neighborhood": "TEXT"},
+    # delivery_seconds pode ser nulo: a média usa timed_deliveries
+    measures={"deliveries": "BIGINT", "delivery_seconds": "BIGINT", "timed_deliveries": "BIGINT"},
+    select="""
+        SELECT DATE(s.created_at), s.store_id, s.channel_id,
+               COALESCE(da.city, 'N/A'), COALESCE(da.neighborhood, 'N/A'),
+               COUNT(*), COALESCE(SUM(s.delivery_seconds), 0), COUNT(s.delivery_seconds)
+        FROM delivery_addresses da
+        JOIN sales s ON s.id = da.sale_id
+        WHERE s.sale_status_desc = 'COMPLETED' {where}
+        GROUP BY 1, 2, 3, 4, 5
+    """,
+)
+
+
+# ======================================================
+# Cubo semana × loja × canal do tempo de entrega (weekday × hora)
+# ======================================================
+DELIVERY_HEATMAP_WEEKLY = declare(
+    delivery_cube.TABLE,
+    ddl=delivery_cube.DDL,
+    backfill=delivery_cube.backfill,
+    apply=delivery_cube.apply,
+)
+
+
+# ======================================================
+# Coocorrência de produtos por semana × loja × canal (services/affinity.py)
+# ======================================================
+PRODUCT_AFFINITY_WEEKLY = declare(
+    affinity.TABLE,
+    ddl=affinity.DDL,
+    backfill=affinity.backfill,
+    apply=affinity.apply,
+)
+
+
+# ======================================================
+# Amostra estratificada para ?mode=approx (services/sampling.py)
+# ======================================================
+_SALES_SAMPLE_SELECT = f"""
+    SELECT s.id, s.store_id, s.channel_id, s.created_at, s.sale_status_desc,
+           s.total_amount, s.production_seconds, s.delivery_seconds
+    FROM sales s
+    WHERE {sampling.in_sample("s.id")} {{where}}
+"""
+
+SALES_SAMPLE = declare(
+    sampling.SALES_SAMPLE,
+    ddl=f"""
+        CREATE TABLE IF NOT EXISTS {sampling.SALES_SAMPLE} (
+            id                 INTEGER PRIMARY KEY,
+            store_id           INTEGER NOT NULL,
+            channel_id         INTEGER NOT NULL,
+            created_at         TIMESTAMP NOT NULL,
+            sale_status_desc   VARCHAR,
+            total_amount       NUMERIC,
+            production_seconds INTEGER,
+            delivery_seconds   INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_{sampling.SALES_SAMPLE}_created_at
+            ON {sampling.SALES_SAMPLE} (created_at)
+    """,
+    backfill=f"INSERT INTO {sampling.SALES_SAMPLE} " + _SALES_SAMPLE_SELECT.format(where=""),
+    apply=f"INSERT INTO {sampling.SALES_SAMPLE} "
+    + _SALES_SAMPLE_SELECT.format(where="AND s.id = ANY(%(sale_ids)s::int[])")
+    + " ON CONFLICT (id) DO NOTHING",
+)
+
+_PRODUCT_SALES_SAMPLE_SELECT = f"""
+    SELECT ps.id, ps.sale_id, ps.product_id, ps.quantity, ps.base_price, ps.total_price
+    FROM product_sales ps
+    WHERE {sampling.in_sample("ps.sale_id")} {{where}}
+"""
+
+PRODUCT_SALES_SAMPLE = declare(
+    sampling.PRODUCT_SALES_SAMPLE,
+    ddl=f"""
+        CREATE TABLE IF NOT EXISTS {sampling.PRODUCT_SALES_SAMPLE} (
+            id          INTEGER PRIMARY KEY,
+            sale_id     INTEGER NOT NULL,
+            product_id  INTEGER NOT NULL,
+            quantity    DOUBLE PRECISION,
+            base_price  DOUBLE PRECISION,
+            total_price DOUBLE PRECISION
+        );
+        CREATE INDEX IF NOT EXISTS idx_{sampling.PRODUCT_SALES_SAMPLE}_sale_id
+            ON {sampling.PRODUCT_SALES_SAMPLE} (sale_id)
+    """,
+    backfill=f"INSERT INTO {sampling.PRODUCT_SALES_SAMPLE} " + _PRODUCT_SALES_SAMPLE_SELECT.format(where=""),
+    apply=f"INSERT INTO {sampling.PRODUCT_SALES_SAMPLE} "
+    + _PRODUCT_SALES_SAMPLE_SELECT.format(where="AND ps.sale_id = ANY(%(sale_ids)s::int[])")
+    + " ON CONFLICT (id) DO NOTHING",
+)
+
+_STRATA_SELECT = f"""
+    SELECT DATE(s.created_at), s.store_id,
+           COUNT(*),
+           COUNT(*) FILTER (WHERE {sampling.in_sample("s.id")})
+    FROM sales s
+    {{where}}
+    GROUP BY 1, 2
+"""
+
+SAMPLE_STRATA = declare(
+    sampling.STRATA,
+    ddl=f"""
+        CREATE TABLE IF NOT EXISTS {sampling.STRATA} (
+            day        DATE NOT NULL,
+            store_id   INTEGER NOT NULL,
+            population BIGINT NOT NULL,
+            sampled    BIGINT NOT NULL,
+            PRIMARY KEY (day, store_id)
+        )
+    """,
+    backfill=f"INSERT INTO {sampling.STRATA} " + _STRATA_SELECT.format(where=""),
+    apply=f"INSERT INTO {sampling.STRATA} "
+    + _STRATA_SELECT.format(where="WHERE s.id = ANY(%(sale_ids)s::int[])")
+    + f"""
+    ON CONFLICT (day, store_id) DO UPDATE SET
+        population = {sampling.STRATA}.population + EXCLUDED.population,
+        sampled    = {sampling.STRATA}.sampled + EXCLUDED.sampled
+    """,
+)
+
+
+# ======================================================
+# Versão (xid) por loja × canal × dia para o delta sync (services/watermarks.py)
+# ======================================================
+SALES_BUCKET_VERSIONS = declare(
+    watermarks.TABLE,
+    ddl=watermarks.DDL,
+    backfill=watermarks.BACKFILL,
+    apply=watermarks.apply,
+)
+
+
+# ======================================================
+# Meses ativos por cliente × loja × canal × ano (services/cohorts.py)
+# ======================================================
+CUSTOMER_ACTIVITY_MONTHLY = declare(
+    cohorts.TABLE,
+    ddl=cohorts.DDL,
+    backfill=cohorts.BACKFILL,
+    apply=cohorts.APPLY,
+)
+
+
+# ======================================================
+# DDL / manutenção
+# ======================================================
+def ensure_rollups():
+    """Cria as tabelas que faltam e faz o backfill só delas"""
+    with get_conn(WORKLOAD_PRIMARY) as conn:
+        for r in ROLLUPS.values():
+            exists = conn.execute("SELECT to_regclass(%s)", [r.name]).fetchone()[0]
+            if exists:
+                continue
+            t0 = time.perf_counter()
+            conn.execute(r.ddl)
+            r.run_backfill(conn)
+            logger.info(f"🧮 Rollup {r.name} criado em {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+def apply(conn, sale_ids: list[int]):
+    """Atualiza todos os rollups com as vendas do lote (na transação do chamador)"""
+    if not sale_ids:
+        return
+    for r in ROLLUPS.values():
+        r.run_apply(conn, sale_ids)
+
+
+def rebuild(name: Optional[str] = None):
+    """Recalcula um rollup (ou todos) a partir do histórico"""
+    targets = [ROLLUPS[name]] if name else list(ROLLUPS.values())
+    with get_conn(WORKLOAD_PRIMARY) as conn:
+        for r in targets:
+            t0 = time.perf_counter()
+            conn.execute(r.ddl)
+            conn.execute(f"LOCK TABLE {r.name} IN EXCLUSIVE MODE")
+            conn.execute(f"TRUNCATE {r.name}")
+            r.run_backfill(conn)
+            print(f"✓ {r.name} reconstruído em {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manutenção das tabelas de rollup")
+    parser.add_argument("--rebuild", action="store_true", help="recalcula a partir do histórico")
+    parser.add_argument("--only", help="nome de um rollup específico")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild(args.only)
+    else:
+        ensure_rollups()
@@ -0,0 +1,81 @@
+# backend/app/services/sampling.py
+"""
+Amostra estratificada de vendas para o modo aproximado (?mode=approx).
+
+`sales_sample` e `product_sales_sample` guardam uma fração fixa
+(APPROX_SAMPLE_FRACTION) das vendas, escolhidas por um hash
+multiplicativo do id — determinístico, então a ingestão e o rebuild
+escolhem as mesmas vendas. A venda entra com todos os seus itens.
+`sales_sample_strata` conta, por (dia, loja), vendas totais e amostradas:
+a probabilidade de inclusão de cada estrato é π = sampled / population,
+o que corrige a variação da fração entre estratos.
+
+Os endpoints somam cada medida por venda com peso 1/π (estimador de
+Horvitz-Thompson) e a variância Σ y²(1 − π)/π² (amostragem de Poisson),
+que vira o intervalo de confiança (APPROX_CONFIDENCE) devolvido como
+<medida>_low / <medida>_high.
+
+As três tabelas são rollups (services/rollups.py), mantidas pela
+ingestão. Mudar a fração exige
+`python -m app.services.rollups --rebuild --only sales_sample` (e das outras duas).
+"""
+
+import math
+from statistics import NormalDist
+from typing import Optional
+
+from ..settings import settings
+
+SALES_SAMPLE = "sales_sample"
+PRODUCT_SALES_SAMPLE = "product_sales_sample"
+STRATA = "sales_sample_strata"
+
+_HASH_RANGE = 2 ** 32
+_THRESHOLD = int(settings.APPROX_SAMPLE_FRACTION * _HASH_RANGE)
+
+# Junção com o estrato da venda (alias `s` da amostra) e a probabilidade de inclusão
+STRATUM_JOIN = f"JOIN {STRATA} h ON h.day = DATE(s.created_at) AND h.store_id = s.store_id"
+PI = "(h.sampled::float8 / h.population)"
+
+_Z = NormalDist().inv_cdf(0.5 + settings.APPROX_CONFIDENCE / 2)
+
+
+def in_sample(sale_id: str) -> str:
+    """Predicado SQL: a venda faz parte da amostra (hash de Knuth sobre o id)"""
+    # mod() em vez de %: o SQL também vai em consultas com placeholders
+    return f"(mod(({sale_id})::bigint * 2654435761, {_HASH_RANGE}) < {_THRESHOLD})"
+
+
+def ht(expr: str, pi: str = PI) -> str:
+    """Duas colunas SQL: total estimado e sua variância para uma medida por venda"""
+    return (
+        f"SUM(({expr}) / {pi}), "
+        f"SUM(({expr})::float8 * ({expr}) * (1 - {pi}) / ({pi} * {pi}))"
+    )
+
+
+def header() -> str:
+    """Valor do cabeçalho X-Approximate"""
+    return f"fraction={settings.APPROX_SAMPLE_FRACTION}; confidence={settings.APPROX_CONFIDENCE}"
+
+
+def fields(name: str, estimate, variance, integer: bool = False, floor: Optional[float] = 0) -> dict:
+    """{name, name_low, name_high} para um total estimado"""
+    value = float(estimate or 0)
+    half = _Z * math.sqrt(max(float(variance or 0), 0.0))
+    low, high = value - half, value + half
+    if floor is not None:
+        low = max(low, floor)
+    if integer:
+        return {name: round(value), f"{name}_low": math.floor(low), f"{name}_high": math.ceil(high)}
+    return {name: round(value, 2), f"{name}_low": round(low, 2), f"{name}_high": round(high, 2)}
+
+
+def ratio_fields(name: str, num, den, var_num, var_den, cov) -> dict:
+    """Razão de dois totais estimados (ex.: ticket médio), intervalo pelo método delta"""
+    num, den = float(num or 0), float(den or 0)
+    if den <= 0:
+        return {name: 0.0, f"{name}_low": 0.0, f"{name}_high": 0.0}
+    r = num / den
+    variance = (float(var_num or 0) - 2 * r * float(cov or 0) + r * r * float(var_den or 0)) / (den * den)
+    return fields(name, r, variance)
@@ -0,0 +1,292 @@
+# backend/app/services/semantic.py
+"""
+Camada semântica do POST /query.
+
+O cliente pede medidas, dimensões e filtros; o planner escolhe, entre as
+fontes que conseguem responder, a menor (pg_class.reltuples) e compila
+o SQL. Fontes pré-agregadas (materialized views) entram automaticamente;
+as tabelas brutas são o fallback.
+
+Grão: pedidos com dimensão `product`, medida `qty` ou filtro de produto
+são respondidos no grão de item (product_sales) — ali `revenue` é a
+receita dos produtos (total_price), como em /sales/products/top.
+"""
+
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import HTTPException
+
+from .. import queries
+from ..db import get_conn, WORKLOAD_ANALYTICS
+from ..queries import SALES_WHERE, ROLLUP_WHERE
+from ..schemas.query import MetricsQuery, MetricsResult
+from . import matviews
+from .matviews import MV_SALES_HOURLY, MV_PRODUCT_DAILY
+
+logger = logging.getLogger(__name__)
+
+GRAIN_SALE = "sale"
+GRAIN_PRODUCT = "product"
+
+
+@dataclass
+class Source:
+    name: str
+    relation: str                       # tabela usada para medir o tamanho
+    grain: str
+    from_sql: str
+    where: str
+    dimensions: dict[str, str]
+    measures: dict[str, str]
+    joins: dict[str, str] = field(default_factory=dict)
+    completed_only: bool = False        # só contém vendas COMPLETED
+    matview: Optional[str] = None
+    # medida → dimensões obrigatórias (ex.: pedidos distintos por produto)
+    requires: dict[str, set[str]] = field(default_factory=dict)
+
+    def can_answer(self, q: MetricsQuery, grain: str) -> bool:
+        if grain != self.grain:
+            return False
+        if self.completed_only and sorted(s.upper() for s in q.filters.status) != ["COMPLETED"]:
+            return False
+        if any(d not in self.dimensions for d in q.dimensions):
+            return False
+        for m in q.measures:
+            if m not in self.measures:
+                return False
+            if not self.requires.get(m, set()) <= set(q.dimensions):
+                return False
+        return True
+
+
+_NAME_JOINS = {
+    "store": "JOIN stores st ON st.id = {a}.store_id",
+    "channel": "JOIN channels ch ON ch.id = {a}.channel_id",
+}
+
+
+def _raw_dimensions() -> dict[str, str]:
+    return {
+        "day": "DATE(s.created_at)",
+        "week": "DATE_TRUNC('week', s.created_at)::date",
+        "hour": "EXTRACT(HOUR FROM s.created_at)::int",
+        "dow": "EXTRACT(DOW FROM s.created_at)::int",
+        "store": "st.name",
+        "channel": "ch.name",
+        "city": "COALESCE(da.city, 'N/A')",
+    }
+
+
+def _rollup_dimensions() -> dict[str, str]:
+    return {
+        "day": "r.day",
+        "week": "DATE_TRUNC('week', r.day)::date",
+        "dow": "EXTRACT(DOW FROM r.day)::int",
+        "store": "st.name",
+        "channel": "ch.name",
+    }
+
+
+_P90 = "percentile_cont(0.9) WITHIN GROUP (ORDER BY s.delivery_seconds)"
+
+_PRODUCT_FILTER = "AND (cardinality(%(product_ids)s::int[]) = 0 OR {col} = ANY(%(product_ids)s::int[]))"
+
+SOURCES: list[Source] = [
+    Source(
+        name=MV_SALES_HOURLY,
+        relation=MV_SALES_HOURLY,
+        grain=GRAIN_SALE,
+        from_sql=f"{MV_SALES_HOURLY} r",
+        where=ROLLUP_WHERE,
+        dimensions={**_rollup_dimensions(), "hour": "r.hour"},
+        measures={
+            "revenue": "COALESCE(SUM(r.revenue), 0)",
+            "orders": "COALESCE(SUM(r.orders), 0)::bigint",
+            "avg_ticket": "SUM(r.revenue) / NULLIF(SUM(r.orders), 0)",
+        },
+        joins={k: v.format(a="r") for k, v in _NAME_JOINS.items()},
+        completed_only=True,
+        matview=MV_SALES_HOURLY,
+    ),
+    Source(
+        name=MV_PRODUCT_DAILY,
+        relation=MV_PRODUCT_DAILY,
+        grain=GRAIN_PRODUCT,
+        from_sql=f"{MV_PRODUCT_DAILY} r",
+        where=ROLLUP_WHERE + _PRODUCT_FILTER.format(col="r.product_id"),
+        dimensions={**_rollup_dimensions(), "product": "p.name"},
+        measures={
+            "revenue": "COALESCE(SUM(r.revenue), 0)",
+            "qty": "COALESCE(SUM(r.qty), 0)",
+            "orders": "COALESCE(SUM(r.orders), 0)::bigint",
+        },
+        joins={
+            **{k: v.format(a="r") for k, v in _NAME_JOINS.items()},
+            "product": "JOIN products p ON p.id = r.product_id",
+        },
+        completed_only=True,
+        matview=MV_PRODUCT_DAILY,
+        # pedidos distintos só somam entre dias/lojas/canais, não entre produtos
+        requires={"orders": {"product"}},
+    ),
+    Source(
+        name="sales",
+        relation="sales",
+        grain=GRAIN_SALE,
+        from_sql="sales s",
+        where=SALES_WHERE,
+        dimensions=_raw_dimensions(),
+        measures={
+            "revenue": "COALESCE(SUM(s.total_amount), 0)",
+            "orders": "COUNT(*)",
+            "avg_ticket": "AVG(s.total_amount)",
+            "p90_delivery": _P90,
+        },
+        joins={
+            **{k: v.format(a="s") for k, v in _NAME_JOINS.items()},
+            "city": "LEFT JOIN delivery_addresses da ON da.sale_id = s.id",
+        },
+    ),
+    Source(
+        name="product_sales",
+        relation="product_sales",
+        grain=GRAIN_PRODUCT,
+        from_sql="product_sales ps JOIN sales s ON s.id = ps.sale_id",
+        where=SALES_WHERE + _PRODUCT_FILTER.format(col="ps.product_id"),
+        dimensions={**_raw_dimensions(), "product": "p.name"},
+        measures={
+            "revenue": "COALESCE(SUM(ps.total_price), 0)",
+            "qty": "COALESCE(SUM(ps.quantity), 0)",
+            "orders": "COUNT(DISTINCT s.id)",
+            "p90_delivery": _P90,
+        },
+        joins={
+            **{k: v.format(a="s") for k, v in _NAME_JOINS.items()},
+            "city": "LEFT JOIN delivery_addresses da ON da.sale_id = s.id",
+            "product": "JOIN products p ON p.id = ps.product_id",
+        },
+    ),
+]
+
+
+# ------------------------------------------------------
+# Tamanho das fontes (pg_class.reltuples, cacheado)
+# ------------------------------------------------------
+_SIZE_TTL_SECONDS = 300
+_sizes: dict[str, float] = {}
+_sizes_at = 0.0
+
+
+def _source_sizes() -> dict[str, float]:
+    """Linhas estimadas por relação; relações inexistentes ficam de fora"""
+    global _sizes, _sizes_at
+    if time.monotonic() - _sizes_at < _SIZE_TTL_SECONDS and _sizes:
+        return _sizes
+
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        rows = conn.execute(
+            "SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s) AND relkind IN ('r', 'm', 'p')",
+            [[s.relation for s in SOURCES]],
+        ).fetchall()
+    _sizes = {name: float(n) for name, n in rows}
+    _sizes_at = time.monotonic()
+    return _sizes
+
+
+def grain_of(q: MetricsQuery) -> str:
+    if "product" in q.dimensions or "qty" in q.measures or q.filters.product_id:
+        return GRAIN_PRODUCT
+    return GRAIN_SALE
+
+
+def plan(q: MetricsQuery) -> Source:
+    grain = grain_of(q)
+    if grain == GRAIN_PRODUCT and "avg_ticket" in q.measures:
+        raise HTTPException(status_code=422, detail="avg_ticket não se aplica ao grão de produto")
+
+    sizes = _source_sizes()
+    candidates = [s for s in SOURCES if s.relation in sizes and s.can_answer(q, grain)]
+    if not candidates:
+        raise HTTPException(status_code=422, detail="Nenhuma fonte responde a essa combinação")
+
+    # reltuples = -1: view nunca analisada → fica atrás das de tamanho conhecido
+    order = {s.name: i for i, s in enumerate(SOURCES)}
+    return min(
+        candidates,
+        key=lambda s: (sizes[s.relation] < 0, sizes[s.relation], order[s.name]),
+    )
+
+
+# ------------------------------------------------------
+# Compilação
+# ------------------------------------------------------
+def compile_sql(q: MetricsQuery, source: Source) -> str:
+    select = [f'{source.dimensions[d]} AS "{d}"' for d in q.dimensions]
+    select += [f'{source.measures[m]} AS "{m}"' for m in q.measures]
+    joins = [source.joins[d] for d in q.dimensions if d in source.joins]
+
+    sql = f"SELECT {', '.join(select)}\nFROM {source.from_sql}\n"
+    if joins:
+        sql += "\n".join(joins) + "\n"
+    sql += f"WHERE {source.where}\n"
+    if q.dimensions:
+        sql += f"GROUP BY {', '.join(str(i + 1) for i in range(len(q.dimensions)))}\n"
+
+    if q.order_by:
+        column = q.order_by.lstrip("-")
+        if column not in q.dimensions and column not in q.measures:
+            raise HTTPException(status_code=422, detail=f"order_by inválido: {q.order_by}")
+        direction = "DESC" if q.order_by.startswith("-") else "ASC"
+        sql += f'ORDER BY "{column}" {direction} NULLS LAST\n'
+    elif q.dimensions:
+        sql += f"ORDER BY {', '.join(str(i + 1) for i in range(len(q.dimensions)))}\n"
+
+    return sql + "LIMIT %(limit)s"
+
+
+def _params(q: MetricsQuery) -> dict:
+    f = q.filters
+    return {
+        "start": f.start,
+        "end": f.end + timedelta(days=1) if f.end else None,   # vira exclusivo
+        "store_ids": sorted(f.store_id),
+        "channel_ids": sorted(f.channel_id),
+        "channel_name": None,
+        "statuses": sorted({s.upper() for s in f.status}),
+        "product_ids": sorted(f.product_id),
+        "limit": q.limit,
+    }
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def run(q: MetricsQuery) -> MetricsResult:
+    source = plan(q)
+    sql = compile_sql(q, source)
+    # mesmo pedido → mesmo texto → mesmo statement preparado
+    name = queries.ensure(
+        f"semantic_{source.name}_{hashlib.sha1(sql.encode()).hexdigest()[:10]}", sql
+    )
+
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        rows = queries.run(conn, name, _params(q))
+
+    columns = list(q.dimensions) + list(q.measures)
+    as_of = matviews.as_of(source.matview) if source.matview else None
+    return MetricsResult(
+        source=source.name,
+        as_of=as_of.isoformat() if as_of else None,
+        data=[{c: _plain(v) for c, v in zip(columns, row)} for row in rows],
+    )
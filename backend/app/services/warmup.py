@@ -0,0 +1,254 @@
+# backend/app/services/warmup.py
+"""
+Aquecimento pós-startup.
+
+Depois que a API sobe, uma tarefa de fundo:
+  1. traz para o buffer do Postgres as páginas dos rollups declarados
+     (services/rollups.py) e das materialized views, com seus índices
+     (pg_prewarm quando a extensão existe, senão uma varredura simples);
+  2. chama os endpoints de WARMUP_ENDPOINTS com as combinações de filtro
+     do Overview (hoje, últimos 7/30 dias × todas as lojas, cada loja
+     ativa, cada canal), populando o cache de resultados (app/cache.py).
+     Endpoints cujo `end` é exclusivo declaram isso na assinatura
+     (END_EXCLUSIVE em routers/sales.py); os demais recebem o último dia.
+
+Não bloqueia o startup: /health/ready responde assim que o pool está de
+pé (ou só após o warm-up, se WARMUP_REQUIRED_FOR_READY) e o progresso
+fica em /health/warmup.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+import typing
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from fastapi.routing import APIRoute
+
+from ..budget import QueryBudget, budget_ms, set_budget
+from ..db import get_conn, WORKLOAD_ANALYTICS, WORKLOAD_READ
+from ..settings import settings
+from . import matviews, rollups
+
+logger = logging.getLogger(__name__)
+
+progress: dict = {
+    "status": "pending",      # pending → running → done | failed | disabled
+    "total": 0,
+    "done": 0,
+    "failed": 0,
+    "prewarmed_relations": 0,
+    "started_at": None,
+    "finished_at": None,
+    "duration_ms": None,
+    "last_error": None,
+}
+
+
+def is_warm() -> bool:
+    return progress["status"] in ("done", "disabled")
+
+
+# ------------------------------------------------------
+# 1) Páginas dos rollups e materialized views
+# ------------------------------------------------------
+def _warm_tables() -> list[str]:
+    names = list(rollups.ROLLUPS)
+    if settings.MATVIEWS_ENABLED:
+        names += [mv.name for mv in matviews.MATVIEWS.values()]
+    return names
+
+
+def prewarm_relations() -> int:
+    """Carrega tabelas, views e seus índices no shared_buffers; retorna quantas relações tocou"""
+    touched = 0
+
+    with get_conn(WORKLOAD_ANALYTICS) as conn:
+        has_prewarm = conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm')"
+        ).fetchone()[0]
+
+        for name in _warm_tables():
+            if not conn.execute("SELECT to_regclass(%s)", [name]).fetchone()[0]:
+                continue
+            if not has_prewarm:
+                # sem a extensão: varredura sequencial lê a heap inteira
+                conn.execute(f"SELECT count(*) FROM {name}")
+                touched += 1
+                continue
+
+            # índices vêm do catálogo: cobre pkey, _uniq e os criados depois
+            indexes = [r[0] for r in conn.execute(
+                "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = %s::regclass",
+                [name],
+            ).fetchall()]
+            for rel in [name, *indexes]:
+                conn.execute("SELECT pg_prewarm(%s)", [rel])
+                touched += 1
+
+    return touched
+
+
+# ------------------------------------------------------
+# 2) Combinações endpoint × filtros
+# ------------------------------------------------------
+def _accepts_list(annotation) -> bool:
+    if typing.get_origin(annotation) in (list, typing.List):
+        return True
+    return any(_accepts_list(a) for a in typing.get_args(annotation))
+
+
+def _end_is_exclusive(param: inspect.Parameter) -> bool:
+    # END_EXCLUSIVE (routers/sales.py) marca o Query com json_schema_extra
+    extra = getattr(param.default, "json_schema_extra", None)
+    return isinstance(extra, dict) and bool(extra.get("end_exclusive"))
+
+
+def _filter_combos() -> list[dict]:
+    """
+    Filtros do Overview: (período | sem período) × (tudo | cada loja ativa | cada canal).
+    `end` é o último dia do período (inclusivo); kwargs_for ajusta por endpoint.
+    """
+    with get_conn(WORKLOAD_READ) as conn:
+        store_ids = [r[0] for r in conn.execute(
+            "SELECT id FROM stores WHERE is_active ORDER BY id"
+        ).fetchall()]
+        channel_ids = [r[0] for r in conn.execute(
+            "SELECT id FROM channels ORDER BY id"
+        ).fetchall()]
+
+    today = date.today()
+    ranges: list[tuple[Optional[str], Optional[str]]] = [(None, None)]
+    for days in settings.WARMUP_RANGES_DAYS:
+        start = today - timedelta(days=max(days, 1) - 1)
+        ranges.append((start.isoformat(), today.isoformat()))
+
+    scopes = [{}]
+    scopes += [{"store_id": sid} for sid in store_ids]
+    scopes += [{"channel_id": cid} for cid in channel_ids]
+
+    return [
+        {"start": start, "end": end, **scope}
+        for start, end in ranges
+        for scope in scopes
+    ]
+
+
+def kwargs_for(sig: inspect.Signature, combo: dict) -> Optional[dict]:
+    """Adapta a combinação aos parâmetros do endpoint (None = não se aplica)"""
+    params = sig.parameters
+    kwargs = {}
+
+    for name in ("start", "end"):
+        if combo[name] is None:
+            continue
+        if name not in params:
+            return None
+        kwargs[name] = combo[name]
+    # `end` exclusivo: o último dia vai como end + 1, senão o range de 1 dia
+    # aquece um período vazio
+    if "end" in kwargs and _end_is_exclusive(params["end"]):
+        kwargs["end"] = (date.fromisoformat(kwargs["end"]) + timedelta(days=1)).isoformat()
+
+    # endpoints com período obrigatório só entram nas combinações com datas
+    for name in ("start", "end"):
+        if name in params and params[name].default is inspect.Parameter.empty and name not in kwargs:
+            return None
+
+    for name in ("store_id", "channel_id"):
+        if name not in combo:
+            continue
+        if name not in params:
+            return None
+        value = combo[name]
+        kwargs[name] = [value] if _accepts_list(params[name].annotation) else value
+
+    return kwargs
+
+
+def _plan(routes: list) -> list[tuple[str, Callable, dict]]:
+    by_path = {
+        r.path.removeprefix(settings.API_PREFIX): r
+        for r in routes
+        if isinstance(r, APIRoute) and "GET" in r.methods
+    }
+    combos = _filter_combos()
+
+    plan = []
+    for path in settings.WARMUP_ENDPOINTS:
+        route = by_path.get(path)
+        if route is None:
+            logger.warning(f"⚠️ Warm-up: endpoint {path} não existe")
+            continue
+
+        sig = inspect.signature(route.endpoint)
+        seen = set()
+        for combo in combos:
+            kwargs = kwargs_for(sig, combo)
+            if kwargs is None:
+                continue
+            key = tuple(sorted((k, str(v)) for k, v in kwargs.items()))
+            if key in seen:
+                continue
+            seen.add(key)
+            plan.append((path, route.endpoint, kwargs))
+    return plan
+
+
+def _call(path: str, endpoint: Callable, kwargs: dict):
+    # mesmo statement_timeout que a rota teria numa requisição real
+    set_budget(QueryBudget(f"warmup:{path}", budget_ms(path)))
+    endpoint(**kwargs)
+
+
+# ------------------------------------------------------
+# Tarefa de fundo
+# ------------------------------------------------------
+async def run_warmup(routes: list):
+    if not settings.WARMUP_ENABLED:
+        progress["status"] = "disabled"
+        return
+
+    progress.update(
+        status="running",
+        started_at=datetime.now(timezone.utc).isoformat(),
+    )
+    t0 = time.perf_counter()
+
+    try:
+        try:
+            progress["prewarmed_relations"] = await asyncio.to_thread(prewarm_relations)
+        except Exception as e:
+            logger.warning(f"⚠️ Warm-up: falha ao pré-carregar rollups/views: {e}")
+
+        plan = await asyncio.to_thread(_plan, routes)
+        progress["total"] = len(plan)
+
+        sem = asyncio.Semaphore(settings.WARMUP_CONCURRENCY)
+
+        async def replay(path, endpoint, kwargs):
+            async with sem:
+                try:
+                    await asyncio.to_thread(_call, path, endpoint, kwargs)
+                    progress["done"] += 1
+                except Exception as e:
+                    progress["failed"] += 1
+                    progress["last_error"] = f"{path}: {e}"
+
+        await asyncio.gather(*(replay(*item) for item in plan))
+        progress["status"] = "done"
+    except Exception as e:
+        logger.error(f"❌ Warm-up falhou: {e}")
+        progress.update(status="failed", last_error=str(e))
+    finally:
+        progress.update(
+            finished_at=datetime.now(timezone.utc).isoformat(),
+            duration_ms=round((time.perf_counter() - t0) * 1000, 1),
+        )
+
+    logger.info(
+        f"🔥 Warm-up {progress['status']}: {progress['done']}/{progress['total']} "
+        f"chamadas em {progress['duration_ms']:.0f} ms"
+    )
@@ -0,0 +1,173 @@
+# backend/app/services/watermarks.py
+"""
+Delta sync: `?since=<watermark>` devolve só os buckets alterados.
+
+`sales_bucket_versions` guarda, por (loja, canal, dia), o id da última
+transação que mexeu em vendas daquele bucket (xid8). A tabela é declarada
+como rollup (services/rollups.py) para criação e rebuild, mas quem marca
+os buckets é o trigger por comando em `sales` (services/changefeed.py):
+INSERT/COPY, UPDATE (bucket antigo e novo) e DELETE, pela API ou por fora.
+
+Um bucket alterado que não tem mais linhas no filtro da resposta volta no
+delta como tombstone (`deleted: true`), para o cliente descartá-lo.
+
+O watermark é um pg_snapshot ("xmin:xmax:xip,...") tirado ANTES da leitura
+dos dados: um bucket mudou depois do watermark se o xid dele não é visível
+no snapshot. Isso vale mesmo com transações concorrentes que comitam fora
+de ordem (um timestamp não garantiria). Uma mudança que entra entre o
+snapshot e a leitura só é reenviada no próximo delta.
+
+Para respostas lidas de materialized views, o watermark é o snapshot
+gravado no refresh da view (services/matviews.py): mudanças que a view
+ainda não tem voltam no delta seguinte ao próximo refresh.
+
+O rebuild do rollup marca todos os buckets com o xid do rebuild, então
+qualquer watermark anterior recebe tudo de novo.
+"""
+
+from datetime import date
+from typing import Optional
+
+from .. import queries
+from ..queries import ROLLUP_WHERE
+
+TABLE = "sales_bucket_versions"
+
+# formato de pg_snapshot; validado no Query() dos endpoints
+WATERMARK_PATTERN = r"^\d+:\d+:(\d+(,\d+)*)?$"
+
+DDL = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE} (
+        day        DATE NOT NULL,
+        store_id   INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        xid        XID8 NOT NULL,
+        PRIMARY KEY (day, store_id, channel_id)
+    )
+"""
+
+BACKFILL = f"""
+    INSERT INTO {TABLE}
+    SELECT DATE(s.created_at), s.store_id, s.channel_id, pg_current_xact_id()
+    FROM sales s
+    GROUP BY 1, 2, 3
+"""
+
+
+def apply(conn, sale_ids: list[int]):
+    """Nada a fazer na ingestão: o trigger de `sales` já marcou os buckets do lote"""
+
+
+# Corpo do trigger de `sales` (plpgsql): {source} seleciona store_id,
+# channel_id e created_at das transition tables do comando. O ORDER BY
+# fixa a ordem dos locks entre comandos concorrentes.
+MARK = f"""
+                INSERT INTO {TABLE} (day, store_id, channel_id, xid)
+                SELECT DISTINCT created_at::date, store_id, channel_id, pg_current_xact_id()
+                FROM ({{source}}) changed
+                ORDER BY 1, 2, 3
+                ON CONFLICT (day, store_id, channel_id) DO UPDATE SET xid = EXCLUDED.xid;
+"""
+
+Q_CURRENT = queries.register("watermark_current", "SELECT pg_current_snapshot()::text")
+
+Q_NAMES = queries.register("watermark_bucket_names", """
+    SELECT k.store_id, k.channel_id, st.name, ch.name
+    FROM unnest(%(store_ids)s::int[], %(channel_ids)s::int[]) k(store_id, channel_id)
+    JOIN stores st ON st.id = k.store_id
+    JOIN channels ch ON ch.id = k.channel_id
+""")
+
+Q_CHANGED = queries.register("watermark_changed", f"""
+    SELECT r.store_id, r.channel_id, r.day
+    FROM {TABLE} r
+    WHERE NOT pg_visible_in_snapshot(r.xid, %(since)s::pg_snapshot)
+      AND {ROLLUP_WHERE}
+    ORDER BY 1, 2, 3
+""")
+
+Q_FIRST_CHANGED = queries.register("watermark_first_changed", f"""
+    SELECT MIN(r.day)
+    FROM {TABLE} r
+    WHERE NOT pg_visible_in_snapshot(r.xid, %(since)s::pg_snapshot)
+      AND {ROLLUP_WHERE}
+""")
+
+# Filtro das consultas de delta: só as vendas dos buckets alterados (alias `s`).
+# A faixa de datas usa o índice de DATE(created_at); o unnest casa as chaves.
+_DELTA_WHERE = """
+    AND DATE(s.created_at) >= %(bucket_from)s::date
+    AND DATE(s.created_at) < %(bucket_to)s::date
+    AND (s.store_id, s.channel_id, {bucket}) IN (
+        SELECT * FROM unnest(%(bucket_store_ids)s::int[], %(bucket_channel_ids)s::int[], %(bucket_keys)s::date[])
+    )
+"""
+
+DELTA_WHERE_DAY = _DELTA_WHERE.format(bucket="DATE(s.created_at)")
+DELTA_WHERE_MONTH = _DELTA_WHERE.format(bucket="DATE_TRUNC('month', s.created_at)::date")
+
+
+def current(conn) -> str:
+    return queries.run(conn, Q_CURRENT, one=True)[0]
+
+
+def changed(conn, since: str, params: dict) -> list[tuple[int, int, date]]:
+    """Buckets (loja, canal, dia) alterados depois de `since`, dentro dos filtros"""
+    return queries.run(conn, Q_CHANGED, {**params, "since": since})
+
+
+def first_changed(conn, since: str, params: dict) -> Optional[date]:
+    """Dia mais antigo alterado depois de `since`, dentro dos filtros"""
+    return queries.run(conn, Q_FIRST_CHANGED, {**params, "since": since}, one=True)[0]
+
+
+def _month(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def delta_params(buckets: list[tuple[int, int, date]], grain: str = "day") -> Optional[dict]:
+    """Parâmetros de DELTA_WHERE_DAY / _MONTH (None = nenhum bucket mudou)"""
+    if not buckets:
+        return None
+    if grain == "month":
+        keys = sorted({(store_id, channel_id, _month(day)) for store_id, channel_id, day in buckets})
+        upper = _next_month(max(k[2] for k in keys))
+    else:
+        keys = sorted(set(buckets))
+        upper = date.fromordinal(max(k[2] for k in keys).toordinal() + 1)
+    return {
+        "bucket_from": min(k[2] for k in keys),
+        "bucket_to": upper,
+        "bucket_store_ids": [k[0] for k in keys],
+        "bucket_channel_ids": [k[1] for k in keys],
+        "bucket_keys": [k[2] for k in keys],
+    }
+
+
+def tombstones(conn, buckets: list[tuple[int, int, date]], present: set, grain: str = "day") -> list[tuple]:
+    """
+    Buckets alterados sem linha na resposta, como (chave, loja, canal) por nome.
+    `present` tem as mesmas tuplas das linhas devolvidas; a chave é o dia, o
+    1º dia do mês (grain="month") ou None (grain="store_channel").
+    """
+    pairs = sorted({(store_id, channel_id) for store_id, channel_id, _ in buckets})
+    if not pairs:
+        return []
+    names = {
+        (r[0], r[1]): (r[2], r[3])
+        for r in queries.run(conn, Q_NAMES, {
+            "store_ids": [p[0] for p in pairs],
+            "channel_ids": [p[1] for p in pairs],
+        })
+    }
+    keys = set()
+    for store_id, channel_id, day in buckets:
+        if (store_id, channel_id) not in names:
+            continue
+        key = None if grain == "store_channel" else _month(day) if grain == "month" else day
+        keys.add((key, *names[(store_id, channel_id)]))
+    return sorted(keys - present, key=lambda k: (k[0] or date.min, k[1], k[2]))
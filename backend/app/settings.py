@@ -1,6 +1,7 @@
 # backend/app/settings.py
 from pydantic_settings import BaseSettings
 from pydantic import Field
+from typing import Optional
 
 class Settings(BaseSettings):
     APP_NAME: str = "Restaurant Analytics API"
@@ -12,6 +13,153 @@ class Settings(BaseSettings):
     DB_USER: str = Field(default="challenge")
     DB_PASSWORD: str = Field(default="challenge_2024")
 
+    # ✅ pools de conexão por classe de carga (ver app/db.py)
+    DB_POOL_MAX_SIZE: int = Field(default=10)
+    DB_POOL_TIMEOUT: float = Field(default=10)
+    DB_REPLICA_HOSTS: list[str] = Field(default=[])  # ex.: ["localhost:5433"]
+    DB_REPLICA_POOL_MAX_SIZE: int = Field(default=10)
+    DB_REPLICA_MAX_LAG_SECONDS: float = Field(default=5)
+    DB_REPLICA_LAG_CHECK_SECONDS: float = Field(default=2)
+    DB_ANALYTICS_HOST: Optional[str] = Field(default=None)  # "host:porta"
+    DB_ANALYTICS_POOL_MAX_SIZE: int = Field(default=3)
+
+    # ✅ orçamento de tempo por endpoint (statement_timeout, em ms)
+    QUERY_BUDGET_DEFAULT_MS: int = Field(default=5000)
+    QUERY_BUDGETS_MS: dict[str, int] = Field(default={
+        "/sales/products/margin": 15000,
+        "/sales/customizations/top": 15000,
+        "/sales/delivery/regions": 10000,
+        "/sales/products/trending/hourly": 10000,
+        "/metadata/stores": 2000,
+        "/metadata/channels": 2000,
+        "/ingest/sales": 30000,
+        "/query": 15000,
+    })
+    QUERY_RETRY_AFTER_SECONDS: int = Field(default=5)
+    QUERY_DISCONNECT_POLL_SECONDS: float = Field(default=0.5)
+    QUERY_RUNTIME_SHAPES_MAX: int = Field(default=256)     # shapes gerados pelo /query (LRU)
+
+    # ✅ controle de admissão por faixa de custo (app/admission.py)
+    ADMISSION_ENABLED: bool = Field(default=True)
+    ADMISSION_TIERS: dict[str, dict[str, float]] = Field(default={
+        "light": {"concurrency": 32, "queue": 64, "max_wait_ms": 1000},
+        "medium": {"concurrency": 8, "queue": 32, "max_wait_ms": 3000},
+        "heavy": {"concurrency": 3, "queue": 12, "max_wait_ms": 5000},
+    })
+    ADMISSION_DEFAULT_TIER: str = Field(default="medium")
+    ADMISSION_ENDPOINT_TIERS: dict[str, str] = Field(default={
+        "/health": "light",
+        "/health/pools": "light",
+        "/health/ready": "light",
+        "/health/warmup": "light",
+        "/metadata/stores": "light",
+        "/metadata/channels": "light",
+        "/sales/products/margin": "heavy",
+        "/sales/products/trending/hourly": "heavy",
+        "/query": "heavy",
+        "/sales/live": "exempt",       # stream longo
+        "/ingest/sales": "exempt",     # backpressure própria
+    })
+    ADMISSION_EXPLAIN_REFINE: bool = Field(default=False)
+    ADMISSION_REFINE_SECONDS: float = Field(default=600)
+    ADMISSION_COST_TIERS: dict[str, float] = Field(default={"light": 1000, "medium": 100000})  # custo ≤ limite
+
+    # ✅ materialized views (app/services/matviews.py)
+    MATVIEWS_ENABLED: bool = Field(default=True)
+    MATVIEW_TICK_SECONDS: float = Field(default=5)
+
+    # ✅ cache de resultados (app/cache.py)
+    CACHE_ENABLED: bool = Field(default=True)
+    CACHE_TTL_SECONDS: float = Field(default=300)
+    CACHE_MAX_ENTRIES: int = Field(default=2000)
+    COALESCE_ENABLED: bool = Field(default=True)   # misses idênticos em paralelo → 1 consulta (app/singleflight.py)
+
+    # ✅ captura de consultas lentas (app/slowlog.py)
+    SLOW_QUERY_ENABLED: bool = Field(default=True)
+    SLOW_QUERY_MS: float = Field(default=500)
+    SLOW_QUERY_EXPLAIN_RATE: float = Field(default=0.1)          # fração reexecutada com EXPLAIN ANALYZE
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS: int = Field(default=5000)      # teto; o orçamento do endpoint vale se for menor
+    SLOW_QUERY_LOG_PATH: str = Field(default="data/slow_queries.jsonl")
+    SLOW_QUERY_LOG_MAX_RECORDS: int = Field(default=2000)        # buffer circular (2 segmentos)
+    SLOW_QUERY_LARGE_TABLE_ROWS: int = Field(default=100000)     # seq scan acima disso é destacado
+
+    # ✅ warm-up pós-startup (app/services/warmup.py)
+    WARMUP_ENABLED: bool = Field(default=True)
+    WARMUP_ENDPOINTS: list[str] = Field(default=[
+        "/sales/overview",
+        "/sales/timeseries/daily",
+        "/sales/ticket",
+        "/sales/delivery/performance",
+        "/sales/products/trending",
+        "/sales/products/trending/hourly",
+        "/sales/products/not-selling",
+        "/sales/recent",
+        "/metadata/stores",
+        "/metadata/channels",
+    ])
+    WARMUP_RANGES_DAYS: list[int] = Field(default=[1, 7, 30])  # 1 = hoje
+    WARMUP_CONCURRENCY: int = Field(default=2)
+    WARMUP_REQUIRED_FOR_READY: bool = Field(default=False)
+
+    # ✅ change feed LISTEN/NOTIFY (app/services/changefeed.py)
+    CHANGEFEED_ENABLED: bool = Field(default=True)
+    CHANGEFEED_CHANNEL: str = Field(default="sales_changes")
+    CHANGEFEED_KEYS_PER_NOTIFY: int = Field(default=200)
+    CHANGEFEED_RECONNECT_SECONDS: float = Field(default=2)
+
+    # ✅ KPIs ao vivo via SSE (app/services/live.py)
+    LIVE_TICK_SECONDS: float = Field(default=1)
+    LIVE_POLL_SECONDS: float = Field(default=10)  # só sem change feed
+    LIVE_HEARTBEAT_SECONDS: float = Field(default=15)
+    LIVE_CLIENT_QUEUE: int = Field(default=16)
+    LIVE_SEEN_IDS: int = Field(default=200000)
+
+    # ✅ fan-out mensal de períodos longos (app/services/fanout.py)
+    FANOUT_ENABLED: bool = Field(default=True)
+    FANOUT_MIN_DAYS: int = Field(default=62)      # períodos menores rodam numa consulta só
+    FANOUT_MAX_WORKERS: int = Field(default=3)    # ≤ DB_ANALYTICS_POOL_MAX_SIZE
+
+    # ✅ DuckDB sobre snapshots Parquet (app/services/duckdb_engine.py)
+    DUCKDB_ENABLED: bool = Field(default=True)
+    SNAPSHOT_DIR: str = Field(default="data/snapshots")
+    DUCKDB_THREADS: Optional[int] = Field(default=None)        # None = núcleos da máquina
+    DUCKDB_MEMORY_LIMIT: Optional[str] = Field(default=None)   # ex.: "2GB"
+
+    # ✅ pool de processos para etapas de CPU (app/compute.py)
+    COMPUTE_ENABLED: bool = Field(default=True)
+    COMPUTE_WORKERS: Optional[int] = Field(default=None)        # None = núcleos da máquina
+    COMPUTE_START_METHOD: str = Field(default="forkserver")     # fork herdaria threads/conexões da API
+    COMPUTE_TIMEOUT_SECONDS: float = Field(default=10)
+    COMPUTE_KILL_GRACE_SECONDS: float = Field(default=5)        # depois do prazo, mata o worker
+    COMPUTE_QUEUE_TIMEOUT_SECONDS: float = Field(default=10)    # espera por um worker livre (depois, 503)
+    COMPUTE_MIN_ITEMS: int = Field(default=2000)                # custo estimado abaixo disso roda inline
+    COMPUTE_SHARED_MIN_BYTES: int = Field(default=65536)        # arrays maiores vão por memória compartilhada
+
+    # ✅ previsão de vendas (app/services/forecast.py)
+    FORECAST_HISTORY_DAYS: int = Field(default=365)
+    FORECAST_MAX_HORIZON_DAYS: int = Field(default=90)
+    FORECAST_CHECK_SECONDS: float = Field(default=60)     # intervalo do job de fundo (dia fechado / vendas tardias)
+
+    # ✅ modo aproximado ?mode=approx (app/services/sampling.py)
+    APPROX_SAMPLE_FRACTION: float = Field(default=0.05)   # mudar exige rebuild dos rollups de amostra
+    APPROX_CONFIDENCE: float = Field(default=0.95)
+
+    # ✅ exportação Parquet incremental (app/services/exporter.py)
+    EXPORT_ENABLED: bool = Field(default=False)
+    EXPORT_INTERVAL_SECONDS: float = Field(default=900)
+    EXPORT_BATCH_SALES: int = Field(default=50000)               # vendas por lote de leitura
+    EXPORT_BATCH_PARTITIONS: int = Field(default=500)            # partições (dia × loja) por lote de reexportação
+    EXPORT_ROW_GROUP_SIZE: int = Field(default=131072)
+    EXPORT_COMPACT_MIN_FILES: int = Field(default=8)             # arquivos por partição para compactar
+    EXPORT_COMPACT_INTERVAL_SECONDS: float = Field(default=3600)
+    EXPORT_RETIRE_SECONDS: float = Field(default=600)            # espera antes de apagar arquivos trocados
+
+    # ✅ ingestão de vendas (app/services/ingest.py)
+    INGEST_MAX_BATCH: int = Field(default=10000)
+    INGEST_MAX_CONCURRENT_BATCHES: int = Field(default=4)
+    INGEST_MAX_POOL_SATURATION: float = Field(default=0.9)
+    INGEST_RETRY_AFTER_SECONDS: int = Field(default=1)
+
     # ✅ variáveis de IA (Groq)
     GROQ_API_KEY: str = Field(..., env="GROQ_API_KEY")
     GROQ_MODEL: str = Field(default="llama-3.3-70b-versatile")
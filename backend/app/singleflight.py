@@ -0,0 +1,135 @@
+# backend/app/singleflight.py
+"""
+Coalescência de chamadas idênticas em andamento (single-flight).
+
+A primeira chamada para uma chave executa; as duplicadas que chegam
+enquanto ela roda esperam e recebem o mesmo resultado (ou a mesma
+exceção). Depois que a chamada termina a chave é liberada — guardar o
+resultado é papel do cache (app/cache.py), que usa isto no miss: após
+uma expiração, N abas abrindo o dashboard custam uma consulta só.
+
+Há duas variantes: do() para código síncrono (threads do FastAPI) e
+do_async() para corrotinas. Se a chamada líder falhar porque o cliente
+dela desconectou (orçamento cancelado), as que esperavam tentam de novo
+em vez de herdar o cancelamento.
+
+As chaves devem começar pelo nome do endpoint (usado nas estatísticas).
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+
+from .budget import current_budget
+from .settings import settings
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.abandoned = False      # líder cancelado por desconexão do próprio cliente
+
+
+_flights: dict[Hashable, _Flight] = {}
+_async_flights: dict[tuple, asyncio.Future] = {}
+_lock = threading.Lock()
+_stats = {"leaders": 0, "coalesced": 0, "retries": 0}
+_by_endpoint: dict[str, dict[str, int]] = {}
+
+
+def _count(key: Hashable, field: str):
+    # chamado com _lock
+    _stats[field] += 1
+    name = key[0] if isinstance(key, tuple) and key else str(key)
+    endpoint = _by_endpoint.setdefault(name, {"leaders": 0, "coalesced": 0})
+    if field in endpoint:
+        endpoint[field] += 1
+
+
+def _leader_abandoned() -> bool:
+    budget = current_budget()
+    return budget is not None and budget.disconnected
+
+
+def do(key: Hashable, fn: Callable[[], Any]) -> Any:
+    """Executa fn() uma vez por chave entre as chamadas concorrentes (threads)"""
+    if not settings.COALESCE_ENABLED:
+        return fn()
+
+    while True:
+        with _lock:
+            flight = _flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _flights[key] = _Flight()
+            _count(key, "leaders" if leader else "coalesced")
+
+        if leader:
+            try:
+                flight.result = fn()
+                return flight.result
+            except BaseException as e:
+                flight.error = e
+                flight.abandoned = _leader_abandoned()
+                raise
+            finally:
+                with _lock:
+                    _flights.pop(key, None)
+                flight.done.set()
+
+        flight.done.wait()
+        if flight.error is None:
+            return flight.result
+        if not flight.abandoned:
+            raise flight.error
+        with _lock:
+            _stats["retries"] += 1
+
+
+async def do_async(key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Mesma ideia para corrotinas (chamadas no mesmo event loop)"""
+    if not settings.COALESCE_ENABLED:
+        return await fn()
+
+    loop = asyncio.get_running_loop()
+    flight_key = (id(loop), key)
+    while True:
+        future = _async_flights.get(flight_key)
+        leader = future is None
+        with _lock:
+            _count(key, "leaders" if leader else "coalesced")
+
+        if leader:
+            future = _async_flights[flight_key] = loop.create_future()
+            try:
+                result = await fn()
+            except BaseException as e:
+                abandoned = isinstance(e, asyncio.CancelledError) or _leader_abandoned()
+                future.set_result((False, e, abandoned))
+                raise
+            else:
+                future.set_result((True, result, False))
+                return result
+            finally:
+                _async_flights.pop(flight_key, None)
+
+        ok, value, abandoned = await asyncio.shield(future)
+        if ok:
+            return value
+        if not abandoned:
+            raise value
+        with _lock:
+            _stats["retries"] += 1
+
+
+def stats() -> dict:
+    with _lock:
+        calls = _stats["leaders"] + _stats["coalesced"]
+        return {
+            **_stats,
+            "in_flight": len(_flights) + len(_async_flights),
+            "suppressed_ratio": round(_stats["coalesced"] / calls, 3) if calls else None,
+            "by_endpoint": {k: dict(v) for k, v in _by_endpoint.items()},
+        }
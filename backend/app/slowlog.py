@@ -0,0 +1,256 @@
+# backend/app/slowlog.py
+"""
+Captura de consultas lentas.
+
+Toda execução de shape (queries.run) acima de SLOW_QUERY_MS — ou que
+falhou depois desse tempo, ex.: statement_timeout — vira um registro com
+shape, endpoint, parâmetros, duração e linhas. Uma fração
+(SLOW_QUERY_EXPLAIN_RATE) é reexecutada com
+EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) para guardar o plano real, com
+statement_timeout no orçamento do endpoint (teto
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS). Consultas que falharam só ganham o plano
+estimado (EXPLAIN sem ANALYZE): reexecutá-las estouraria o mesmo timeout.
+
+O caminho da requisição só enfileira o registro; o EXPLAIN e a escrita
+em disco rodam numa thread própria (fila cheia → registro descartado).
+
+Os registros vão para um buffer circular em disco: dois segmentos JSONL
+de SLOW_QUERY_LOG_MAX_RECORDS / 2 linhas; quando o atual enche, ele vira
+o anterior e o mais antigo é apagado. /debug/slow-queries agrega por shape.
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+_queue: "queue.Queue[dict]" = queue.Queue(maxsize=256)
+_worker: Optional[threading.Thread] = None
+_lock = threading.Lock()
+_lines: Optional[int] = None        # linhas no segmento atual (contadas na 1ª escrita)
+_stats = {"captured": 0, "explained": 0, "explain_errors": 0, "dropped": 0}
+
+_READ_ONLY = re.compile(r"^\s*(/\*.*?\*/\s*)*(SELECT|WITH)\b", re.IGNORECASE | re.DOTALL)
+
+
+def capture(shape: str, sql: str, params: Optional[dict], ms: float, rows: Optional[int],
+            error: Optional[BaseException] = None):
+    """Chamado por queries.run; barato quando a consulta não passou do limite"""
+    if not settings.SLOW_QUERY_ENABLED or ms < settings.SLOW_QUERY_MS:
+        return
+
+    from .budget import current_budget
+
+    budget = current_budget()
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "shape": shape,
+        "endpoint": budget.endpoint if budget is not None else None,
+        "ms": round(ms, 1),
+        "rows": rows,
+        "params": dict(params or {}),
+        "error": type(error).__name__ if error is not None else None,
+        "plan": None,
+    }
+    explain = None
+    if random.random() < settings.SLOW_QUERY_EXPLAIN_RATE and _READ_ONLY.match(sql) is not None:
+        timeout_ms = settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS
+        if budget is not None:
+            timeout_ms = min(timeout_ms, budget.timeout_ms)
+        explain = (sql, error is None, timeout_ms)
+    _start_worker()
+    try:
+        _queue.put_nowait((record, explain))
+    except queue.Full:
+        with _lock:
+            _stats["dropped"] += 1
+
+
+# ------------------------------------------------------
+# Thread de fundo: EXPLAIN + escrita
+# ------------------------------------------------------
+def _start_worker():
+    global _worker
+    if _worker is not None:
+        return
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_drain, name="slowlog", daemon=True)
+            _worker.start()
+
+
+def _drain():
+    while True:
+        record, explain = _queue.get()
+        try:
+            if explain is not None:
+                _explain(record, *explain)
+            _append(record)
+        except Exception as e:
+            logger.warning(f"⚠️ Falha ao gravar consulta lenta ({record['shape']}): {e}")
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def _explain(record: dict, sql: str, analyze: bool, timeout_ms: int):
+    """Reexecuta com EXPLAIN [ANALYZE] numa conexão de analytics (transação descartada)"""
+    from .db import get_conn, WORKLOAD_ANALYTICS
+
+    t0 = time.perf_counter()
+    try:
+        with get_conn(WORKLOAD_ANALYTICS) as conn:
+            try:
+                conn.execute(
+                    "SELECT set_config('statement_timeout', %s, true)",
+                    [str(timeout_ms)],
+                )
+                options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+                plan = conn.execute(f"EXPLAIN ({options}) {sql}", record["params"]).fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+
+                scans = {}
+                for node in _walk(plan[0]["Plan"]):
+                    if node.get("Node Type") == "Seq Scan" and node.get("Relation Name"):
+                        # plano estimado (sem ANALYZE): linhas previstas
+                        read = node.get("Actual Rows", node.get("Plan Rows", 0)) * node.get("Actual Loops", 1)
+                        scans[node["Relation Name"]] = scans.get(node["Relation Name"], 0) + int(read)
+                sizes = dict(conn.execute(
+                    "SELECT relname, reltuples::bigint FROM pg_class WHERE relname = ANY(%s)",
+                    [list(scans)],
+                ).fetchall()) if scans else {}
+            finally:
+                conn.rollback()
+    except Exception as e:
+        with _lock:
+            _stats["explain_errors"] += 1
+        record["plan_error"] = str(e)
+        return
+
+    record["plan"] = plan
+    record["plan_analyzed"] = analyze
+    record["plan_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    record["seq_scans"] = [
+        {"table": table, "table_rows": sizes.get(table), "rows_read": rows}
+        for table, rows in scans.items()
+        if sizes.get(table, 0) >= settings.SLOW_QUERY_LARGE_TABLE_ROWS
+    ]
+    with _lock:
+        _stats["explained"] += 1
+
+
+def _segments() -> tuple[str, str]:
+    path = settings.SLOW_QUERY_LOG_PATH
+    return path, path + ".1"
+
+
+def _append(record: dict):
+    global _lines
+    current, previous = _segments()
+    line = json.dumps(record, default=str, ensure_ascii=False)
+    with _lock:
+        os.makedirs(os.path.dirname(os.path.abspath(current)), exist_ok=True)
+        if _lines is None:
+            try:
+                with open(current, encoding="utf-8") as f:
+                    _lines = sum(1 for _ in f)
+            except FileNotFoundError:
+                _lines = 0
+        if _lines >= max(1, settings.SLOW_QUERY_LOG_MAX_RECORDS // 2):
+            os.replace(current, previous)
+            _lines = 0
+        with open(current, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        _lines += 1
+        _stats["captured"] += 1
+
+
+# ------------------------------------------------------
+# Leitura / relatório
+# ------------------------------------------------------
+def records() -> list[dict]:
+    """Registros do buffer, do mais antigo ao mais novo"""
+    out = []
+    with _lock:
+        for path in reversed(_segments()):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            out.append(json.loads(line))
+                        except ValueError:
+                            continue    # linha truncada (processo morto no meio da escrita)
+            except FileNotFoundError:
+                continue
+    return out
+
+
+def report(shape: Optional[str] = None, plans: bool = True) -> dict[str, Any]:
+    """Agrega por shape: ocorrências, tempo total, pior plano e seq scans em tabelas grandes"""
+    groups: dict[str, dict] = {}
+    for r in records():
+        if shape and r["shape"] != shape:
+            continue
+        g = groups.setdefault(r["shape"], {
+            "shape": r["shape"],
+            "count": 0,
+            "errors": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "endpoints": set(),
+            "last_seen": None,
+            "seq_scans": {},
+            "worst": None,
+        })
+        g["count"] += 1
+        g["errors"] += 1 if r.get("error") else 0
+        g["total_ms"] += r["ms"]
+        g["max_ms"] = max(g["max_ms"], r["ms"])
+        g["last_seen"] = r["ts"]
+        if r.get("endpoint"):
+            g["endpoints"].add(r["endpoint"])
+        for scan in r.get("seq_scans") or []:
+            g["seq_scans"][scan["table"]] = g["seq_scans"].get(scan["table"], 0) + 1
+        if r.get("plan") and (g["worst"] is None or r["ms"] > g["worst"]["ms"]):
+            g["worst"] = r
+
+    shapes = []
+    for g in sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True):
+        worst = g.pop("worst")
+        shapes.append({
+            **g,
+            "total_ms": round(g["total_ms"], 1),
+            "avg_ms": round(g["total_ms"] / g["count"], 1),
+            "endpoints": sorted(g["endpoints"]),
+            "worst_plan": {
+                "ts": worst["ts"],
+                "ms": worst["ms"],
+                "plan_ms": worst.get("plan_ms"),
+                "plan_analyzed": worst.get("plan_analyzed", True),
+                "params": worst["params"],
+                **({"plan": worst["plan"]} if plans else {}),
+            } if worst else None,
+        })
+
+    with _lock:
+        stats = dict(_stats, pending=_queue.qsize())
+    return {
+        "threshold_ms": settings.SLOW_QUERY_MS,
+        "explain_rate": settings.SLOW_QUERY_EXPLAIN_RATE,
+        **stats,
+        "shapes": shapes,
+    }
@@ -0,0 +1,12 @@
+# backend/tests/conftest.py
+"""
+Testes das funções puras (sem banco): `cd backend && python -m pytest -q`.
+"""
+
+import os
+import sys
+
+# app.settings exige a chave mesmo quando nada chama o Groq
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
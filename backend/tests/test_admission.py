@@ -0,0 +1,128 @@
+# backend/tests/test_admission.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.admission import Tier
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_free_slot_admits_immediately():
+    async def scenario():
+        tier = Tier("t", concurrency=2, queue=1, max_wait_ms=1000)
+        await tier.acquire()
+        await tier.acquire()
+        assert tier.active == 2 and not tier.waiters
+        tier.release(10)
+        tier.release(10)
+        assert tier.active == 0
+        assert tier.stats["admitted"] == 2
+
+    run(scenario())
+
+
+def test_release_hands_slot_to_first_waiter():
+    async def scenario():
+        tier = Tier("t", concurrency=1, queue=2, max_wait_ms=1000)
+        await tier.acquire()
+        order = []
+
+        async def wait(name):
+            await tier.acquire()
+            order.append(name)
+
+        first = asyncio.create_task(wait("first"))
+        second = asyncio.create_task(wait("second"))
+        await asyncio.sleep(0)
+        assert len(tier.waiters) == 2
+
+        tier.release(None)
+        await first
+        assert order == ["first"] and tier.active == 1      # a vaga troca de dono
+        tier.release(None)
+        await second
+        tier.release(None)
+        assert order == ["first", "second"] and tier.active == 0
+        assert tier.stats["queued"] == 2
+
+    run(scenario())
+
+
+def test_full_queue_sheds_with_429():
+    async def scenario():
+        tier = Tier("t", concurrency=1, queue=1, max_wait_ms=1000)
+        await tier.acquire()
+        waiting = asyncio.create_task(tier.acquire())
+        await asyncio.sleep(0)
+
+        with pytest.raises(HTTPException) as exc:
+            await tier.acquire()
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == "1"
+        assert tier.stats["shed_full"] == 1
+
+        tier.release(None)
+        await waiting
+
+    run(scenario())
+
+
+def test_estimated_wait_above_deadline_sheds_without_queueing():
+    async def scenario():
+        tier = Tier("t", concurrency=1, queue=10, max_wait_ms=100)
+        tier.service_ms = 2500
+        await tier.acquire()
+
+        with pytest.raises(HTTPException) as exc:
+            await tier.acquire()
+        assert exc.value.status_code == 503
+        assert exc.value.headers["Retry-After"] == "3"
+        assert not tier.waiters and tier.stats["shed_deadline"] == 1
+
+    run(scenario())
+
+
+def test_deadline_expires_in_queue():
+    async def scenario():
+        tier = Tier("t", concurrency=1, queue=10, max_wait_ms=50)
+        tier.service_ms = 1
+        await tier.acquire()
+
+        with pytest.raises(HTTPException) as exc:
+            await tier.acquire()
+        assert exc.value.status_code == 503
+        assert not tier.waiters
+        # quem esperou e desistiu não leva a vaga do próximo
+        tier.release(None)
+        assert tier.active == 0
+
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        tier = Tier("t", concurrency=1, queue=10, max_wait_ms=1000)
+        await tier.acquire()
+        task = asyncio.create_task(tier.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not tier.waiters
+        tier.release(None)
+        assert tier.active == 0
+
+    run(scenario())
+
+
+def test_service_time_moving_average():
+    tier = Tier("t", concurrency=2, queue=1, max_wait_ms=1000)
+    tier.active = 1
+    tier.release(150)
+    assert tier.service_ms == pytest.approx(0.8 * 50 + 0.2 * 150)
+    assert tier.estimated_wait_ms() == pytest.approx(tier.service_ms / 2)
+
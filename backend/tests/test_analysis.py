@@ -0,0 +1,107 @@
+# backend/tests/test_analysis.py
+import numpy as np
+
+from app.services import analysis
+
+
+def _weekdays(days: int) -> np.ndarray:
+    return np.arange(days) % 7
+
+
+def test_cohort_matrix_counts_customers_by_months_since_first_purchase():
+    # bitmaps de meses por (cliente, ano): bit 0 = janeiro
+    customers = np.array([10, 20, 10])
+    years = np.array([2026, 2026, 2027])
+    months = np.array([0b101, 0b110, 0b1])     # 10: jan, mar e jan/27; 20: fev e mar
+
+    out = analysis.cohort_matrix(customers, years, months)
+
+    jan = 2026 * 12
+    assert out["cohorts"].tolist() == [jan, jan + 1]
+    assert out["matrix"].tolist() == [
+        [1, 0, 1] + [0] * 9 + [1],              # coorte de janeiro: meses 0, 2 e 12
+        [1, 1] + [0] * 11,                       # coorte de fevereiro: meses 0 e 1
+    ]
+    assert out["last_month"] == jan + 12
+
+
+def test_cohort_matrix_empty():
+    empty = np.zeros(0, np.int64)
+    out = analysis.cohort_matrix(empty, empty, empty)
+    assert out["matrix"].shape == (0, 0)
+    assert out["last_month"] is None
+
+
+def test_affinity_rank_support_confidence_lift():
+    # ids repetidos (semana/loja/canal) somam antes do cálculo
+    out = analysis.affinity_rank(
+        orders=10,
+        product_ids=np.array([1, 2, 1, 3]),
+        product_counts=np.array([3, 4, 2, 5]),
+        partner_ids=np.array([2, 3, 2]),
+        partner_counts=np.array([1, 2, 1]),
+        product_id=1,
+        min_orders=1,
+        sort="lift",
+        limit=10,
+    )
+    assert out["orders"] == 10
+    assert out["product_orders"] == 5
+    assert [p["product_id"] for p in out["partners"]] == [2, 3]
+    first, second = out["partners"]
+    assert (first["orders_together"], first["support"], first["confidence"]) == (2, 0.2, 0.4)
+    assert np.isclose(first["lift"], 1.0)
+    assert np.isclose(second["lift"], 0.8)
+
+
+def test_affinity_rank_min_orders_and_unknown_product():
+    args = dict(
+        orders=10,
+        product_ids=np.array([1, 2]),
+        product_counts=np.array([5, 4]),
+        partner_ids=np.array([2]),
+        partner_counts=np.array([2]),
+        sort="support",
+        limit=10,
+    )
+    assert analysis.affinity_rank(product_id=1, min_orders=3, **args)["partners"] == []
+    missing = analysis.affinity_rank(product_id=99, min_orders=1, **args)
+    assert missing["product_orders"] == 0 and missing["partners"] == []
+
+
+def test_smoothing_recovers_weekly_pattern():
+    pattern = np.array([0.6, 0.8, 1.0, 1.0, 1.2, 1.5, 0.9])
+    pattern /= pattern.mean()
+    base = np.array([100.0, 40.0])
+    days = 5 * 7
+    y = base[None] * pattern[_weekdays(days)][:, None]            # [D, N]
+
+    best = analysis.smoothing_best(analysis.smoothing_fit(y, _weekdays(days)))
+    forecast = analysis.smoothing_forecast(best, _weekdays(7))
+
+    assert forecast.shape == (7, 2)
+    assert np.allclose(forecast, base[None] * pattern[:, None])
+    assert np.allclose(best["rmse"], 0)
+
+
+def test_smoothing_update_matches_full_fit():
+    rng = np.random.default_rng(7)
+    days = 6 * 7
+    y = rng.uniform(50, 150, size=(days, 3))
+    w = _weekdays(days)
+
+    full = analysis.smoothing_fit(y, w)
+    step = analysis.smoothing_update(analysis.smoothing_fit(y[:35], w[:35]), y[35:], w[35:])
+
+    assert step["days"] == full["days"]
+    for key in ("level", "trend", "season", "sse"):
+        assert np.allclose(step[key], full[key])
+
+
+def test_smoothing_forecast_never_negative():
+    best = {
+        "level": np.array([10.0]),
+        "trend": np.array([-50.0]),
+        "season": np.ones((1, 7)),
+    }
+    assert (analysis.smoothing_forecast(best, _weekdays(14)) >= 0).all()
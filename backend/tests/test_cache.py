@@ -0,0 +1,97 @@
+# backend/tests/test_cache.py
+from datetime import date
+
+import pytest
+from fastapi import Query
+
+from app import cache
+from app.cache import Scope
+from app.settings import settings
+
+
+def test_scope_touches():
+    scope = Scope(stores=frozenset({1, 2}), channels=None, start=date(2026, 3, 1), end=date(2026, 3, 7))
+    assert scope.touches(1, 99, date(2026, 3, 7))            # end inclusivo
+    assert not scope.touches(3, 1, date(2026, 3, 3))
+    assert not scope.touches(1, 1, date(2026, 2, 28))
+    assert not scope.touches(1, 1, date(2026, 3, 8))
+    assert Scope().touches(5, 5, date(2000, 1, 1))
+
+
+def test_default_scope_from_filters():
+    scope = cache.default_scope({"start": "2026-03-01", "end": "2026-03-07", "store_id": (1, 2), "channel_id": 3})
+    assert scope == Scope(frozenset({1, 2}), frozenset({3}), date(2026, 3, 1), date(2026, 3, 7))
+
+
+def test_default_scope_is_conservative():
+    # channel_name vale por todos os canais; período incompleto vale por todo o histórico
+    scope = cache.default_scope({"start": "2026-03-01", "end": None, "channel_id": (3,), "channel_name": "iFood"})
+    assert scope == Scope(None, None, None, None)
+    assert cache.default_scope({"store_id": ()}).stores is None
+
+
+def test_previous_period_scopes():
+    params = {"start": "2026-03-08", "end": "2026-03-15"}
+    assert cache.previous_period_scope(params).start == date(2026, 3, 1)
+    assert cache.default_scope({**params, "previous": True}).start == date(2026, 3, 1)
+    assert cache.default_scope(params).start == date(2026, 3, 8)
+
+
+def test_all_days_scope_keeps_stores_and_channels():
+    scope = cache.all_days_scope({"start": "2026-03-01", "end": "2026-03-07", "store_id": (1,)})
+    assert scope == Scope(frozenset({1}), None, None, None)
+    assert scope.touches(1, 7, date(2026, 9, 1))             # venda depois do período
+
+
+@pytest.fixture
+def cache_on(monkeypatch):
+    monkeypatch.setattr(settings, "CACHE_ENABLED", True)
+    cache.invalidate()
+    yield
+    cache.invalidate()
+
+
+def test_cached_resolves_query_defaults(cache_on):
+    calls = []
+
+    @cache.cached()
+    def test_endpoint_defaults(start: str = Query(None), store_id: list[int] = Query(None)):
+        calls.append((start, store_id))
+        return len(calls)
+
+    # Query(None) vira None e listas são normalizadas: mesma entrada
+    assert test_endpoint_defaults() == 1
+    assert test_endpoint_defaults(start=None) == 1
+    assert test_endpoint_defaults(store_id=[2, 1]) == 2
+    assert test_endpoint_defaults(store_id=[1, 2]) == 2
+    assert calls == [(None, None), (None, [2, 1])]
+
+
+def test_invalidate_keys_only_drops_touched_scopes(cache_on):
+    @cache.cached()
+    def test_endpoint_scoped(start: str = None, end: str = None, store_id: int = None):
+        return (start, end, store_id)
+
+    test_endpoint_scoped("2026-03-01", "2026-03-07", 1)
+    test_endpoint_scoped("2026-03-01", "2026-03-07", 2)
+    test_endpoint_scoped("2026-04-01", "2026-04-07", 1)
+
+    assert cache.invalidate_keys([(1, 5, date(2026, 3, 3))]) == 1
+    assert cache.invalidate_keys([(3, 5, date(2026, 3, 3))]) == 0
+    assert cache.stats()["by_endpoint"]["test_endpoint_scoped"] == 2
+
+
+def test_on_view_refresh_drops_view_backed_endpoints(cache_on):
+    @cache.cached(views=("mv_test",))
+    def test_endpoint_view():
+        return 1
+
+    @cache.cached()
+    def test_endpoint_other():
+        return 2
+
+    test_endpoint_view()
+    test_endpoint_other()
+    assert cache.on_view_refresh("mv_test") == 1
+    assert cache.on_view_refresh("mv_unknown") == 0
+    assert cache.stats()["by_endpoint"] == {"test_endpoint_other": 1}
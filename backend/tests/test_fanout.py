@@ -0,0 +1,84 @@
+# backend/tests/test_fanout.py
+from datetime import date
+
+import pytest
+
+from app.services import fanout
+from app.services.fanout import FanoutShape, Merge
+from app.settings import settings
+
+
+@pytest.fixture
+def extent(monkeypatch):
+    """Extent fixo no lugar da consulta MIN/MAX em sales"""
+    def set_extent(value):
+        monkeypatch.setattr(fanout, "_data_extent", lambda: value)
+    return set_extent
+
+
+def test_combine_merges_partials_by_key():
+    merge = Merge(keys=1, aggs=("sum", "count", "min", "max"))
+    partials = [
+        [("a", 1.0, 2, 5, 5)],
+        [("a", None, 1, 3, 9), ("b", 4.0, 1, 1, 1)],
+    ]
+    rows = sorted(fanout.combine(merge, partials))
+    assert rows == [("a", 1.0, 3, 3, 9), ("b", 4.0, 1, 1, 1)]
+
+
+def test_combine_applies_finalize_after_merging():
+    # média = soma / contagem só depois de somar as fatias
+    merge = Merge(keys=1, aggs=("sum", "count"), finalize=lambda r: r + (r[1] / r[2],))
+    rows = fanout.combine(merge, [[("x", 10.0, 2)], [("x", 20.0, 2)]])
+    assert rows == [("x", 30.0, 4, 7.5)]
+
+
+def test_finish_sorts_and_keeps_top_k():
+    shape = FanoutShape("t", Merge(keys=1, aggs=("sum",), sort_key=lambda r: r[1]))
+    partials = [[("a", 1), ("b", 5)], [("a", 3), ("c", 2)]]
+    assert fanout.finish(shape, partials) == [("b", 5), ("a", 4), ("c", 2)]
+    assert fanout.finish(shape, partials, limit=2) == [("b", 5), ("a", 4)]
+
+
+def test_month_chunks_keeps_open_ends_open(extent):
+    extent((date(2026, 1, 10), date(2026, 3, 20)))
+    assert fanout.month_chunks(None, None) == [
+        (None, date(2026, 2, 1)),
+        (date(2026, 2, 1), date(2026, 3, 1)),
+        (date(2026, 3, 1), None),
+    ]
+
+
+def test_month_chunks_bounded_period(extent):
+    extent((date(2025, 1, 1), date(2026, 12, 31)))
+    chunks = fanout.month_chunks(date(2025, 1, 15), date(2025, 4, 10))
+    assert chunks == [
+        (date(2025, 1, 15), date(2025, 2, 1)),
+        (date(2025, 2, 1), date(2025, 3, 1)),
+        (date(2025, 3, 1), date(2025, 4, 1)),
+        (date(2025, 4, 1), date(2025, 4, 10)),
+    ]
+    # fatias contíguas, sem buraco nem sobreposição
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+
+
+def test_month_chunks_short_or_empty_period_is_one_chunk(extent):
+    extent((date(2025, 1, 1), date(2026, 12, 31)))
+    start, end = date(2025, 2, 5), date(2025, 2, 20)
+    assert fanout.month_chunks(start, end) == [(start, end)]
+
+    extent(None)
+    assert fanout.month_chunks(None, end) == [(None, end)]
+
+
+def test_plan_only_when_worth_splitting(extent, monkeypatch):
+    extent((date(2025, 1, 1), date(2026, 12, 31)))
+    long = {"start": date(2025, 1, 1), "end": date(2025, 7, 1)}
+    short = {"start": date(2025, 1, 1), "end": date(2025, 1, 20)}
+
+    monkeypatch.setattr(settings, "FANOUT_ENABLED", True)
+    assert len(fanout.plan(long)) == 6
+    assert fanout.plan(short) is None
+
+    monkeypatch.setattr(settings, "FANOUT_ENABLED", False)
+    assert fanout.plan(long) is None
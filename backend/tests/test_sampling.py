@@ -0,0 +1,58 @@
+# backend/tests/test_sampling.py
+import math
+
+from app.services import sampling
+
+
+def test_fields_interval_around_estimate():
+    out = sampling.fields("revenue", 1000, 400)
+    half = sampling._Z * 20
+    assert out == {
+        "revenue": 1000,
+        "revenue_low": round(1000 - half, 2),
+        "revenue_high": round(1000 + half, 2),
+    }
+
+
+def test_fields_floor_and_integer():
+    out = sampling.fields("orders", 3.4, 100, integer=True)
+    assert out["orders"] == 3
+    assert out["orders_low"] == 0                           # contagem não fica negativa
+    assert out["orders_high"] == math.ceil(3.4 + sampling._Z * 10)
+
+    unbounded = sampling.fields("delta", 3.4, 100, floor=None)
+    assert unbounded["delta_low"] < 0
+
+
+def test_fields_tolerates_null_aggregates():
+    # SUM sobre zero linhas da amostra volta NULL
+    assert sampling.fields("revenue", None, None) == {"revenue": 0.0, "revenue_low": 0.0, "revenue_high": 0.0}
+
+
+def test_ratio_fields_delta_method():
+    # totais exatos (variâncias zero): intervalo degenera no valor
+    assert sampling.ratio_fields("ticket", 500, 10, 0, 0, 0) == {
+        "ticket": 50.0, "ticket_low": 50.0, "ticket_high": 50.0,
+    }
+
+    num, den, var_num, var_den, cov = 500.0, 10.0, 400.0, 1.0, 10.0
+    r = num / den
+    variance = (var_num - 2 * r * cov + r * r * var_den) / (den * den)
+    out = sampling.ratio_fields("ticket", num, den, var_num, var_den, cov)
+    assert out["ticket"] == 50.0
+    assert out["ticket_high"] == round(r + sampling._Z * math.sqrt(variance), 2)
+
+
+def test_ratio_fields_without_denominator():
+    assert sampling.ratio_fields("ticket", 10, 0, 1, 1, 1) == {
+        "ticket": 0.0, "ticket_low": 0.0, "ticket_high": 0.0,
+    }
+
+
+def test_in_sample_predicate_uses_configured_fraction():
+    sql = sampling.in_sample("s.id")
+    assert sql.startswith("(mod((s.id)::bigint * 2654435761, 4294967296) < ")
+    assert "%" not in sql                    # vai em consultas com placeholders
+    # o mesmo hash em Python seleciona ~APPROX_SAMPLE_FRACTION dos ids
+    picked = sum((i * 2654435761) % sampling._HASH_RANGE < sampling._THRESHOLD for i in range(1, 100_001))
+    assert abs(picked / 100_000 - sampling.settings.APPROX_SAMPLE_FRACTION) < 0.01
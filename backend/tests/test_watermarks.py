@@ -0,0 +1,83 @@
+# backend/tests/test_watermarks.py
+from datetime import date
+
+import pytest
+
+from app.services import watermarks
+
+
+def test_delta_params_none_without_changes():
+    assert watermarks.delta_params([]) is None
+
+
+def test_delta_params_day_grain():
+    buckets = [
+        (2, 1, date(2026, 3, 5)),
+        (1, 1, date(2026, 3, 2)),
+        (2, 1, date(2026, 3, 5)),      # repetido
+    ]
+    assert watermarks.delta_params(buckets) == {
+        "bucket_from": date(2026, 3, 2),
+        "bucket_to": date(2026, 3, 6),
+        "bucket_store_ids": [1, 2],
+        "bucket_channel_ids": [1, 1],
+        "bucket_keys": [date(2026, 3, 2), date(2026, 3, 5)],
+    }
+
+
+def test_delta_params_month_grain_crosses_year():
+    buckets = [
+        (1, 2, date(2026, 1, 31)),
+        (1, 2, date(2026, 1, 3)),
+        (3, 1, date(2026, 12, 9)),
+    ]
+    assert watermarks.delta_params(buckets, grain="month") == {
+        "bucket_from": date(2026, 1, 1),
+        "bucket_to": date(2027, 1, 1),
+        "bucket_store_ids": [1, 3],
+        "bucket_channel_ids": [2, 1],
+        "bucket_keys": [date(2026, 1, 1), date(2026, 12, 1)],
+    }
+
+
+@pytest.fixture
+def names(monkeypatch):
+    """Q_NAMES respondido em memória: (loja, canal) → nomes"""
+    calls = []
+
+    def run(conn, name, params, **kwargs):
+        assert name == watermarks.Q_NAMES
+        calls.append(params)
+        return [(1, 1, "Loja A", "iFood"), (1, 2, "Loja A", "Balcão")]
+
+    monkeypatch.setattr(watermarks.queries, "run", run)
+    return calls
+
+
+def test_tombstones_are_changed_buckets_missing_from_response(names):
+    d1, d2 = date(2026, 3, 1), date(2026, 3, 2)
+    buckets = [(1, 1, d1), (1, 1, d2), (1, 2, d2), (9, 9, d1)]   # 9/9: loja/canal sem nome
+    present = {(d1, "Loja A", "iFood")}
+
+    assert watermarks.tombstones(None, buckets, present) == [
+        (d2, "Loja A", "Balcão"),
+        (d2, "Loja A", "iFood"),
+    ]
+    assert names == [{"store_ids": [1, 1, 9], "channel_ids": [1, 2, 9]}]
+
+
+def test_tombstones_month_and_store_channel_grain(names):
+    buckets = [(1, 1, date(2026, 3, 1)), (1, 1, date(2026, 3, 20)), (1, 2, date(2026, 4, 2))]
+
+    assert watermarks.tombstones(None, buckets, set(), grain="month") == [
+        (date(2026, 3, 1), "Loja A", "iFood"),
+        (date(2026, 4, 1), "Loja A", "Balcão"),
+    ]
+    assert watermarks.tombstones(None, buckets, {(None, "Loja A", "iFood")}, grain="store_channel") == [
+        (None, "Loja A", "Balcão"),
+    ]
+
+
+def test_tombstones_skip_query_without_changes(names):
+    assert watermarks.tombstones(None, [], set()) == []
+    assert names == []